@@ -1,8 +1,11 @@
+import io
 import os
-import json
+import sys
 import csv
-import io  # Needed for reading file stream directly
-import random  # Added for shuffling choices
+import json
+import sqlite3
+import time
+import hashlib
 from flask import (
     Flask,
     render_template,
@@ -12,213 +15,260 @@ from flask import (
     flash,
     abort,
     jsonify,
+    make_response,
+    session,
+    stream_with_context,
 )  # Added jsonify
+from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename  # For secure file handling
 import database
+import jobs
+import importers
+import metrics
+import writer
+import scheduler
+import cache
 
 # --- Configuration ---
-# Define the path for the progress file within the persistent volume
-DATA_DIR = "/data"
-PROGRESS_FILE_PATH = os.path.join(DATA_DIR, "progress.json")
 # UPLOAD_FOLDER = '/tmp' # Not strictly needed if processing in memory
-ALLOWED_EXTENSIONS = {"csv"}
+# Every format with a registered importer (see importers.IMPORTERS)
+ALLOWED_EXTENSIONS = set(importers.IMPORTERS)
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.urandom(24)  # Needed for flash messages
 # app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER # Not saving files persistently here
 
-# --- Database Initialization ---
-# Ensure the database is initialized when the application starts
-with app.app_context():
-    print("Initializing Database from app.py...")
-    database.init_db()
-    # Ensure the /data directory exists for progress file
-    os.makedirs(DATA_DIR, exist_ok=True)
-    # Ensure the progress file exists, create if not
-    if not os.path.exists(PROGRESS_FILE_PATH):
-        try:
-            with open(PROGRESS_FILE_PATH, "w") as f:
-                json.dump({}, f)
-            print(f"Created progress file at {PROGRESS_FILE_PATH}")
-        except IOError as e:
-            print(f"Error creating progress file {PROGRESS_FILE_PATH}: {e}")
+# Reuse one pooled database connection per request. Importing the app does no
+# database work: each process brings the schema up to date before its first
+# request (a single PRAGMA read once the gunicorn master has migrated it).
+# The migrations also move a legacy progress.json file into the 'progress' table.
+database.init_app(app)
+# Time every request and its SQL work for /metrics
+metrics.init_app(app)
 
 
 # --- Helper Functions ---
 def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    return importers.file_extension(filename) in ALLOWED_EXTENSIONS
 
 
-def load_progress():
-    """Loads the learning progress from the JSON file."""
-    try:
-        with open(PROGRESS_FILE_PATH, "r") as f:
-            content = f.read()
-            if not content:
-                return {}
-            return json.loads(content)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(
-            f"Error loading progress file ({PROGRESS_FILE_PATH}): {e}. Returning empty progress."
-        )
-        return {}
-    except IOError as e:
-        print(
-            f"Error reading progress file ({PROGRESS_FILE_PATH}): {e}. Returning empty progress."
-        )
-        return {}
+def card_choices(card):
+    """Returns the non-empty answer choices of a card, in their stored order."""
+    choices = [
+        card["choice1"],
+        card["choice2"],
+        card["choice3"],
+        card["choice4"],
+    ]
+    if card["choice5"]:
+        choices.append(card["choice5"])
 
+    # Filter out any potentially empty choices just in case
+    return [choice for choice in choices if choice and choice.strip()]
+
+
+def card_to_json(card, card_index):
+    """
+    Serializes a card row for the JSON API; card_index is the index its page is
+    addressed by (its deck position in learn and review mode, its exam index in exams).
+    """
+    return {
+        "id": card["id"],
+        "index": card_index,
+        "question": card["question"],
+        "correct_answer": card["correct_answer"],
+        "choices": card_choices(card),  # Shuffled by the client
+        "notes": card["notes"] or "",
+        "mark_for_review": bool(card["mark_for_review"]),
+    }
+
+
+# --- HTTP Conditional Caching ---
+def _template_etag_salt():
+    """Changes whenever a template changes, so cached pages are not reused across releases."""
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    return max(
+        os.path.getmtime(os.path.join(template_dir, name))
+        for name in os.listdir(template_dir)
+    )
+
+
+ETAG_SALT = _template_etag_salt()
+
+
+# --- Card Fragments ---
+# The rendered body of a card (_card.html) is cached in each worker process by
+# card ID, card version and mode. Every change to a card bumps its version, so
+# edited cards miss the cache and their old fragments age out of it.
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FLASHCARD_FRAGMENT_CACHE_SIZE", "4096"))
+FRAGMENT_CACHE_BYTES = int(os.environ.get("FLASHCARD_FRAGMENT_CACHE_MB", "32")) * 1024 * 1024
+card_fragments = cache.LRUCache("card_fragments", FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_BYTES)
+
+
+def adjacent_indexes(index, total):
+    """Returns the (previous, next) card indexes around index in a deck of total cards, None past either end."""
+    return (index - 1 if index > 0 else None), (index + 1 if index + 1 < total else None)
+
+
+def card_fragment(card, mode):
+    """
+    Returns the rendered body of a card as the Markup before and after its
+    choices, from the fragment cache unless the card changed since.
+    """
+    key = (card["id"], card["version"], mode)
+    fragment = card_fragments.get(key)
+    if fragment is None:
+        # The choices go between the two cached parts (learn.html renders them)
+        before = render_template("_card.html", card=card, mode=mode, part="before")
+        after = render_template("_card.html", card=card, mode=mode, part="after")
+        fragment = (Markup(before), Markup(after))
+        card_fragments.put(key, fragment, sys.getsizeof(before) + sys.getsizeof(after))
+    return fragment
 
-def _save_progress_data(progress_dict):
-    """Saves the entire progress dictionary to the JSON file."""
-    try:
-        with open(PROGRESS_FILE_PATH, "w") as f:
-            json.dump(progress_dict, f, indent=4)
-        return True
-    except IOError as e:
-        print(f"Error saving progress file ({PROGRESS_FILE_PATH}): {e}")
-        return False
 
+def page_etag(*version_parts):
+    """
+    Builds a strong ETag from the version counters a response depends on.
+    Returns None (response not cacheable) if a part is unknown or flash
+    messages are waiting to be shown, since those are rendered into pages.
+    """
+    if any(part is None for part in version_parts) or "_flashes" in session:
+        return None
+    key = ":".join(str(part) for part in (ETAG_SALT,) + version_parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
-def save_progress(dataset_id, card_index):
-    """Loads, updates, and saves the learning progress for a specific dataset."""
-    progress = load_progress()
-    progress[str(dataset_id)] = card_index  # Use string key for JSON compatibility
-    _save_progress_data(progress)  # Use the helper to save the whole dict
+
+def not_modified(etag):
+    """Returns a 304 response if the client already holds the version tagged etag, else None."""
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """Attaches etag to a response and asks browsers to revalidate it on every use."""
+    response = make_response(response)
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# --- Write Backpressure ---
+# Seconds a client is asked to wait before retrying a rejected write
+WRITE_RETRY_AFTER_SECONDS = 1
+
+
+@app.errorhandler(writer.WriterBusy)
+def write_queue_full(error):
+    """Answers 503 when the database writer is too far behind to accept another write."""
+    print(f"Rejected a write: {error}")
+    response = jsonify(
+        {"status": "error", "message": "Too many changes waiting to be saved, try again shortly"}
+    )
+    response.status_code = 503
+    response.headers["Retry-After"] = str(WRITE_RETRY_AFTER_SECONDS)
+    return response
 
 
 # --- Routes ---
 @app.route("/")
 def index():
     """Displays the dataset selection page and upload form."""
+    # Import job started by the last upload, polled by the page for progress
+    import_job_id = request.args.get("job")
+
+    # The page only changes when a dataset is added, changed or removed
+    etag = page_etag("index", database.get_catalog_version(), import_job_id or "")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     datasets = database.get_datasets()
     # Pass the template name explicitly
-    return render_template("index.html", datasets=datasets)
+    return with_etag(
+        render_template(
+            "index.html",
+            datasets=datasets,
+            import_job_id=import_job_id,
+            exam_default_cards=EXAM_DEFAULT_CARDS,
+            exam_max_cards=EXAM_MAX_CARDS,
+            upload_accept=",".join(f".{extension}" for extension in sorted(ALLOWED_EXTENSIONS)),
+        ),
+        etag,
+    )
 
 
 @app.route("/upload", methods=["POST"])
 def upload_file():
-    """Handles CSV file upload, parsing, and database insertion."""
+    """Validates a CSV, JSONL or Anki upload and queues it for a background import."""
     if "csv_file" not in request.files:
         flash("No file part in the request.", "danger")
         return redirect(url_for("index"))
 
     file = request.files["csv_file"]
     dataset_name = request.form.get("dataset_name", "").strip()
+    # "create" a new dataset, or "update" the existing one while keeping its notes,
+    # review flags and progress
+    import_mode = request.form.get("import_mode", "create")
 
     # --- Input Validation ---
     if not dataset_name:
         flash("Dataset name cannot be empty.", "danger")
         return redirect(url_for("index"))
 
-    if database.get_dataset_id_by_name(dataset_name) is not None:
+    if import_mode not in ("create", "update"):
+        flash("Invalid import mode.", "danger")
+        return redirect(url_for("index"))
+
+    dataset_exists = database.get_dataset_id_by_name(dataset_name) is not None
+    if import_mode == "create" and dataset_exists:
         flash(
-            f"Dataset name '{dataset_name}' already exists. Please choose a unique name.",
+            f"Dataset name '{dataset_name}' already exists. Please choose a unique name, or update the existing dataset.",
             "danger",
         )
         return redirect(url_for("index"))
+    if import_mode == "update" and not dataset_exists:
+        flash(f"Dataset '{dataset_name}' does not exist, so it cannot be updated.", "danger")
+        return redirect(url_for("index"))
 
     if file.filename == "":
         flash("No file selected for uploading.", "danger")
         return redirect(url_for("index"))
 
     if not file or not allowed_file(file.filename):
-        flash("Invalid file type. Only .csv files are allowed.", "danger")
+        allowed = ", ".join(f".{extension}" for extension in sorted(ALLOWED_EXTENSIONS))
+        flash(f"Invalid file type. Only {allowed} files are allowed.", "danger")
         return redirect(url_for("index"))
+    parse_rows = importers.get_importer(file.filename)
 
-    # --- CSV Parsing and Database Insertion ---
-    try:
-        # Read the file stream directly without saving temporarily
-        stream = io.StringIO(file.stream.read().decode("UTF-8"), newline=None)
-        csv_reader = csv.reader(stream)
-
-        # Skip the header row
-        next(csv_reader, None)
-
-        cards_to_add = []
-        line_num = 1 # Start line count from 1 (after header)
-        for row in csv_reader:
-            line_num += 1
-            # Expecting 6 or 7 columns: question, correct_answer, choice1-4, [choice5]
-            if not (6 <= len(row) <= 7):
-                print(len(row))
-                raise ValueError(
-                    f"Incorrect number of columns ({len(row)}) on line {line_num}. Expected 6 or 7."
-                )
-
-            # Extract data, handle optional 7th column
-            question = row[0].strip()
-            correct_answer = row[1].strip()
-            choice1 = row[2].strip()
-            choice2 = row[3].strip()
-            choice3 = row[4].strip()
-            choice4 = row[5].strip()
-            choice5 = row[6].strip() if len(row) == 7 else None
-
-            # Basic validation (ensure required fields are not empty)
-            if not all([question, correct_answer, choice1, choice2, choice3, choice4]):
-                raise ValueError(
-                    f"Missing required data (question, answer, or choices 1-4) on line {line_num}."
-                )
-
-            cards_to_add.append(
-                {
-                    "question": question,
-                    "correct_answer": correct_answer,
-                    "choice1": choice1,
-                    "choice2": choice2,
-                    "choice3": choice3,
-                    "choice4": choice4,
-                    "choice5": choice5,
-                    # Notes will be added with default empty string by database.add_card
-                }
-            )
-
-        if not cards_to_add:
-            raise ValueError("CSV file is empty or contains no valid data rows after the header.")
-
-        # --- Add to Database ---
-        dataset_id = database.add_dataset(dataset_name)
-        if dataset_id is None:
-            # Should have been caught earlier, but double-check
-            flash(
-                f"Failed to create dataset '{dataset_name}'. It might already exist.",
-                "danger",
-            )
-            return redirect(url_for("index"))
+    # --- Background Import ---
+    # The upload is spooled to disk and imported by a worker thread; the
+    # browser polls /jobs/<id> for progress instead of waiting on this request
+    job = jobs.start_import(dataset_name, file.stream, parse_rows, import_mode)
 
-        added_count = 0
-        # Consider using a transaction in database.py for bulk inserts
-        for card_data in cards_to_add:
-            # database.add_card now handles the 'notes' field internally with a default
-            if database.add_card(dataset_id=dataset_id, **card_data):
-                added_count += 1
-            else:
-                # Rollback or cleanup might be needed here in a more complex scenario
-                flash(f"Error adding card: {card_data['question'][:30]}...", "danger")
-                # Optionally delete the partially added dataset? For now, just report error.
-                # Consider deleting the dataset if card adding fails mid-way
-                # database.delete_dataset(dataset_id) # Example cleanup
-                return redirect(url_for("index"))
+    if request.accept_mimetypes.best == "application/json":
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers["Location"] = url_for("job_status", job_id=job.id)
+        return response
 
-        flash(
-            f"Successfully uploaded dataset '{dataset_name}' with {added_count} cards.",
-            "success",
-        )
+    if import_mode == "update":
+        flash(f"Update of dataset '{dataset_name}' started.", "info")
+    else:
+        flash(f"Import of dataset '{dataset_name}' started.", "info")
+    return redirect(url_for("index", job=job.id))
 
-    except UnicodeDecodeError:
-        flash("Error decoding file. Please ensure the file is UTF-8 encoded.", "danger")
-    except csv.Error as e:
-        flash(f"Error parsing CSV file: {e}", "danger")
-    except ValueError as e:
-        flash(f"Error processing CSV data: {e}", "danger")
-    except Exception as e:
-        # Catch unexpected errors
-        flash(f"An unexpected error occurred during upload: {e}", "danger")
-        print(f"Unexpected upload error: {e}")  # Log for debugging
 
-    return redirect(url_for("index"))
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Reports the progress of a background import job as JSON."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown import job"}), 404
+    return jsonify(job.to_dict())
 
 
 # --- Learning and Review Routes ---
@@ -227,24 +277,23 @@ def upload_file():
 @app.route("/learn/<int:dataset_id>")
 def learn_dataset(dataset_id):
     """Loads progress and redirects to the specific card index for learning."""
-    progress = load_progress()
     # Get last viewed index for this dataset, default to 0
-    last_index = progress.get(str(dataset_id), 0)
+    last_index = database.get_progress(dataset_id)
 
     # Validate that the dataset actually exists and has cards before redirecting
-    # Use get_cards_by_dataset for the initial check, even if review mode might use a different set later
-    cards = database.get_cards_by_dataset(dataset_id)
-    if not cards:
+    # Only the deck size is needed here, so fetch the first card instead of the whole deck
+    first_card, total_cards = database.get_card_by_position(dataset_id, 0)
+    if first_card is None:
         flash(f"Dataset {dataset_id} not found or is empty.", "warning")
         return redirect(url_for("index"))
 
     # Ensure last_index is within bounds of the *full* dataset, redirect to 0 if not
-    if not (0 <= last_index < len(cards)):
+    if not (0 <= last_index < total_cards):
         print(
             f"Warning: Invalid progress index {last_index} for dataset {dataset_id}. Resetting to 0."
         )
         last_index = 0
-        save_progress(dataset_id, last_index)  # Correct the saved progress
+        database.save_progress(dataset_id, last_index)  # Correct the saved progress
 
     # Redirect to the first card in normal learn mode
     return redirect(
@@ -255,23 +304,30 @@ def learn_dataset(dataset_id):
 @app.route("/review/<int:dataset_id>")
 def review_dataset(dataset_id):
     """Initiates a review session for the marked cards in a dataset."""
-    review_cards = database.get_review_cards_by_dataset(dataset_id)
+    first_card, _, _, _ = database.get_review_card(dataset_id, 0)
 
-    if not review_cards:
+    if first_card is None:
         flash(f"No cards marked for review in dataset {dataset_id}.", "info")
         return redirect(url_for("index"))
 
-    # Redirect to the first card in review mode
-    # card_index is 0 because we start from the beginning of the *review* list
+    # Review pages are addressed by deck position, so start at the first marked card's
+    return redirect(
+        url_for("show_card", dataset_id=dataset_id, card_index=first_card["position"], mode="review")
+    )
+
+
+@app.route("/due/<int:dataset_id>")
+def due_dataset(dataset_id):
+    """Starts a spaced-repetition session over the cards that are due in a dataset."""
     return redirect(
-        url_for("show_card", dataset_id=dataset_id, card_index=0, mode="review")
+        url_for("show_card", dataset_id=dataset_id, card_index=0, mode="due")
     )
 
 
 @app.route("/learn/<int:dataset_id>/<int:card_index>")
 @app.route("/learn/<int:dataset_id>/<int:card_index>/<mode>")  # Add mode to route
 def show_card(dataset_id, card_index, mode="learn"):  # Default to learn mode
-    """Displays a specific flashcard for the given dataset and index, handling learn/review modes."""
+    """Displays a specific flashcard for the given dataset and index, handling learn/review/due modes."""
 
     # --- Fetch Dataset Info ---
     dataset = database.get_dataset_by_id(dataset_id)
@@ -280,27 +336,47 @@ def show_card(dataset_id, card_index, mode="learn"):  # Default to learn mode
         return redirect(url_for("index"))
     dataset_name = dataset["name"] # Get name from the dataset row
 
-    # --- Fetch Cards based on Mode ---
+    # --- Fetch the Card based on Mode ---
+    # Only the requested card and the size of the deck/review set are loaded
     is_review_mode = mode == "review"
+    is_due_mode = mode == "due"
+    prev_index = next_index = None
     if is_review_mode:
-        cards = database.get_review_cards_by_dataset(dataset_id)
-        if not cards:
+        # card_index is a deck position here: the page shows the first marked card
+        # at or after it, and links to the marked cards around it by their positions
+        current_card, prev_index, next_index, total_cards = database.get_review_card(
+            dataset_id, card_index
+        )
+        if current_card is not None:
+            card_index = current_card["position"]
+    elif is_due_mode:
+        # Due mode always serves the earliest due card; card_index only
+        # counts the cards graded in this session
+        current_card, total_cards = database.get_next_due_card(
+            dataset_id, int(time.time())
+        )
+        if current_card is None:
             flash(
-                f"No cards marked for review in dataset '{dataset_name}'. Returning to index.",
+                f"No cards are due in dataset '{dataset_name}'. Come back later!",
                 "info",
             )
             return redirect(url_for("index"))
-    else:  # Learn mode
-        cards = database.get_cards_by_dataset(dataset_id)
-        if not cards:
+    else:
+        current_card, total_cards = database.get_card_by_position(dataset_id, card_index)
+        prev_index, next_index = adjacent_indexes(card_index, total_cards)
+    if total_cards == 0:
+        if is_review_mode:
+            flash(
+                f"No cards marked for review in dataset '{dataset_name}'. Returning to index.",
+                "info",
+            )
+        else:
             # This case should ideally be caught by learn_dataset, but check again
             flash(f"Dataset '{dataset_name}' is empty.", "warning")
-            return redirect(url_for("index"))
-
-    total_cards = len(cards)
+        return redirect(url_for("index"))
 
     # --- Validate card_index ---
-    if not (0 <= card_index < total_cards):
+    if current_card is None:
         flash(
             f"Invalid card index ({card_index}) for {mode} mode in dataset '{dataset_name}'. Showing first card instead.",
             "warning",
@@ -310,64 +386,269 @@ def show_card(dataset_id, card_index, mode="learn"):  # Default to learn mode
             url_for("show_card", dataset_id=dataset_id, card_index=0, mode=mode)
         )
 
-    # Get the current card from the correct list
-    current_card = cards[card_index]
+    # --- Conditional Request ---
+    # Notes and review flag edits bump the dataset version, so an unchanged
+    # version means the browser's copy of this page is still valid. It was
+    # checked before saving progress, so a revalidated page writes nothing.
+    # Due mode depends on the clock and is never cached.
+    etag = None
+    if not is_due_mode:
+        etag = page_etag("card", dataset_id, dataset["version"], card_index, mode)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
     # Save progress ONLY if in learn mode
-    if not is_review_mode:
-        save_progress(dataset_id, card_index)
-
-    # --- Prepare Choices for Shuffling ---
-    choices = [
-        current_card["choice1"],
-        current_card["choice2"],
-        current_card["choice3"],
-        current_card["choice4"],
-    ]
-    if current_card["choice5"]:
-        choices.append(current_card["choice5"])
-
-    # Filter out any potentially empty choices just in case
-    choices = [choice for choice in choices if choice and choice.strip()]
-
-    # Shuffle the choices
-    shuffled_choices = choices[:]  # Create a copy before shuffling
-    random.shuffle(shuffled_choices)
+    if mode == "learn":
+        try:
+            database.save_progress(dataset_id, card_index)
+        except writer.WriterBusy:
+            pass  # Still show the card; learn.js saves progress again while navigating
 
     # --- Render Template ---
-    return render_template(
+    # The card body comes from the fragment cache
+    page = render_template(
         "learn.html",
         card=current_card,
+        card_fragment=card_fragment(current_card, mode),
         dataset_id=dataset_id,
         dataset_name=dataset_name, # Pass dataset name
         current_index=card_index,
+        prev_index=prev_index,
+        next_index=next_index,
         total_cards=total_cards,
         mode=mode,
-        shuffled_choices=shuffled_choices,
+        choices=card_choices(current_card),  # Shuffled by learn.js
+        cards_api_url=url_for("api_dataset_cards", dataset_id=dataset_id),
+        progress_api_url=url_for("api_dataset_progress", dataset_id=dataset_id),
+        due_count_limit=database.DUE_COUNT_LIMIT,
+    )
+    return with_etag(page, etag)
+
+
+# --- Exam Mode ---
+# Questions per exam unless the form asks for another number, and the most allowed
+EXAM_DEFAULT_CARDS = 100
+EXAM_MAX_CARDS = 1000
+
+
+@app.route("/exam", methods=["POST"])
+def start_exam():
+    """Samples a shuffled exam from one or more datasets and redirects to its first card."""
+    dataset_ids = request.form.getlist("dataset_ids", type=int)
+    card_count = request.form.get("card_count", EXAM_DEFAULT_CARDS, type=int)
+    if not dataset_ids:
+        flash("Select at least one dataset for the exam.", "danger")
+        return redirect(url_for("index"))
+    if not (1 <= card_count <= EXAM_MAX_CARDS):
+        flash(f"An exam must have between 1 and {EXAM_MAX_CARDS} questions.", "danger")
+        return redirect(url_for("index"))
+
+    # The sample is drawn once and stored, so every page of the exam is a lookup
+    exam_id, exam_size = database.create_exam_session(dataset_ids, card_count, int(time.time()))
+    if exam_id is None:
+        flash("The selected datasets have no cards.", "warning")
+        return redirect(url_for("index"))
+    if exam_size < card_count:
+        flash(f"The selected datasets only have {exam_size} cards, so the exam has {exam_size} questions.", "info")
+    return redirect(url_for("show_exam_card", exam_id=exam_id, card_index=0))
+
+
+@app.route("/exam/<int:exam_id>")
+def exam_session(exam_id):
+    """Redirects to the first card of an exam."""
+    return redirect(url_for("show_exam_card", exam_id=exam_id, card_index=0))
+
+
+@app.route("/exam/<int:exam_id>/<int:card_index>")
+def show_exam_card(exam_id, card_index):
+    """Displays the card at a position of an exam, looked up by its stored card ID."""
+    current_card, total_cards = database.get_exam_card(exam_id, card_index)
+    if total_cards == 0:
+        flash(f"Exam {exam_id} not found. It may have expired.", "warning")
+        return redirect(url_for("index"))
+    if current_card is None:
+        if not (0 <= card_index < total_cards):
+            flash(f"Invalid card index ({card_index}) for this exam. Showing first card instead.", "warning")
+            return redirect(url_for("show_exam_card", exam_id=exam_id, card_index=0))
+        # The card was deleted (or merged away) after the exam was created
+        flash(f"Question {card_index + 1} was removed from its dataset and is skipped.", "info")
+        if card_index + 1 < total_cards:
+            return redirect(url_for("show_exam_card", exam_id=exam_id, card_index=card_index + 1))
+        return redirect(url_for("index"))
+
+    # The exam itself never changes; its card only does with its dataset
+    etag = page_etag("exam", exam_id, card_index, current_card["dataset_id"], current_card["dataset_version"])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    prev_index, next_index = adjacent_indexes(card_index, total_cards)
+    page = render_template(
+        "learn.html",
+        card=current_card,
+        card_fragment=card_fragment(current_card, "exam"),
+        dataset_id=current_card["dataset_id"],
+        dataset_name=current_card["dataset_name"],
+        exam_id=exam_id,
+        current_index=card_index,
+        prev_index=prev_index,
+        next_index=next_index,
+        total_cards=total_cards,
+        mode="exam",
+        choices=card_choices(current_card),  # Shuffled by learn.js
+        cards_api_url=url_for("api_exam_cards", exam_id=exam_id),
+        progress_api_url=None,  # Progress is only tracked in learn mode
+        due_count_limit=database.DUE_COUNT_LIMIT,
+    )
+    return with_etag(page, etag)
+
+
+# --- Search ---
+# Number of search results shown per page
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+def highlight_snippet(snippet):
+    """Escapes a search snippet and turns its match markers into <mark> tags."""
+    return Markup(
+        str(escape(snippet or ""))
+        .replace(database.SEARCH_HIGHLIGHT_START, "<mark>")
+        .replace(database.SEARCH_HIGHLIGHT_END, "</mark>")
+    )
+
+
+@app.route("/search")
+def search():
+    """Full-text search across all decks (or one, with ?dataset_id=), ranked and paginated."""
+    query = request.args.get("q", "").strip()
+    dataset_id = request.args.get("dataset_id", type=int)
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    results, has_more = [], False
+    if query:
+        results, has_more = database.search_cards(
+            query,
+            dataset_id=dataset_id,
+            limit=SEARCH_RESULTS_PER_PAGE,
+            offset=(page - 1) * SEARCH_RESULTS_PER_PAGE,
+        )
+
+    return render_template(
+        "search.html",
+        query=query,
+        dataset_id=dataset_id,
+        datasets=database.get_datasets(),
+        results=results,
+        page=page,
+        has_more=has_more,
+        highlight=highlight_snippet,
     )
 
 
+# --- Export ---
+# Column titles of the CSV export; the importer skips this header row
+EXPORT_CSV_HEADER = [
+    "Question",
+    "Correct Answer",
+    "Answer 1",
+    "Answer 2",
+    "Answer 3",
+    "Answer 4",
+    "Answer 5",
+    "Notes",
+    "Mark For Review",
+]
+# Exported text is buffered up to this many characters per response chunk
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_csv_chunks(cards):
+    """Yields a re-importable CSV export (header, 9 columns per card) in chunks."""
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    csv_writer.writerow(EXPORT_CSV_HEADER)
+    for card in cards:
+        csv_writer.writerow(
+            [
+                card["question"],
+                card["correct_answer"],
+                card["choice1"],
+                card["choice2"],
+                card["choice3"],
+                card["choice4"],
+                card["choice5"] or "",
+                card["notes"] or "",
+                1 if card["mark_for_review"] else 0,
+            ]
+        )
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl_chunks(cards):
+    """Yields a re-importable JSON Lines export (one card object per line) in chunks."""
+    lines = []
+    size = 0
+    for card in cards:
+        line = json.dumps(
+            {
+                "question": card["question"],
+                "correct_answer": card["correct_answer"],
+                "choices": card_choices(card),
+                "notes": card["notes"] or "",
+                "mark_for_review": bool(card["mark_for_review"]),
+            },
+            ensure_ascii=False,
+        )
+        lines.append(line)
+        size += len(line) + 1
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+@app.route("/export/<int:dataset_id>.csv", defaults={"export_format": "csv"})
+@app.route("/export/<int:dataset_id>.jsonl", defaults={"export_format": "jsonl"})
+def export_dataset(dataset_id, export_format):
+    """Streams all cards of a dataset, notes and review flags included, as a download."""
+    dataset = database.get_dataset_by_id(dataset_id)
+    if not dataset:
+        abort(404)
+
+    # Any notes or review flag edit bumps the dataset version
+    etag = page_etag("export", dataset_id, dataset["version"], export_format)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Rows are fetched in batches while the response is being sent
+    cards = database.iter_dataset_cards(dataset_id)
+    chunks = export_csv_chunks(cards) if export_format == "csv" else export_jsonl_chunks(cards)
+    response = app.response_class(
+        stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[export_format]
+    )
+    filename = secure_filename(dataset["name"]) or f"dataset-{dataset_id}"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+    return with_etag(response, etag)
+
+
 # --- Other Routes (Deletion, Notes, Review Toggle) ---
 
 
 @app.route("/delete_dataset/<int:dataset_id>", methods=["POST"])
 def delete_dataset(dataset_id):
     """Deletes a dataset and its associated progress."""
+    # Progress rows are removed together with the dataset (ON DELETE CASCADE)
     if database.delete_dataset(dataset_id):
-        # Remove progress for this dataset
-        progress = load_progress()
-        dataset_id_str = str(dataset_id)
-        if dataset_id_str in progress:
-            del progress[dataset_id_str]
-            if not _save_progress_data(progress):
-                flash("Dataset deleted, but failed to update progress file.", "warning")
-            else:
-                flash(f"Dataset {dataset_id} deleted successfully.", "success")
-        else:
-            flash(
-                f"Dataset {dataset_id} deleted successfully (no progress data found).",
-                "success",
-            )
+        flash(f"Dataset {dataset_id} deleted successfully.", "success")
     else:
         flash(f"Error deleting dataset {dataset_id}. It might not exist.", "danger")
 
@@ -395,9 +676,10 @@ def update_note(card_id):
 
 @app.route("/toggle_review/<int:card_id>", methods=["POST"])
 def toggle_review(card_id):
-    """Toggles the review status for a specific card via AJAX."""
-    if database.toggle_card_review_status(card_id):
-        return jsonify({"status": "success"})
+    """Toggles the review status for a specific card via AJAX and returns the new status."""
+    new_status = database.toggle_card_review_status(card_id)
+    if new_status is not None:
+        return jsonify({"status": "success", "mark_for_review": new_status})
     else:
         # Card not found or DB error
         return jsonify(
@@ -405,6 +687,313 @@ def toggle_review(card_id):
         ), 500
 
 
+# --- JSON API Routes (used by learn.js for client-side navigation) ---
+# Maximum number of cards returned by one call of the cards API
+API_MAX_CARDS_PER_PAGE = 100
+
+
+@app.route("/api/datasets/<int:dataset_id>/cards")
+def api_dataset_cards(dataset_id):
+    """
+    Returns cards of a dataset as JSON: a window of the deck in learn mode
+    (?mode=learn&offset=&limit=), or in review mode the marked cards after or
+    before a deck position (?mode=review&after=|before=&limit=).
+    """
+    mode = request.args.get("mode", "learn")
+    if mode not in ("learn", "review"):
+        return jsonify({"status": "error", "message": f"Unknown mode '{mode}'"}), 400
+    limit = request.args.get("limit", 20, type=int)
+    if mode == "review":
+        # The review set is paged by deck position (keyset), never by an offset into it
+        before = request.args.get("before", type=int)
+        position = before if before is not None else request.args.get("after", -1, type=int)
+        if position < -1 or limit < 1:
+            return jsonify({"status": "error", "message": "Invalid position or limit"}), 400
+    else:
+        offset = request.args.get("offset", 0, type=int)
+        if offset < 0 or limit < 1:
+            return jsonify({"status": "error", "message": "Invalid offset or limit"}), 400
+    limit = min(limit, API_MAX_CARDS_PER_PAGE)
+
+    dataset = database.get_dataset_by_id(dataset_id)
+    if not dataset:
+        return jsonify({"status": "error", "message": "Dataset not found"}), 404
+    if mode == "review":
+        window = ("before" if before is not None else "after", position)
+    else:
+        window = ("offset", offset)
+    etag = page_etag("cards", dataset_id, dataset["version"], mode, *window, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    if mode == "review":
+        cards, total_cards = database.get_review_cards(dataset_id, position, limit, before=before is not None)
+        page = {"before": before} if before is not None else {"after": position}
+        card_indexes = [card["position"] for card in cards]
+    else:
+        cards, total_cards = database.get_cards_window(dataset_id, offset, limit)
+        page = {"offset": offset}
+        card_indexes = range(offset, offset + len(cards))
+    response = jsonify(
+        {
+            "status": "success",
+            "dataset_id": dataset_id,
+            "mode": mode,
+            **page,
+            "limit": limit,
+            "total": total_cards,
+            "cards": [
+                card_to_json(card, card_index) for card, card_index in zip(cards, card_indexes)
+            ],
+        }
+    )
+    return with_etag(response, etag)
+
+
+@app.route("/api/exams/<int:exam_id>/cards")
+def api_exam_cards(exam_id):
+    """Returns a window of cards of an exam (?offset=&limit=) as JSON, in exam order."""
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", 20, type=int)
+    if offset < 0 or limit < 1:
+        return jsonify({"status": "error", "message": "Invalid offset or limit"}), 400
+    limit = min(limit, API_MAX_CARDS_PER_PAGE)
+
+    cards, total_cards = database.get_exam_cards(exam_id, offset, limit)
+    if total_cards == 0:
+        return jsonify({"status": "error", "message": "Exam not found"}), 404
+    # Cards deleted since the exam was created are left out; learn.js then
+    # falls back to the server page, which skips them
+    present = [(offset + i, card) for i, card in enumerate(cards) if card is not None]
+    etag = page_etag(
+        "exam-cards", exam_id, offset, limit,
+        *sorted({(card["dataset_id"], card["dataset_version"]) for _, card in present}),
+    )
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = jsonify(
+        {
+            "status": "success",
+            "exam_id": exam_id,
+            "mode": "exam",
+            "offset": offset,
+            "limit": limit,
+            "total": total_cards,
+            "cards": [
+                dict(card_to_json(card, index), dataset_name=card["dataset_name"])
+                for index, card in present
+            ],
+        }
+    )
+    return with_etag(response, etag)
+
+
+@app.route("/api/datasets/<int:dataset_id>/progress", methods=["POST"])
+def api_dataset_progress(dataset_id):
+    """Stores the learn-mode position reached by client-side navigation."""
+    data = request.get_json(silent=True)
+    card_index = data.get("card_index") if data else None
+    if not isinstance(card_index, int) or card_index < 0:
+        return jsonify({"status": "error", "message": "Missing or invalid card_index"}), 400
+
+    if database.save_progress(dataset_id, card_index):
+        return jsonify({"status": "success"})
+    else:
+        return jsonify(
+            {"status": "error", "message": "Failed to save progress"}
+        ), 500
+
+
+@app.route("/api/cards/<int:card_id>/grade", methods=["POST"])
+def api_grade_card(card_id):
+    """Grades a recall attempt ({"quality": 0-5}) and schedules the card's next review."""
+    data = request.get_json(silent=True)
+    quality = data.get("quality") if isinstance(data, dict) else None
+    if (
+        not isinstance(quality, int)
+        or isinstance(quality, bool)
+        or not (scheduler.MIN_QUALITY <= quality <= scheduler.MAX_QUALITY)
+    ):
+        return jsonify(
+            {
+                "status": "error",
+                "message": f"'quality' must be an integer from {scheduler.MIN_QUALITY} to {scheduler.MAX_QUALITY}",
+            }
+        ), 400
+
+    schedule = database.grade_card(card_id, quality, int(time.time()))
+    if schedule is None:
+        return jsonify(
+            {"status": "error", "message": "Failed to grade card"}
+        ), 500
+    return jsonify({"status": "success", **schedule})
+
+
+# Maximum number of note and review operations accepted in one batch
+API_MAX_BATCH_OPERATIONS = 1000
+
+
+@app.route("/api/cards/batch", methods=["POST"])
+def api_cards_batch():
+    """
+    Applies queued card edits in one transaction. Expects JSON like
+    {"notes": [{"card_id": 1, "notes": "..."}], "review": [{"card_id": 2, "mark_for_review": true}]}.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Expected a JSON object"}), 400
+
+    try:
+        note_updates = [
+            (_require_card_id(op), _require_type(op, "notes", str))
+            for op in data.get("notes", [])
+        ]
+        review_updates = [
+            (_require_card_id(op), _require_type(op, "mark_for_review", bool))
+            for op in data.get("review", [])
+        ]
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid batch: {e}"}), 400
+
+    if len(note_updates) + len(review_updates) > API_MAX_BATCH_OPERATIONS:
+        return jsonify(
+            {"status": "error", "message": f"At most {API_MAX_BATCH_OPERATIONS} operations per batch"}
+        ), 400
+
+    missing_card_ids = database.apply_card_updates(note_updates, review_updates)
+    if missing_card_ids is None:
+        return jsonify(
+            {"status": "error", "message": "Failed to apply updates in database"}
+        ), 500
+    return jsonify(
+        {
+            "status": "success",
+            "applied": len(note_updates) + len(review_updates),
+            "missing_card_ids": missing_card_ids,
+        }
+    )
+
+
+def _require_card_id(operation):
+    """Returns the integer card_id of a batch operation, raising ValueError if invalid."""
+    card_id = _require_type(operation, "card_id", int)
+    if isinstance(card_id, bool):
+        raise ValueError("'card_id' must be an integer")
+    return card_id
+
+
+def _require_type(operation, key, expected_type):
+    """Returns operation[key], raising ValueError if it is missing or of the wrong type."""
+    if not isinstance(operation, dict) or not isinstance(operation.get(key), expected_type):
+        raise ValueError(f"'{key}' must be a {expected_type.__name__}")
+    return operation[key]
+
+
+# --- Answer Events ---
+# Maximum number of answer events accepted in one request
+API_MAX_ANSWER_EVENTS = 100
+# Longer latencies (e.g. a tab left open) are stored as this value, in milliseconds
+ANSWER_MAX_LATENCY_MS = 60 * 60 * 1000
+
+
+@app.route("/api/answers", methods=["POST"])
+def api_record_answers():
+    """
+    Logs answers chosen while studying: one event {"card_id": 1, "chosen_answer": "...",
+    "latency_ms": 1200} or {"events": [...]}. Whether an answer is correct is decided
+    when it is written. Events are queued for the database writer, so this returns
+    202 without waiting for them to be committed.
+    """
+    data = request.get_json(silent=True)
+    events = data.get("events") if isinstance(data, dict) and "events" in data else [data]
+    if not isinstance(events, list) or not (1 <= len(events) <= API_MAX_ANSWER_EVENTS):
+        return jsonify(
+            {
+                "status": "error",
+                "message": f"Expected an answer event or 1 to {API_MAX_ANSWER_EVENTS} events",
+            }
+        ), 400
+
+    answered_at = int(time.time() * 1000)
+    try:
+        parsed_events = [_parse_answer_event(event, answered_at) for event in events]
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Not waited for: a full write queue is reported through the WriterBusy handler,
+    # and events that later fail to be written are logged and counted in the metrics
+    database.record_answer_events(parsed_events)
+    return jsonify({"status": "accepted", "events": len(parsed_events)}), 202
+
+
+def _parse_answer_event(event, answered_at):
+    """Validates an answer event into the tuple stored by database.record_answer_events."""
+    card_id = _require_card_id(event)
+    chosen_answer = _require_type(event, "chosen_answer", str)
+    latency_ms = event.get("latency_ms")
+    if latency_ms is not None:
+        if isinstance(latency_ms, bool) or not isinstance(latency_ms, (int, float)) or latency_ms < 0:
+            raise ValueError("'latency_ms' must be a non-negative number")
+        latency_ms = min(int(latency_ms), ANSWER_MAX_LATENCY_MS)
+    return (card_id, chosen_answer, latency_ms, answered_at)
+
+
+@app.route("/api/datasets/<int:dataset_id>/answer_stats")
+def api_answer_stats(dataset_id):
+    """Returns answer accuracy of a dataset and of its cards, least accurate first (?offset=&limit=)."""
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", 20, type=int)
+    if offset < 0 or limit < 1:
+        return jsonify({"status": "error", "message": "Invalid offset or limit"}), 400
+    limit = min(limit, API_MAX_CARDS_PER_PAGE)
+
+    if not database.get_dataset_by_id(dataset_id):
+        return jsonify({"status": "error", "message": "Dataset not found"}), 404
+    dataset_stats, card_stats = database.get_answer_stats(dataset_id, limit, offset)
+
+    def summary(stats):
+        attempts = stats["attempts"] if stats else 0
+        return {
+            "attempts": attempts,
+            "correct": stats["correct"] if stats else 0,
+            "accuracy": stats["correct"] / attempts if attempts else None,
+            "average_latency_ms": stats["total_latency_ms"] / attempts if attempts else None,
+            "last_answered_at": stats["last_answered_at"] if stats else None,
+        }
+
+    return jsonify(
+        {
+            "status": "success",
+            "dataset_id": dataset_id,
+            **summary(dataset_stats),
+            "offset": offset,
+            "limit": limit,
+            "cards": [
+                {
+                    "card_id": card["card_id"],
+                    "index": card["position"],
+                    "question": card["question"],
+                    **summary(card),
+                }
+                for card in card_stats
+            ],
+        }
+    )
+
+
+# --- Monitoring ---
+@app.route("/metrics")
+def metrics_endpoint():
+    """Exposes request, SQL, progress and import metrics in the Prometheus text format."""
+    response = make_response(metrics.render())
+    response.headers["Content-Type"] = metrics.CONTENT_TYPE
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
     # Note: Use 'flask run' command instead of running this directly for development server
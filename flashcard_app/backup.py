@@ -0,0 +1,352 @@
+"""
+Online backup and restore of the flashcard database.
+
+A backup copies the live database with SQLite's backup API while the app keeps
+serving requests. Study progress lives in the same database (the legacy
+progress.json is migrated into it at startup), so every snapshot holds cards,
+notes, review state and progress from one consistent point in time.
+
+    python backup.py backup [--output PATH] [--step-pages N] [--step-sleep-ms MS]
+    python backup.py restore PATH
+
+Both commands print how long they took. They run outside the web server (see
+`make backup`), so no request worker is tied up for the length of a backup.
+The shards of sharded datasets are backed up next to the database file, in a
+directory named after it with ".shards" appended. Each shard is copied after
+the main database, so the shards are not from the same point in time as it:
+they may include changes made while the backup ran.
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+import database
+import metrics
+
+# --- Configuration ---
+# Snapshots are written here unless another path is given
+BACKUP_DIR = os.environ.get("FLASHCARD_BACKUP_DIR", os.path.join(database.DATABASE_DIR, "backups"))
+# Pages copied per step; the source is only read-locked while a step runs
+BACKUP_STEP_PAGES = int(os.environ.get("FLASHCARD_BACKUP_STEP_PAGES", "1024"))
+# Pause between two steps, so writers waiting on the lock get their turn
+BACKUP_STEP_SLEEP_MS = int(os.environ.get("FLASHCARD_BACKUP_STEP_SLEEP_MS", "10"))
+# A write by another connection restarts a stepped backup from the first page.
+# After this many restarts the rest is copied in a single step instead, which
+# in WAL mode only holds a read snapshot and never blocks writers.
+BACKUP_MAX_RESTARTS = 3
+# Held while a backup or restore runs, so they never overlap across processes
+BACKUP_LOCK_PATH = os.path.join(database.DATABASE_DIR, "backup.lock")
+# Tables with a version counter, moved forward by a restore
+VERSIONED_TABLES = ("catalog_state", "datasets", "cards")
+
+
+class _BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a stepped backup that keeps restarting."""
+
+
+def _unique_backup_path():
+    """Returns a timestamped path in BACKUP_DIR that no earlier backup uses."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+    target_path = os.path.join(BACKUP_DIR, f"flashcard-{timestamp}.db")
+    suffix = 1
+    # Clocks can step back, so the microseconds alone do not guarantee a new name
+    while os.path.exists(target_path) or os.path.exists(shard_backup_dir(target_path)):
+        target_path = os.path.join(BACKUP_DIR, f"flashcard-{timestamp}-{suffix}.db")
+        suffix += 1
+    return target_path
+
+
+def backup_database(target_path=None, step_pages=BACKUP_STEP_PAGES, step_sleep_ms=BACKUP_STEP_SLEEP_MS):
+    """
+    Copies the live database to target_path (default: a timestamped file in
+    BACKUP_DIR) in steps of step_pages pages, pausing step_sleep_ms between them.
+
+    The copy is written to a temporary file first and renamed when complete, so
+    target_path never holds a partial backup. Shards are copied one by one once
+    the main database is done, so each is a snapshot of its own, taken a little
+    later than the database. Returns a dict describing the
+    backup and its timing (see describe_backup). Raises sqlite3.Error or OSError
+    if the backup fails.
+    """
+    stats = {"steps": 0, "restarts": 0, "longest_step_seconds": 0.0}
+    started = time.perf_counter()
+    with database.file_lock(BACKUP_LOCK_PATH):
+        # Picked under the lock, so concurrent backups never get the same name
+        if target_path is None:
+            target_path = _unique_backup_path()
+        target_dir = os.path.dirname(os.path.abspath(target_path))
+        os.makedirs(target_dir, exist_ok=True)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        temp_shard_dir = f"{shard_backup_dir(target_path)}.{os.getpid()}.tmp"
+
+        source = database.get_db_connection()
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                _copy_in_steps(source, target, step_pages, step_sleep_ms / 1000, stats)
+            except _BackupRestarted:
+                print(f"Backup restarted {stats['restarts']} times by concurrent writes, copying the rest in one step.")
+                _copy_in_steps(source, target, -1, 0, stats)
+            # The snapshot inherits WAL mode from the source; make it a single
+            # self-contained file and check it before it replaces anything
+            target.execute("PRAGMA journal_mode = DELETE")
+            if target.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError("The backup failed its integrity check.")
+            page_count = target.execute("PRAGMA page_count").fetchone()[0]
+            shard_ids = [row[0] for row in target.execute("SELECT id FROM datasets WHERE sharded = 1")]
+            target.close()
+            shard_bytes = _backup_shards(shard_ids, temp_shard_dir)
+            # The shards are put in place first, so a complete database file
+            # always comes with its shards
+            shutil.rmtree(shard_backup_dir(target_path), ignore_errors=True)
+            if shard_ids:
+                os.replace(temp_shard_dir, shard_backup_dir(target_path))
+            os.replace(temp_path, target_path)
+        except BaseException:
+            target.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            shutil.rmtree(temp_shard_dir, ignore_errors=True)
+            raise
+    seconds = time.perf_counter() - started
+
+    total_bytes = os.path.getsize(target_path) + shard_bytes
+    metrics.BACKUP_SECONDS.observe(seconds)
+    metrics.BACKUP_BYTES.inc(total_bytes)
+    result = dict(stats, path=target_path, pages=page_count, shards=len(shard_ids),
+                  bytes=total_bytes, seconds=seconds)
+    print(describe_backup(result))
+    return result
+
+
+def shard_backup_dir(backup_path):
+    """Returns the directory holding the shards of the backup at backup_path."""
+    return f"{backup_path}.shards"
+
+
+def _backup_shards(shard_ids, target_dir):
+    """
+    Copies the shards of the given datasets into target_dir and returns their total size.
+    Shards are small next to the main database, so each is copied in a single step
+    (which in WAL mode does not block writers). A dataset deleted since the main
+    database was copied has no shard left and is skipped.
+    """
+    if not shard_ids:
+        return 0
+    os.makedirs(target_dir, exist_ok=True)
+    total_bytes = 0
+    for dataset_id in shard_ids:
+        path = database.shard_path(dataset_id)
+        if not os.path.exists(path):
+            continue
+        target_path = os.path.join(target_dir, os.path.basename(path))
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+            if target.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError(f"The backup of shard {dataset_id} failed its integrity check.")
+        finally:
+            target.close()
+            source.close()
+        total_bytes += os.path.getsize(target_path)
+    return total_bytes
+
+
+def _copy_in_steps(source, target, step_pages, step_sleep, stats):
+    """Runs one Connection.backup() pass, recording its steps in stats."""
+    progress = {"remaining": None, "step_started": time.perf_counter()}
+
+    def on_step(status, remaining, total):
+        stats["steps"] += 1
+        stats["longest_step_seconds"] = max(
+            stats["longest_step_seconds"], time.perf_counter() - progress["step_started"]
+        )
+        # No fewer pages left than after the previous step: the copy started over
+        if progress["remaining"] is not None and remaining >= progress["remaining"]:
+            stats["restarts"] += 1
+            if stats["restarts"] >= BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        progress["remaining"] = remaining
+        if remaining and step_sleep:
+            # Release the source between steps (the backup API itself only
+            # sleeps when the source is busy)
+            time.sleep(step_sleep)
+        progress["step_started"] = time.perf_counter()
+
+    source.backup(target, pages=step_pages, progress=on_step)
+
+
+def describe_backup(result):
+    """Returns a one-line summary of a backup_database() result."""
+    shards = f" and {result['shards']} shards" if result.get("shards") else ""
+    return (
+        f"Backed up {result['pages']} pages{shards} ({result['bytes'] / 1024 / 1024:.1f} MiB) to {result['path']} "
+        f"in {result['seconds']:.2f}s: {result['steps']} steps, {result['restarts']} restarts, "
+        f"longest step {result['longest_step_seconds'] * 1000:.1f} ms."
+    )
+
+
+def restore_database(source_path):
+    """
+    Replaces the contents of the live database with a backup.
+
+    The backup is checked first, then copied into the database through SQLite,
+    so the server may keep running: other connections see either the old or the
+    restored data, never a mix. Pending migrations are applied to an older
+    backup afterwards, and every version counter is moved past its value before
+    the restore, so clients never mistake restored pages for ones they cached.
+    AUTOINCREMENT counters never go back either, so no card or dataset ID is
+    reused for different contents (the app caches rendered cards by ID and version).
+    The shards of sharded datasets are restored right after the database itself,
+    and shards of datasets the backup does not have are removed.
+    Returns the time taken in seconds. Raises ValueError if source_path is not a
+    usable backup, or sqlite3.Error if the restore fails.
+    """
+    if not os.path.isfile(source_path):
+        raise ValueError(f"Backup file '{source_path}' does not exist.")
+
+    started = time.perf_counter()
+    with database.file_lock(BACKUP_LOCK_PATH):
+        source = sqlite3.connect(f"file:{os.path.abspath(source_path)}?mode=ro", uri=True)
+        try:
+            try:
+                check = source.execute("PRAGMA quick_check").fetchone()[0]
+            except sqlite3.DatabaseError as e:
+                raise ValueError(f"'{source_path}' is not a flashcard database backup: {e}.")
+            if check != "ok":
+                raise ValueError(f"'{source_path}' failed its integrity check: {check}.")
+
+            target = database.get_db_connection()
+            version_offset = _max_version(target) + 1
+            sequences = _sequences(target)
+            # A single step: writers wait for the restore instead of seeing it half done
+            source.backup(target)
+        finally:
+            source.close()
+
+        database.init_db()
+        _restore_shards(shard_backup_dir(source_path))
+        _bump_versions(database.get_db_connection(), version_offset, sequences)
+    seconds = time.perf_counter() - started
+    print(f"Restored {source_path} in {seconds:.2f}s.")
+    return seconds
+
+
+def _restore_shards(source_dir):
+    """Copies the shards of the restored datasets from source_dir into the live shard directory."""
+    conn = database.get_db_connection()
+    shard_ids = {row[0] for row in conn.execute("SELECT id FROM datasets WHERE sharded = 1")}
+    for dataset_id in shard_ids:
+        path = database.shard_path(dataset_id)
+        source_path = os.path.join(source_dir, os.path.basename(path))
+        if not os.path.exists(source_path):
+            print(f"Warning: the backup has no shard for dataset {dataset_id}.")
+            continue
+        os.makedirs(database.SHARD_DIR, exist_ok=True)
+        source = sqlite3.connect(f"file:{os.path.abspath(source_path)}?mode=ro", uri=True)
+        # Copied through SQLite like the database itself, so connections that
+        # have the live shard attached see the restored contents
+        target = sqlite3.connect(path)
+        try:
+            version_offset = _max_version(target) + 1
+            sequences = _sequences(target)
+            source.backup(target)
+            target.execute(f"PRAGMA journal_mode = {database.SQLITE_JOURNAL_MODE}")
+            # A backup from before the latest shard migrations is migrated first
+            database.upgrade_shard(dataset_id)
+            _bump_versions(target, version_offset, sequences)
+        finally:
+            target.close()
+            source.close()
+
+    if os.path.isdir(database.SHARD_DIR):
+        for name in os.listdir(database.SHARD_DIR):
+            dataset_id, extension = os.path.splitext(name)
+            if extension == ".db" and dataset_id.isdigit() and int(dataset_id) not in shard_ids:
+                database.remove_shard_files(os.path.join(database.SHARD_DIR, name))
+
+
+def _max_version(conn):
+    """Returns the highest catalog, dataset or card version of a database or shard (0 if it has none yet)."""
+    highest = 0
+    for table in VERSIONED_TABLES:
+        try:
+            row = conn.execute(f"SELECT COALESCE(MAX(version), 0) FROM {table}").fetchone()
+        except sqlite3.OperationalError:
+            continue  # A shard, or a schema from before this version counter
+        highest = max(highest, row[0])
+    return highest
+
+
+def _sequences(conn):
+    """Returns the AUTOINCREMENT counters of a database or shard by table name."""
+    try:
+        return {row[0]: row[1] for row in conn.execute("SELECT name, seq FROM sqlite_sequence")}
+    except sqlite3.OperationalError:
+        return {}  # No AUTOINCREMENT table yet
+
+
+def _bump_versions(conn, offset, sequences):
+    """
+    Adds offset to every version counter used in cache validators and cache keys,
+    and moves the AUTOINCREMENT counters back up to their values in sequences.
+    """
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in VERSIONED_TABLES:
+            if table in tables:
+                conn.execute(f"UPDATE {table} SET version = version + ?", (offset,))
+        for name, seq in sequences.items():
+            if name not in tables:
+                continue
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name))
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq)"
+                " SELECT ?1, ?2 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?1)",
+                (name, seq),
+            )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error updating version counters after the restore: {e}")
+        conn.rollback()
+
+
+# --- Command Line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Back up or restore the flashcard database while it is in use.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup = commands.add_parser("backup", help="Write a consistent snapshot of the database")
+    backup.add_argument("--output", help=f"Backup file (default: a timestamped file in {BACKUP_DIR})")
+    backup.add_argument("--step-pages", type=int, default=BACKUP_STEP_PAGES,
+                        help=f"Pages copied per step, -1 for all at once (default: {BACKUP_STEP_PAGES})")
+    backup.add_argument("--step-sleep-ms", type=int, default=BACKUP_STEP_SLEEP_MS,
+                        help=f"Pause between steps in milliseconds (default: {BACKUP_STEP_SLEEP_MS})")
+    restore = commands.add_parser("restore", help="Replace the database with a backup")
+    restore.add_argument("path", help="Backup file written by the backup command")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.command == "backup":
+            backup_database(args.output, args.step_pages, args.step_sleep_ms)
+        else:
+            restore_database(args.path)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"{args.command.capitalize()} failed: {e}")
+        return 1
+    finally:
+        # Add this run's backup metrics to the server's /metrics, as an exited worker's
+        metrics.write_process_file()
+        metrics.mark_process_dead(os.getpid())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,527 @@
+"""
+Benchmark harness for the Flask routes.
+
+Generates synthetic decks into a temporary data directory, drives the app
+through Flask's test client and/or a threaded local HTTP server, and reports
+throughput plus p50/p95/p99 latency per route. Results can be written to a
+JSON file to diff between commits:
+
+    python benchmark.py --deck-sizes 1000 100000 --concurrency 1 8 --output before.json
+
+With --startup it instead measures how long gunicorn takes to answer its first
+request, on an empty data directory (a fresh container) and on an existing
+database of --startup-db-mb megabytes:
+
+    python benchmark.py --startup --startup-db-mb 1024 --output startup.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Rows of each CSV uploaded by the upload_file benchmark
+UPLOAD_ROWS = 100
+# Routes measured for every deck size, client and concurrency level
+ROUTES = ("show_card", "api_cards", "update_note", "toggle_review", "upload_file")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Cards per deck imported to grow the database of the startup benchmark
+STARTUP_DECK_SIZE = 100000
+# Seconds a server may take to answer its first request before the run fails
+STARTUP_TIMEOUT = 120
+
+
+# --- Synthetic Data ---
+def synthetic_cards(count, seed=0):
+    """Yields `count` synthetic card dicts in the shape database.import_dataset expects."""
+    rng = random.Random(seed)
+    words = ["cloud", "pipeline", "query", "storage", "stream", "schema", "model", "cluster"]
+    for i in range(count):
+        topic = " ".join(rng.choice(words) for _ in range(6))
+        yield {
+            "question": f"Question {i}: which option best describes {topic}?",
+            "correct_answer": f"Answer {i}",
+            "choice1": f"Answer {i}",
+            "choice2": f"Distractor {i}-a about {rng.choice(words)}",
+            "choice3": f"Distractor {i}-b about {rng.choice(words)}",
+            "choice4": f"Distractor {i}-c about {rng.choice(words)}",
+            "choice5": None,
+            "notes": "",
+        }
+
+
+def synthetic_csv(rows, seed=0):
+    """Returns an upload-ready CSV (header row included) with `rows` synthetic cards."""
+    lines = ['"Question","Correct Answer","Answer 1","Answer 2","Answer 3","Answer 4"']
+    for card in synthetic_cards(rows, seed):
+        fields = [card[key] for key in ("question", "correct_answer", "choice1", "choice2", "choice3", "choice4")]
+        lines.append(",".join(f'"{field}"' for field in fields))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# --- Statistics ---
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, wall_seconds):
+    """Reduces raw latencies (seconds) into throughput and latency percentiles in ms."""
+    latencies = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_seconds, 1) if wall_seconds else None,
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p95_ms": to_ms(percentile(latencies, 0.95)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+    }
+
+
+# --- Clients ---
+class TestClientDriver:
+    """Sends requests through Flask's in-process test client (one client per thread)."""
+
+    name = "test_client"
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, data=None, json_body=None):
+        """Returns the status code and Location header (or None) of the response."""
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=data, json=json_body)
+        response.close()
+        return response.status_code, response.headers.get("Location")
+
+    def close(self):
+        pass
+
+
+class HttpServerDriver:
+    """Sends real HTTP requests to the app served by a threaded local werkzeug server."""
+
+    name = "http_server"
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        # Per-request access logging would dominate the measured latency
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, data=None, json_body=None):
+        """Returns the status code and Location header (or None) of the response."""
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body, content_type = encode_multipart(data)
+            headers["Content-Type"] = content_type
+        http_request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method
+        )
+        try:
+            with _NO_REDIRECTS.open(http_request) as response:
+                response.read()
+                return response.status, response.headers.get("Location")
+        except urllib.error.HTTPError as e:
+            # Redirects (e.g. after an upload) end up here too; request_failed() sorts them out
+            return e.code, e.headers.get("Location")
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_NO_REDIRECTS = urllib.request.build_opener(_NoRedirect)
+
+
+def encode_multipart(fields):
+    """Encodes form fields (bytes values as (file, name) tuples) as multipart/form-data."""
+    boundary = f"----flashcard-bench-{random.getrandbits(64):x}"
+    parts = []
+    for key, value in fields.items():
+        if isinstance(value, tuple):
+            file_obj, filename = value
+            header = f'Content-Disposition: form-data; name="{key}"; filename="{filename}"\r\nContent-Type: text/csv'
+            payload = file_obj.read()
+            file_obj.seek(0)
+        else:
+            header = f'Content-Disposition: form-data; name="{key}"'
+            payload = str(value).encode("utf-8")
+        parts.append(f"--{boundary}\r\n{header}\r\n\r\n".encode("utf-8") + payload + b"\r\n")
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+# --- Route Scenarios ---
+def route_request(route, deck, rng, sequence):
+    """Builds the (method, path, kwargs) of one request to `route` against a deck."""
+    import io
+
+    card_index = rng.randrange(deck["size"])
+    card_id = deck["first_card_id"] + card_index
+    if route == "show_card":
+        return "GET", f"/learn/{deck['id']}/{card_index}/learn", {}
+    if route == "api_cards":
+        return "GET", f"/api/datasets/{deck['id']}/cards?mode=learn&offset={card_index}&limit=20", {}
+    if route == "update_note":
+        return "POST", f"/update_note/{card_id}", {"data": {"notes": f"bench note {sequence}"}}
+    if route == "toggle_review":
+        return "POST", f"/toggle_review/{card_id}", {}
+    if route == "upload_file":
+        # Unique across runs and reused data directories, or the upload is refused as a duplicate
+        name = f"bench-upload-{deck['id']}-{uuid.uuid4().hex}"
+        payload = {"dataset_name": name, "csv_file": (io.BytesIO(deck["upload_csv"]), "bench.csv")}
+        return "POST", "/upload", {"data": payload}
+    raise ValueError(f"Unknown route '{route}'")
+
+
+def upload_job_id(location):
+    """Returns the import job ID from the redirect of a successful upload, or None."""
+    query = urllib.parse.urlsplit(location or "").query
+    return urllib.parse.parse_qs(query).get("job", [None])[0]
+
+
+def request_failed(route, status, location):
+    """True if a response is an error, including an upload redirected back without starting a job."""
+    if status >= 400:
+        return True
+    return route == "upload_file" and upload_job_id(location) is None
+
+
+def run_route(driver, route, deck, requests, concurrency, seed, job_ids=None):
+    """
+    Fires `requests` requests at one route from `concurrency` threads and summarizes
+    them. The IDs of the import jobs started by uploads are appended to job_ids.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        local_latencies = []
+        local_errors = 0
+        while True:
+            with lock:
+                sequence = next(counter, None)
+            if sequence is None:
+                break
+            method, path, kwargs = route_request(route, deck, rng, sequence)
+            start = time.perf_counter()
+            try:
+                status, location = driver.request(method, path, kwargs.get("data"), kwargs.get("json"))
+                if request_failed(route, status, location):
+                    local_errors += 1
+                elif job_ids is not None and route == "upload_file":
+                    with lock:
+                        job_ids.append(upload_job_id(location))
+            except Exception as e:
+                print(f"Request {method} {path} failed: {e}")
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall_seconds = time.perf_counter() - start
+    return summarize(latencies, errors[0], wall_seconds)
+
+
+def wait_for_imports(jobs_module, timeout=300):
+    """Waits until every background import started by the upload benchmark has finished."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with jobs_module._jobs_lock:
+            pending = [job for job in jobs_module._jobs.values() if job.finished_at is None]
+        if not pending:
+            return
+        time.sleep(0.1)
+    print("Warning: background imports still running after the timeout.")
+
+
+def failed_imports(jobs_module, job_ids):
+    """Returns how many of the given import jobs did not finish successfully."""
+    jobs = [jobs_module.get_job(job_id) for job_id in job_ids]
+    return sum(1 for job in jobs if job is None or job.status != "done")
+
+
+# --- Startup ---
+def build_database(database, target_mb, seed):
+    """Imports synthetic decks until the database file holds at least target_mb megabytes."""
+    deck = 0
+    while os.path.getsize(database.DATABASE_PATH) < target_mb * 1024 * 1024:
+        print(f"  importing deck {deck} ({os.path.getsize(database.DATABASE_PATH) / 1024 / 1024:.0f} MB so far)...")
+        database.import_dataset(f"bench-startup-{deck}", synthetic_cards(STARTUP_DECK_SIZE, seed + deck))
+        deck += 1
+    # Leave a plain database file behind, as a cleanly stopped server does
+    database.get_db_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def free_port():
+    """Returns a TCP port on localhost that is currently free."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_to_first_response(data_dir):
+    """Starts gunicorn on data_dir and returns the seconds until it first answers GET / with 200."""
+    port = free_port()
+    env = dict(os.environ, FLASHCARD_DATA_DIR=data_dir, FLASHCARD_BIND=f"127.0.0.1:{port}")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "app:app"],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < STARTUP_TIMEOUT:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=STARTUP_TIMEOUT) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"gunicorn did not answer within {STARTUP_TIMEOUT}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_startup(args):
+    """Measures the time to first response on a fresh and on an existing data directory."""
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="flashcard-bench-")
+    os.environ["FLASHCARD_DATA_DIR"] = data_dir
+    sys.path.insert(0, APP_DIR)
+    import database
+
+    results = []
+    try:
+        database.init_db()
+        print(f"Preparing a database of at least {args.startup_db_mb} MB in {data_dir}...")
+        build_database(database, args.startup_db_mb, args.seed)
+        database_mb = round(os.path.getsize(database.DATABASE_PATH) / 1024 / 1024, 1)
+        for scenario in ("fresh", "existing"):
+            timings = []
+            for _ in range(args.startup_runs):
+                if scenario == "existing":
+                    timings.append(time_to_first_response(data_dir))
+                    continue
+                fresh_dir = tempfile.mkdtemp(prefix="flashcard-bench-fresh-")
+                try:
+                    timings.append(time_to_first_response(fresh_dir))
+                finally:
+                    shutil.rmtree(fresh_dir, ignore_errors=True)
+            timings.sort()
+            result = {
+                "scenario": scenario,
+                "database_mb": database_mb if scenario == "existing" else 0,
+                "runs": len(timings),
+                "min_ms": round(timings[0] * 1000, 1),
+                "p50_ms": round(percentile(timings, 0.50) * 1000, 1),
+                "max_ms": round(timings[-1] * 1000, 1),
+            }
+            results.append(result)
+            print(
+                f"  {scenario:<8} {result['database_mb']:>8} MB  time to first response: "
+                f"min {result['min_ms']} ms  p50 {result['p50_ms']} ms  max {result['max_ms']} ms"
+            )
+    finally:
+        if not args.data_dir and not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    settings = {
+        "startup_db_mb": args.startup_db_mb,
+        "startup_runs": args.startup_runs,
+        "workers": os.environ.get("FLASHCARD_WORKERS", "4"),
+        "seed": args.seed,
+    }
+    return write_report(args, settings, results)
+
+
+# --- Main ---
+def create_deck(database, size):
+    """Imports a synthetic deck of `size` cards and returns what the scenarios need."""
+    start = time.perf_counter()
+    dataset_id, count = database.import_dataset(f"bench-deck-{size}-{uuid.uuid4().hex}", synthetic_cards(size))
+    import_seconds = time.perf_counter() - start
+    first_card, _ = database.get_card_by_position(dataset_id, 0)
+    return {
+        "id": dataset_id,
+        "size": count,
+        "first_card_id": first_card["id"],
+        "import_seconds": round(import_seconds, 3),
+        "upload_csv": synthetic_csv(UPLOAD_ROWS),
+    }
+
+
+def git_commit():
+    """Returns the current git commit of the repository, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=APP_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the flashcard app's routes.")
+    parser.add_argument("--deck-sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Synthetic deck sizes to generate (default: 1000 10000)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8],
+                        help="Concurrent client threads per run (default: 1 8)")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="Requests per route and run (default: 500)")
+    parser.add_argument("--upload-requests", type=int, default=20,
+                        help="Requests per run for upload_file, which creates datasets (default: 20)")
+    parser.add_argument("--clients", choices=["test_client", "http_server"], nargs="+",
+                        default=["test_client", "http_server"], help="Ways of driving the app")
+    parser.add_argument("--routes", choices=ROUTES, nargs="+", default=list(ROUTES),
+                        help="Routes to measure (default: all)")
+    parser.add_argument("--data-dir", help="Data directory to use (default: a new temporary directory)")
+    parser.add_argument("--keep-data", action="store_true", help="Do not delete the temporary data directory")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measure the server's time to first response instead of the routes")
+    parser.add_argument("--startup-db-mb", type=int, default=1024,
+                        help="Size of the existing database started on, in MB (default: 1024)")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="Server starts per startup scenario (default: 5)")
+    return parser.parse_args(argv)
+
+
+def write_report(args, settings, results):
+    """Returns the report of a run, also written to args.output if given."""
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "settings": settings,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Results written to {args.output}")
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup:
+        return run_startup(args)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="flashcard-bench-")
+    # Must be set before the app modules read their configuration
+    os.environ["FLASHCARD_DATA_DIR"] = data_dir
+    sys.path.insert(0, APP_DIR)
+    import app as flashcard_app
+    import database
+    import jobs
+
+    results = []
+    try:
+        # The decks are imported before the first request would migrate the schema
+        database.init_db()
+        for size in args.deck_sizes:
+            print(f"Generating a deck of {size} cards in {data_dir}...")
+            deck = create_deck(database, size)
+            print(f"  imported in {deck['import_seconds']}s")
+            for client_name in args.clients:
+                driver_class = TestClientDriver if client_name == "test_client" else HttpServerDriver
+                driver = driver_class(flashcard_app.app)
+                try:
+                    for concurrency in args.concurrency:
+                        for route in args.routes:
+                            requests = args.upload_requests if route == "upload_file" else args.requests
+                            job_ids = []
+                            summary = run_route(driver, route, deck, requests, concurrency, args.seed, job_ids)
+                            if route == "upload_file":
+                                wait_for_imports(jobs)
+                                # An accepted upload whose import then fails is an error too
+                                summary["errors"] += failed_imports(jobs, job_ids)
+                            result = {
+                                "deck_size": size,
+                                "client": client_name,
+                                "concurrency": concurrency,
+                                "route": route,
+                                **summary,
+                            }
+                            results.append(result)
+                            print(
+                                f"  {client_name:<11} c={concurrency:<3} {route:<14} "
+                                f"{summary['throughput_rps']:>8} req/s  p50 {summary['p50_ms']} ms  "
+                                f"p95 {summary['p95_ms']} ms  p99 {summary['p99_ms']} ms  "
+                                f"errors {summary['errors']}"
+                            )
+                finally:
+                    driver.close()
+    finally:
+        if not args.data_dir and not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    settings = {
+        "deck_sizes": args.deck_sizes,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "upload_requests": args.upload_requests,
+        "upload_rows": UPLOAD_ROWS,
+        "seed": args.seed,
+    }
+    return write_report(args, settings, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import threading
+from collections import OrderedDict
+import metrics
+
+
+class LRUCache:
+    """
+    Bounded in-process cache that evicts the least recently used entries.
+
+    Holds at most max_entries values and max_bytes of their sizes (as given to
+    put()). Every worker process keeps its own copy, so nothing is invalidated
+    across processes: keys include a version that changes whenever the cached
+    value would (e.g. a card's version), and outdated entries are evicted once
+    they are no longer used. Lookups and evictions are counted under name in
+    the metrics. A limit of 0 disables the cache.
+    """
+
+    def __init__(self, name, max_entries, max_bytes):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, size), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value cached under key and marks it as recently used, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.CACHE_LOOKUPS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[0]
+
+    def put(self, key, value, size):
+        """Caches value under key, evicting the least recently used entries beyond the limits."""
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        evicted = 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted += 1
+            entries, total_bytes = len(self._entries), self._bytes
+        if evicted:
+            metrics.CACHE_EVICTIONS.inc(evicted, cache=self.name)
+        metrics.CACHE_ENTRIES.set(entries, cache=self.name)
+        metrics.CACHE_BYTES.set(total_bytes, cache=self.name)
@@ -1,23 +1,356 @@
 import sqlite3
 import os
+import json
+import time
+import queue
+import random
+import bisect
+import hashlib
+import threading
+import contextlib
+import urllib.parse
+from array import array
+from collections import deque, OrderedDict
+from flask import g, has_app_context
+import scheduler
+import metrics
+import writer
+
+try:
+    import fcntl  # POSIX only: serializes initialization across worker processes
+except ImportError:
+    fcntl = None
 
 # Define the path for the database file within the persistent volume
-DATABASE_DIR = "/data"
+DATABASE_DIR = os.environ.get("FLASHCARD_DATA_DIR", "/data")
 DATABASE_PATH = os.path.join(DATABASE_DIR, "flashcard.db")
+# Number of cards sent to the database per executemany() call during bulk imports
+IMPORT_BATCH_SIZE = 1000
+# Number of cards fetched per fetchmany() call while streaming an export
+EXPORT_BATCH_SIZE = 500
+# Due cards are counted up to this limit, so counting stays cheap on huge decks
+DUE_COUNT_LIMIT = 1000
+# Progress used to live in this JSON file; it is migrated into the 'progress' table once
+LEGACY_PROGRESS_PATH = os.path.join(DATABASE_DIR, "progress.json")
+# Held while initializing, so only one worker process runs the migrations
+INIT_LOCK_PATH = os.path.join(DATABASE_DIR, "init.lock")
+# Held around every import's insert or merge (see jobs), so a dataset still
+# pending while it is held was left behind by an import that never finished
+IMPORT_LOCK_PATH = os.path.join(DATABASE_DIR, "import.lock")
+# Exam sessions store their card IDs as one blob of signed 64-bit integers
+EXAM_CARD_ID_TYPECODE = "q"
+EXAM_CARD_ID_SIZE = array(EXAM_CARD_ID_TYPECODE).itemsize
+# Exam sessions older than this are deleted when a new one is created
+EXAM_SESSION_TTL_SECONDS = 7 * 24 * 60 * 60
 
+# --- SQLite Tuning (override through environment variables) ---
+# WAL lets readers run concurrently with a writer instead of blocking on it
+SQLITE_JOURNAL_MODE = os.environ.get("FLASHCARD_SQLITE_JOURNAL_MODE", "WAL")
+# NORMAL is durable in WAL mode except for the last commits on power loss
+SQLITE_SYNCHRONOUS = os.environ.get("FLASHCARD_SQLITE_SYNCHRONOUS", "NORMAL")
+# How long a connection waits for a lock held by another writer before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("FLASHCARD_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per connection, in KiB
+SQLITE_CACHE_SIZE_KIB = int(os.environ.get("FLASHCARD_SQLITE_CACHE_SIZE_KIB", "16384"))
+# Bytes of the database file read through memory mapping (0 disables it)
+SQLITE_MMAP_SIZE = int(os.environ.get("FLASHCARD_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Idle connections kept open for reuse by later requests
+CONNECTION_POOL_SIZE = int(os.environ.get("FLASHCARD_CONNECTION_POOL_SIZE", "8"))
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    # Ensure the /data directory exists (important for the first run)
-    os.makedirs(DATABASE_DIR, exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+# --- Dataset Shards ---
+# With FLASHCARD_DATASET_SHARDS=1, each dataset created from then on keeps its
+# cards, their search index and their answer log in a file of its own, so
+# deleting it removes a file instead of running a cascading delete, and its
+# imports do not hold the main database's write lock. Datasets created before
+# stay in the main database; both kinds can be used side by side.
+DATASET_SHARDS = os.environ.get("FLASHCARD_DATASET_SHARDS", "0") == "1"
+SHARD_DIR = os.path.join(DATABASE_DIR, "datasets")
+# SQLite's default build attaches at most this many databases to one connection
+SQLITE_MAX_ATTACHED = 10
+# Shards kept attached per connection once used; least recently used ones are detached
+SHARD_CACHE_SIZE = min(int(os.environ.get("FLASHCARD_SHARD_CACHE_SIZE", "8")), SQLITE_MAX_ATTACHED)
+# Card IDs of a shard start at dataset_id << SHARD_ID_BITS, so a card ID alone
+# tells which shard holds the card (0 for cards in the main database)
+SHARD_ID_BITS = 32
+
+_connection_pool = queue.LifoQueue(maxsize=CONNECTION_POOL_SIZE)
+_thread_local = threading.local()
+_database_dir_ready = False
+# Set once this process found the schema up to date (see ensure_schema)
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _open_connection(path=DATABASE_PATH):
+    """Opens a new, fully configured connection to the SQLite database (or a shard at path)."""
+    global _database_dir_ready
+    if not _database_dir_ready:
+        # Ensure the /data directory exists (important for the first run)
+        os.makedirs(DATABASE_DIR, exist_ok=True)
+        _database_dir_ready = True
+    # Pooled connections are handed from one request thread to the next,
+    # but are only ever used by one thread at a time
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        # Times every statement for the /metrics endpoint
+        factory=metrics.InstrumentedConnection,
+    )
     # Return rows as dictionary-like objects
     conn.row_factory = sqlite3.Row
     # Enable foreign key constraint enforcement (good practice)
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    # Dataset IDs of the shards attached to this connection, least recently used first
+    conn.attached_shards = OrderedDict()
+    return conn
+
+
+def get_db_connection():
+    """
+    Returns the connection of the current request or thread, creating it on first use.
+
+    Inside a Flask app context the connection is taken from a pool and handed back
+    by close_db_connection() when the context is torn down. Outside of Flask (scripts,
+    background threads) each thread keeps its own connection open. Callers must not
+    close the returned connection.
+    """
+    if has_app_context():
+        conn = g.get("_database_connection")
+        if conn is None:
+            try:
+                conn = _connection_pool.get_nowait()
+            except queue.Empty:
+                conn = _open_connection()
+            g._database_connection = conn
+        return conn
+
+    conn = getattr(_thread_local, "connection", None)
+    if conn is None:
+        conn = _open_connection()
+        _thread_local.connection = conn
+    return conn
+
+
+def close_db_connection(exception=None):
+    """Returns the app context's connection to the pool (registered as a teardown handler)."""
+    conn = g.pop("_database_connection", None)
+    if conn is None:
+        return
+    if conn.in_transaction:
+        # Never hand a half-finished transaction to the next request
+        conn.rollback()
+    try:
+        _connection_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def init_app(app):
+    """Checks the schema before the first request and ties the connection lifecycle to the Flask app context."""
+    app.before_request(_ensure_schema_before_request)
+    app.teardown_appcontext(close_db_connection)
+
+
+def _ensure_schema_before_request():
+    # Returns nothing: a value returned by a before_request handler replaces the response
+    ensure_schema()
+
+
+# --- Shard Attachment ---
+# A shard is attached to a connection as shard_<dataset_id> the first time it is
+# needed and stays attached for later requests, up to SHARD_CACHE_SIZE shards
+# per connection. Queries name a dataset's tables {schema}.cards etc., where
+# schema is "main" for datasets kept in the main database.
+
+# Triggers stored in a shard cannot reach the main database, so these are created
+# as temporary triggers on every connection that writes to a shard. Like the
+# triggers on the main cards table, they keep the dataset's counters and version up to date.
+_SHARD_TRIGGERS = {
+    "count_insert": """
+        AFTER INSERT ON {schema}.cards
+        BEGIN
+            UPDATE datasets
+            SET card_count = card_count + 1, review_count = review_count + (NEW.mark_for_review = 1)
+            WHERE id = NEW.dataset_id;
+        END
+    """,
+    "count_delete": """
+        AFTER DELETE ON {schema}.cards
+        BEGIN
+            UPDATE datasets
+            SET card_count = card_count - 1, review_count = review_count - (OLD.mark_for_review = 1)
+            WHERE id = OLD.dataset_id;
+        END
+    """,
+    "count_review": """
+        AFTER UPDATE OF mark_for_review ON {schema}.cards
+        WHEN (OLD.mark_for_review = 1) IS NOT (NEW.mark_for_review = 1)
+        BEGIN
+            UPDATE datasets
+            SET review_count = review_count + (NEW.mark_for_review = 1) - (OLD.mark_for_review = 1)
+            WHERE id = NEW.dataset_id;
+        END
+    """,
+    "bump_dataset_version": """
+        AFTER UPDATE OF notes, mark_for_review ON {schema}.cards
+        BEGIN
+            UPDATE datasets SET version = version + 1 WHERE id = NEW.dataset_id;
+        END
+    """,
+}
+
+
+def shard_path(dataset_id):
+    """Returns the path of the file holding a sharded dataset."""
+    return os.path.join(SHARD_DIR, f"{dataset_id}.db")
+
+
+def _shard_uri(dataset_id, mode="rw"):
+    """Returns a URI opening a dataset's shard without creating it if it is missing."""
+    return f"file:{urllib.parse.quote(shard_path(dataset_id))}?mode={mode}"
+
+
+def _attach_shard(conn, dataset_id, write=False):
+    """
+    Returns the schema name of a dataset's shard on conn, attaching it first if needed.
+    Raises sqlite3.OperationalError if the shard file does not exist.
+
+    With write=True the counter triggers are created as well. They are checked on
+    every write, because rolling back the transaction that created them drops them.
+    Inside a transaction no shard can be detached, so when the connection has no
+    room left writer.TransactionFull is raised.
+    """
+    schema = f"shard_{dataset_id}"
+    shards = conn.attached_shards
+    if dataset_id in shards:
+        shards.move_to_end(dataset_id)
+    else:
+        if not conn.in_transaction:
+            _release_shards(conn, SHARD_CACHE_SIZE - 1)
+        elif len(shards) >= SQLITE_MAX_ATTACHED:
+            raise writer.TransactionFull(f"{len(shards)} shards are attached already.")
+        if dataset_id not in _upgraded_shards:
+            upgrade_shard(dataset_id)
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (_shard_uri(dataset_id),))
+        shards[dataset_id] = schema
+    if write:
+        for name, trigger in _SHARD_TRIGGERS.items():
+            conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS trg_{schema}_{name} {trigger.format(schema=schema)}")
+    return schema
+
+
+def _release_shards(conn, keep=SHARD_CACHE_SIZE):
+    """Detaches the least recently used shards of conn until at most keep are attached."""
+    if conn.in_transaction:
+        return
+    shards = conn.attached_shards
+    for dataset_id in list(shards)[: max(len(shards) - keep, 0)]:
+        schema = shards[dataset_id]
+        try:
+            for name in _SHARD_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS temp.trg_{schema}_{name}")
+            conn.execute(f"DETACH DATABASE {schema}")
+        except sqlite3.OperationalError:
+            continue  # Still read by an unfinished statement, e.g. a streaming export
+        del shards[dataset_id]
+
+
+def _dataset_schema(cursor, dataset_id, write=False):
+    """
+    Returns the schema holding a dataset's cards on the cursor's connection:
+    "main", or the name its shard is attached under. Returns None if the dataset
+    does not exist or is still being imported.
+    """
+    cursor.execute("SELECT sharded FROM datasets WHERE id = ? AND pending = 0", (dataset_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _attach_shard(cursor.connection, dataset_id, write) if row[0] else "main"
+
+
+def _card_schema(cursor, card_id, write=False):
+    """Returns the schema holding a card (see _dataset_schema), found from its ID alone."""
+    dataset_id = card_id >> SHARD_ID_BITS
+    return _dataset_schema(cursor, dataset_id, write) if dataset_id else "main"
+
+
+def _open_new_shard(dataset_id, path):
+    """
+    Creates an empty shard for a dataset at path, replacing any file left there,
+    and returns a connection to it.
+    """
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    remove_shard_files(path)
+    conn = _open_connection(path)
+    cursor = conn.cursor()
+    try:
+        _create_shard_schema(cursor, dataset_id)
+        conn.commit()
+    except BaseException:
+        conn.close()
+        raise
+    finally:
+        cursor.close()
     return conn
 
 
+def remove_shard_files(path):
+    """Removes a shard file together with its WAL and shared-memory files."""
+    for file_path in (path, f"{path}-wal", f"{path}-shm", f"{path}-journal"):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+# --- Write Queue ---
+# The short writes made while studying (notes, review flags, grades, progress,
+# answers, single cards and datasets) all run on one writer thread per process,
+# which commits whatever has queued up in a single transaction (see
+# writer.WriteQueue). Request threads wait for their own write to be committed,
+# but no longer compete for the SQLite write lock or pay one fsync each.
+# Imports and merges write through it as well, one batch of cards per operation
+# (see import_dataset and merge_dataset), so this thread is the only one that
+# holds the main database's write lock, and never for long.
+# Shards cannot be detached during a transaction, so the writer's connection
+# drops the ones beyond SHARD_CACHE_SIZE before each transaction begins.
+_write_queue = writer.WriteQueue("database", _open_connection, prepare=_release_shards)
+
+
+def flush_writes(timeout=None):
+    """Waits until every write queued so far has been committed. Returns False on timeout."""
+    return _write_queue.flush(timeout)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on the file at path while the block runs.
+
+    The lock is shared by all threads and processes using the same path, so
+    it serializes work across worker processes. Without fcntl (non-POSIX
+    systems) it only creates the file and does not lock.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+
+
+# --- Schema Migrations ---
+# Each migration runs exactly once, in order, inside its own transaction.
+# The number of applied migrations is stored in SQLite's PRAGMA user_version,
+# so append new migrations to the end of MIGRATIONS and never reorder them.
+
+
 def _table_has_column(cursor, table_name, column_name):
     """Checks if a table has a specific column."""
     cursor.execute(f"PRAGMA table_info({table_name})")
@@ -25,82 +358,615 @@ def _table_has_column(cursor, table_name, column_name):
     return column_name in columns
 
 
-def init_db():
-    """Initializes the database by creating tables and adding columns if they don't exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _migrate_progress_file(cursor):
+    """
+    Copies progress from the legacy progress.json file into the 'progress' table.
+    The file is renamed afterwards, so the migration only ever runs once.
+    """
+    if not os.path.exists(LEGACY_PROGRESS_PATH):
+        return
     try:
-        # Create datasets table
+        with open(LEGACY_PROGRESS_PATH, "r") as f:
+            content = f.read()
+        legacy_progress = json.loads(content) if content else {}
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Skipping progress migration, cannot read {LEGACY_PROGRESS_PATH}: {e}")
+        return
+
+    if not isinstance(legacy_progress, dict):
+        print(f"Skipping progress migration, {LEGACY_PROGRESS_PATH} does not hold a JSON object.")
+        return
+
+    print(f"Migrating {len(legacy_progress)} progress entries from {LEGACY_PROGRESS_PATH}...")
+    skipped = 0
+    for dataset_id, card_index in legacy_progress.items():
+        # A malformed entry must not fail the migration (and with it every request)
+        try:
+            dataset_id, card_index = int(dataset_id), int(card_index)
+        except (TypeError, ValueError):
+            print(f"Skipping malformed progress entry {dataset_id!r}: {card_index!r}")
+            skipped += 1
+            continue
+        # Skip entries of datasets that were deleted in the meantime
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO progress (dataset_id, card_index)
+            SELECT id, ? FROM datasets WHERE id = ?
+            """,
+            (card_index, dataset_id),
+        )
+    os.replace(LEGACY_PROGRESS_PATH, LEGACY_PROGRESS_PATH + ".migrated")
+    print(f"Progress migration complete ({skipped} malformed entries skipped).")
+
+
+def _migration_base_schema(cursor):
+    """Create the datasets and cards tables (notes and review flag included)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS datasets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dataset_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            choice1 TEXT NOT NULL,
+            choice2 TEXT NOT NULL,
+            choice3 TEXT NOT NULL,
+            choice4 TEXT NOT NULL,
+            choice5 TEXT,
+            FOREIGN KEY (dataset_id) REFERENCES datasets (id) ON DELETE CASCADE
+        )
+    """)
+    # Databases created before migrations existed may lack the later columns
+    if not _table_has_column(cursor, "cards", "notes"):
+        cursor.execute("ALTER TABLE cards ADD COLUMN notes TEXT")
+    if not _table_has_column(cursor, "cards", "mark_for_review"):
+        # Add column with default value FALSE (0 for SQLite BOOLEAN)
+        cursor.execute("ALTER TABLE cards ADD COLUMN mark_for_review BOOLEAN DEFAULT 0")
+
+
+def _migration_positions_and_progress(cursor):
+    """Add card positions and move progress from progress.json into a table."""
+    # 0-based ordinal of the card within its dataset
+    if not _table_has_column(cursor, "cards", "position"):
+        cursor.execute("ALTER TABLE cards ADD COLUMN position INTEGER")
+        # Backfill existing cards in their current ORDER BY id order
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS datasets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL
-            )
+            UPDATE cards SET position = ordered.rn
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY dataset_id ORDER BY id) - 1 AS rn
+                FROM cards
+            ) AS ordered
+            WHERE cards.id = ordered.id
         """)
+    # Last viewed card index per dataset
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS progress (
+            dataset_id INTEGER PRIMARY KEY,
+            card_index INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (dataset_id) REFERENCES datasets (id) ON DELETE CASCADE
+        )
+    """)
+    _migrate_progress_file(cursor)
 
-        # Create cards table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cards (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                dataset_id INTEGER NOT NULL,
-                question TEXT NOT NULL,
-                correct_answer TEXT NOT NULL,
-                choice1 TEXT NOT NULL,
-                choice2 TEXT NOT NULL,
-                choice3 TEXT NOT NULL,
-                choice4 TEXT NOT NULL,
-                choice5 TEXT,
-                FOREIGN KEY (dataset_id) REFERENCES datasets (id) ON DELETE CASCADE
-            )
+
+def _migration_card_indexes(cursor):
+    """Index cards by dataset so deck and review lookups avoid full table scans."""
+    # Serves single-card lookups by position, whole-deck reads in position
+    # order and the dataset_id lookups of ON DELETE CASCADE
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cards_dataset_position ON cards (dataset_id, position)"
+    )
+    # Partial index holding only review-marked cards, used by review mode
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cards_review_position ON cards (dataset_id, position)
+        WHERE mark_for_review = 1
+    """)
+
+
+def _migration_version_counters(cursor):
+    """Add per-dataset and catalog version counters used for HTTP caching."""
+    cursor.execute("ALTER TABLE datasets ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    # Single-row table whose version changes whenever the list of datasets does
+    cursor.execute("""
+        CREATE TABLE catalog_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT INTO catalog_state (id, version) VALUES (1, 0)")
+    # Note and review flag edits change what a dataset's pages show
+    cursor.execute("""
+        CREATE TRIGGER trg_cards_bump_dataset_version
+        AFTER UPDATE OF notes, mark_for_review ON cards
+        BEGIN
+            UPDATE datasets SET version = version + 1 WHERE id = NEW.dataset_id;
+        END
+    """)
+    for event in ("INSERT", "DELETE", "UPDATE"):
+        cursor.execute(f"""
+            CREATE TRIGGER trg_datasets_bump_catalog_version_{event.lower()}
+            AFTER {event} ON datasets
+            BEGIN
+                UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+            END
         """)
 
-        # Add 'notes' column to cards table if it doesn't exist
-        if not _table_has_column(cursor, "cards", "notes"):
-            print("Adding 'notes' column to 'cards' table...")
-            cursor.execute("ALTER TABLE cards ADD COLUMN notes TEXT")
-            print("'notes' column added.")
-        else:
-            print("'notes' column already exists in 'cards' table.")
-
-        # Add 'mark_for_review' column to cards table if it doesn't exist
-        if not _table_has_column(cursor, "cards", "mark_for_review"):
-            print("Adding 'mark_for_review' column to 'cards' table...")
-            # Add column with default value FALSE (0 for SQLite BOOLEAN)
-            cursor.execute(
-                "ALTER TABLE cards ADD COLUMN mark_for_review BOOLEAN DEFAULT 0"
+
+def _migration_review_schedule(cursor):
+    """Add SM-2 scheduling state to cards and index them by due time."""
+    cursor.execute(
+        f"ALTER TABLE cards ADD COLUMN ease REAL NOT NULL DEFAULT {scheduler.DEFAULT_EASE}"
+    )
+    cursor.execute("ALTER TABLE cards ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE cards ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0")
+    # Unix timestamp of the next review; 0 means never studied, i.e. due now
+    cursor.execute("ALTER TABLE cards ADD COLUMN due_at INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("CREATE INDEX idx_cards_dataset_due ON cards (dataset_id, due_at)")
+
+
+# Card columns indexed for full-text search, in cards_fts column order
+FTS_COLUMNS = (
+    "question",
+    "correct_answer",
+    "choice1",
+    "choice2",
+    "choice3",
+    "choice4",
+    "choice5",
+    "notes",
+)
+
+
+def _migration_full_text_search(cursor):
+    """Add an FTS5 index over card text, kept in sync with triggers."""
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"NEW.{column}" for column in FTS_COLUMNS)
+    old_values = ", ".join(f"OLD.{column}" for column in FTS_COLUMNS)
+    # External content table: the text lives in 'cards', FTS5 only stores the index
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE cards_fts USING fts5(
+            {columns},
+            content='cards', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cards_fts_insert AFTER INSERT ON cards
+        BEGIN
+            INSERT INTO cards_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cards_fts_delete AFTER DELETE ON cards
+        BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+        END
+    """)
+    # Only text edits re-index a card, not review flags or scheduling
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cards_fts_update AFTER UPDATE OF {columns} ON cards
+        BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+            INSERT INTO cards_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+        END
+    """)
+    # Index the cards that already exist
+    cursor.execute("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')")
+
+
+def _card_hashes(card):
+    """
+    Returns (question_hash, content_hash) of a card dict. Re-imported cards
+    are matched to stored ones by question (ignoring whitespace differences) and
+    rewritten only if their question, answer or choices changed.
+    """
+    question = " ".join(card["question"].split())
+    question_hash = hashlib.blake2b(question.encode("utf-8"), digest_size=16).hexdigest()
+    content = "\x1f".join(
+        card.get(column) or ""
+        for column in ("question", "correct_answer", "choice1", "choice2", "choice3", "choice4", "choice5")
+    )
+    content_hash = hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+    return question_hash, content_hash
+
+
+def _migration_content_hashes(cursor):
+    """Add question and content hashes to cards, used to merge re-imported datasets."""
+    cursor.execute("ALTER TABLE cards ADD COLUMN question_hash TEXT")
+    cursor.execute("ALTER TABLE cards ADD COLUMN content_hash TEXT")
+    update_cursor = cursor.connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, question, correct_answer, choice1, choice2, choice3, choice4, choice5 FROM cards"
+        )
+        while True:
+            rows = cursor.fetchmany(IMPORT_BATCH_SIZE)
+            if not rows:
+                break
+            update_cursor.executemany(
+                "UPDATE cards SET question_hash = ?, content_hash = ? WHERE id = ?",
+                [(*_card_hashes(dict(row)), row["id"]) for row in rows],
             )
-            print("'mark_for_review' column added.")
-        else:
-            print("'mark_for_review' column already exists in 'cards' table.")
+    finally:
+        update_cursor.close()
+    # Covers everything merge_dataset reads about the existing cards
+    cursor.execute("""
+        CREATE INDEX idx_cards_dataset_hashes
+        ON cards (dataset_id, question_hash, content_hash, position)
+    """)
 
-        conn.commit()
+
+def _migration_dataset_statistics(cursor):
+    """Keep card and review counts per dataset up to date with triggers."""
+    cursor.execute("ALTER TABLE datasets ADD COLUMN card_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE datasets ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE datasets SET card_count = stats.card_count, review_count = stats.review_count
+        FROM (
+            SELECT dataset_id, COUNT(*) AS card_count, SUM(mark_for_review = 1) AS review_count
+            FROM cards GROUP BY dataset_id
+        ) AS stats
+        WHERE datasets.id = stats.dataset_id
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_cards_count_insert AFTER INSERT ON cards
+        BEGIN
+            UPDATE datasets
+            SET card_count = card_count + 1, review_count = review_count + (NEW.mark_for_review = 1)
+            WHERE id = NEW.dataset_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_cards_count_delete AFTER DELETE ON cards
+        BEGIN
+            UPDATE datasets
+            SET card_count = card_count - 1, review_count = review_count - (OLD.mark_for_review = 1)
+            WHERE id = OLD.dataset_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_cards_count_review AFTER UPDATE OF mark_for_review ON cards
+        WHEN (OLD.mark_for_review = 1) IS NOT (NEW.mark_for_review = 1)
+        BEGIN
+            UPDATE datasets
+            SET review_count = review_count + (NEW.mark_for_review = 1) - (OLD.mark_for_review = 1)
+            WHERE id = NEW.dataset_id;
+        END
+    """)
+    # The index page shows the last studied card, so progress changes it too
+    cursor.execute("""
+        CREATE TRIGGER trg_progress_bump_catalog_version_insert AFTER INSERT ON progress
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_progress_bump_catalog_version_update AFTER UPDATE ON progress
+        WHEN OLD.card_index IS NOT NEW.card_index
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+    """)
+
+
+def _migration_answer_events(cursor):
+    """Add the answer event log and its per-card and per-dataset accuracy aggregates."""
+    _create_answer_log(cursor, datasets_table="datasets")
+
+
+def _create_answer_log(cursor, datasets_table):
+    """
+    Creates the answer event log and its aggregates. dataset_answer_stats refers to
+    datasets_table, or to no table in a shard (which has no datasets table).
+    """
+    # Append-only: one row per answer chosen while studying
+    cursor.execute("""
+        CREATE TABLE answer_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            card_id INTEGER NOT NULL,
+            dataset_id INTEGER NOT NULL,
+            chosen_answer TEXT NOT NULL,
+            correct INTEGER NOT NULL,
+            latency_ms INTEGER,
+            answered_at INTEGER NOT NULL,
+            FOREIGN KEY (card_id) REFERENCES cards (id) ON DELETE CASCADE
+        )
+    """)
+    # Needed by ON DELETE CASCADE, which otherwise scans the whole log per deleted card
+    cursor.execute("CREATE INDEX idx_answer_events_card ON answer_events (card_id)")
+    for scope, key in (("card", "card_id"), ("dataset", "dataset_id")):
+        parent = "cards" if scope == "card" else datasets_table
+        extra_column = "dataset_id INTEGER NOT NULL," if scope == "card" else ""
+        foreign_key = f"FOREIGN KEY ({key}) REFERENCES {parent} (id) ON DELETE CASCADE" if parent else ""
+        cursor.execute(f"""
+            CREATE TABLE {scope}_answer_stats (
+                {key} INTEGER PRIMARY KEY,
+                {extra_column}
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct INTEGER NOT NULL DEFAULT 0,
+                total_latency_ms INTEGER NOT NULL DEFAULT 0,
+                last_answered_at INTEGER{"," if foreign_key else ""}
+                {foreign_key}
+            )
+        """)
+    cursor.execute("CREATE INDEX idx_card_answer_stats_dataset ON card_answer_stats (dataset_id)")
+    # The aggregates are updated incrementally, in the transaction that logs the event
+    cursor.execute("""
+        CREATE TRIGGER trg_answer_events_stats AFTER INSERT ON answer_events
+        BEGIN
+            INSERT INTO card_answer_stats (card_id, dataset_id, attempts, correct, total_latency_ms, last_answered_at)
+            VALUES (NEW.card_id, NEW.dataset_id, 1, NEW.correct, COALESCE(NEW.latency_ms, 0), NEW.answered_at)
+            ON CONFLICT (card_id) DO UPDATE SET
+                attempts = attempts + 1,
+                correct = correct + excluded.correct,
+                total_latency_ms = total_latency_ms + excluded.total_latency_ms,
+                last_answered_at = MAX(last_answered_at, excluded.last_answered_at);
+            INSERT INTO dataset_answer_stats (dataset_id, attempts, correct, total_latency_ms, last_answered_at)
+            VALUES (NEW.dataset_id, 1, NEW.correct, COALESCE(NEW.latency_ms, 0), NEW.answered_at)
+            ON CONFLICT (dataset_id) DO UPDATE SET
+                attempts = attempts + 1,
+                correct = correct + excluded.correct,
+                total_latency_ms = total_latency_ms + excluded.total_latency_ms,
+                last_answered_at = MAX(last_answered_at, excluded.last_answered_at);
+        END
+    """)
+
+
+def _migration_exam_sessions(cursor):
+    """Add exam sessions holding a sampled, shuffled list of card IDs."""
+    # card_ids is an array('q') blob: the card at exam position i is read with
+    # substr(card_ids, i * 8 + 1, 8), without touching the rest of the session
+    cursor.execute("""
+        CREATE TABLE exam_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dataset_ids TEXT NOT NULL,
+            card_count INTEGER NOT NULL,
+            card_ids BLOB NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_exam_sessions_created ON exam_sessions (created_at)")
+
+
+def _migration_dataset_shards(cursor):
+    """Record which datasets keep their cards in a shard file of their own."""
+    cursor.execute("ALTER TABLE datasets ADD COLUMN sharded INTEGER NOT NULL DEFAULT 0")
+
+
+def _migration_card_versions(cursor):
+    """Add a per-card version counter, bumped whenever the card's displayed contents change."""
+    cursor.execute("ALTER TABLE cards ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    # Keys the rendered card fragments cached by the app, so any edit of a card
+    # (notes, review flag, or its text through a merge) must change it
+    cursor.execute("""
+        CREATE TRIGGER trg_cards_bump_version
+        AFTER UPDATE OF question, correct_answer, choice1, choice2, choice3, choice4, choice5,
+            notes, mark_for_review ON cards
+        BEGIN
+            UPDATE cards SET version = version + 1 WHERE id = NEW.id;
+        END
+    """)
+
+
+def _migration_pending_datasets(cursor):
+    """Let imports write a new dataset's cards over several transactions before it is shown."""
+    cursor.execute("ALTER TABLE datasets ADD COLUMN pending INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_positions_and_progress,
+    _migration_card_indexes,
+    _migration_version_counters,
+    _migration_review_schedule,
+    _migration_full_text_search,
+    _migration_content_hashes,
+    _migration_dataset_statistics,
+    _migration_answer_events,
+    _migration_exam_sessions,
+    _migration_dataset_shards,
+    _migration_card_versions,
+    _migration_pending_datasets,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+# --- Shard Schema ---
+# Shards are created with the schema of version 1 and then migrated like the
+# main database, with their version stored in their own user_version. Existing
+# shards are migrated the first time a process attaches them.
+SHARD_MIGRATIONS = [
+    _migration_card_versions,
+]
+SHARD_SCHEMA_VERSION = 1 + len(SHARD_MIGRATIONS)
+# Dataset IDs of the shards this process found up to date or migrated
+_upgraded_shards = set()
+
+
+def _create_shard_schema(cursor, dataset_id):
+    """Creates the tables of a new shard: the dataset's cards, their search index and the answer log."""
+    # The columns of the main cards table after all migrations, in the same order,
+    # so rows read from either look the same
+    cursor.execute(f"""
+        CREATE TABLE cards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dataset_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            choice1 TEXT NOT NULL,
+            choice2 TEXT NOT NULL,
+            choice3 TEXT NOT NULL,
+            choice4 TEXT NOT NULL,
+            choice5 TEXT,
+            notes TEXT,
+            mark_for_review BOOLEAN DEFAULT 0,
+            position INTEGER,
+            ease REAL NOT NULL DEFAULT {scheduler.DEFAULT_EASE},
+            interval_days INTEGER NOT NULL DEFAULT 0,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            due_at INTEGER NOT NULL DEFAULT 0,
+            question_hash TEXT,
+            content_hash TEXT
+        )
+    """)
+    # Card IDs continue from here
+    cursor.execute(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES ('cards', ?)", (dataset_id << SHARD_ID_BITS,)
+    )
+    _migration_card_indexes(cursor)
+    cursor.execute("CREATE INDEX idx_cards_dataset_due ON cards (dataset_id, due_at)")
+    cursor.execute("""
+        CREATE INDEX idx_cards_dataset_hashes
+        ON cards (dataset_id, question_hash, content_hash, position)
+    """)
+    _migration_full_text_search(cursor)
+    _create_answer_log(cursor, datasets_table=None)
+    _migrate_shard_schema(cursor, 1)
+
+
+def _migrate_shard_schema(cursor, version):
+    """Applies the SHARD_MIGRATIONS after version to the shard of cursor's connection."""
+    for migration in SHARD_MIGRATIONS[version - 1:]:
+        migration(cursor)
+    cursor.execute(f"PRAGMA user_version = {SHARD_SCHEMA_VERSION}")
+
+
+def upgrade_shard(dataset_id):
+    """
+    Applies pending shard migrations to a dataset's shard.
+    Raises sqlite3.OperationalError if the shard file does not exist.
+    """
+    # A connection of its own: one that has the shard attached may be inside a
+    # transaction that must not see the schema change halfway
+    conn = sqlite3.connect(_shard_uri(dataset_id), uri=True, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] < SHARD_SCHEMA_VERSION:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Re-read under the lock, another process may have migrated it meanwhile
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            if version < SHARD_SCHEMA_VERSION:
+                print(f"Migrating the shard of dataset {dataset_id} to version {SHARD_SCHEMA_VERSION}.")
+                _migrate_shard_schema(cursor, version)
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    _upgraded_shards.add(dataset_id)
+
+
+def _get_schema_version(cursor):
+    """Returns the number of migrations applied to the database."""
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def init_db():
+    """
+    Initializes the database by applying any migrations that have not run yet.
+    Returns True if the schema is up to date afterwards. Datasets left pending
+    by an import that never finished are removed as well, so they do not
+    outlive a restart.
+
+    An up-to-date database costs a PRAGMA user_version read and a look for
+    pending datasets. Otherwise the migrations run under INIT_LOCK_PATH, so
+    concurrent processes take turns and all but the first find the schema up to
+    date. A dedicated connection is used and closed again, so a process that
+    forks workers afterwards (e.g. the gunicorn master) never hands an open
+    SQLite connection to its children.
+    """
+    conn = _open_connection()
+    try:
+        if _get_schema_version(conn.cursor()) < SCHEMA_VERSION:
+            with file_lock(INIT_LOCK_PATH):
+                if not _apply_migrations(conn):
+                    return False
+        _discard_unfinished_imports(conn)
+        return True
+    finally:
+        conn.close()
+
+
+def ensure_schema():
+    """
+    Runs init_db() once per process, the first time the database is needed
+    (before the first request, see init_app), instead of when the app is imported.
+    Returns True if the schema is up to date.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if not _schema_ready:
+            # Retried by the next request if the migrations failed
+            _schema_ready = init_db()
+    return _schema_ready
+
+
+def _apply_migrations(conn):
+    """Applies the pending MIGRATIONS one transaction at a time. Returns False if one failed."""
+    cursor = conn.cursor()
+    try:
+        # Another process may have applied them while this one waited for the lock
+        if _get_schema_version(cursor) >= SCHEMA_VERSION:
+            print(f"Database schema is up to date (version {SCHEMA_VERSION}).")
+            return True
+
+        while True:
+            # Take the write lock first so concurrent initializers apply each
+            # migration only once, then re-read the version under the lock
+            cursor.execute("BEGIN IMMEDIATE")
+            version = _get_schema_version(cursor)
+            if version >= SCHEMA_VERSION:
+                conn.commit()
+                break
+            migration = MIGRATIONS[version]
+            print(f"Applying database migration {version + 1}: {migration.__doc__}")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
         print("Database initialized successfully.")
-    except sqlite3.Error as e:
+        return True
+    except (sqlite3.Error, OSError) as e:
+        # OSError: a migration that moves files, e.g. _migrate_progress_file
         print(f"Database initialization error: {e}")
         conn.rollback()  # Rollback changes on error
+        return False
     finally:
-        conn.close()
+        cursor.close()
 
 
 def add_dataset(name):
     """Adds a new dataset to the database. Returns the new dataset ID or None if name exists."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO datasets (name) VALUES (?)", (name,))
-        conn.commit()
-        dataset_id = cursor.lastrowid
-        print(f"Dataset '{name}' added with ID: {dataset_id}")
-        return dataset_id
+        dataset_id = _write_queue.call(_add_dataset, name)
     except sqlite3.IntegrityError:
         print(f"Dataset name '{name}' already exists.")
         return None
     except sqlite3.Error as e:
         print(f"Error adding dataset '{name}': {e}")
-        conn.rollback()
         return None
-    finally:
-        conn.close()
+    print(f"Dataset '{name}' added with ID: {dataset_id}")
+    return dataset_id
+
+
+def _add_dataset(cursor, name):
+    cursor.execute("INSERT INTO datasets (name, sharded) VALUES (?, ?)", (name, 1 if DATASET_SHARDS else 0))
+    dataset_id = cursor.lastrowid
+    if DATASET_SHARDS:
+        # Should the transaction fail, the ID is handed out again and the file replaced
+        _open_new_shard(dataset_id, shard_path(dataset_id)).close()
+    return dataset_id
 
 
 def add_card(
@@ -115,64 +981,556 @@ def add_card(
     notes="",
 ):
     """Adds a new card to a specific dataset, including optional notes. mark_for_review defaults to False."""
+    card = {
+        "dataset_id": dataset_id,
+        "question": question,
+        "correct_answer": correct_answer,
+        "choice1": choice1,
+        "choice2": choice2,
+        "choice3": choice3,
+        "choice4": choice4,
+        "choice5": choice5,
+        "notes": notes,
+    }
+    try:
+        _write_queue.call(_add_card, card)
+        # print(f"Card added to dataset {dataset_id}: {question[:30]}...") # Optional logging
+        return True
+    except sqlite3.Error as e:
+        print(f"Error adding card to dataset {dataset_id}: {e}")
+        return False
+
+
+def _add_card(cursor, card):
+    schema = _dataset_schema(cursor, card["dataset_id"], write=True)
+    if schema is None:
+        raise sqlite3.IntegrityError(f"Dataset {card['dataset_id']} does not exist.")
+    question_hash, content_hash = _card_hashes(card)
+    # Explicitly list columns, rely on DB default for mark_for_review.
+    # New cards are appended after the last position of the dataset.
+    cursor.execute(
+        f"""
+        INSERT INTO {schema}.cards (dataset_id, position, question, correct_answer, choice1, choice2, choice3, choice4, choice5, notes, question_hash, content_hash)
+        VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM {schema}.cards WHERE dataset_id = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        (
+            card["dataset_id"],
+            card["dataset_id"],
+            card["question"],
+            card["correct_answer"],
+            card["choice1"],
+            card["choice2"],
+            card["choice3"],
+            card["choice4"],
+            card["choice5"],
+            card["notes"],
+            question_hash,
+            content_hash,
+        ),
+    )
+    # The dataset's pages change, so invalidate their cached copies
+    cursor.execute(
+        "UPDATE datasets SET version = version + 1 WHERE id = ?", (card["dataset_id"],)
+    )
+
+
+def import_dataset(name, card_rows, batch_size=IMPORT_BATCH_SIZE, on_batch=None):
+    """
+    Creates a dataset and bulk-inserts its cards.
+
+    card_rows is any iterable of dicts with the add_card keyword arguments (plus an
+    optional truthy mark_for_review) and is
+    consumed lazily, batch_size rows at a time, so it can stream from an upload.
+    on_batch, if given, is called with the number of cards inserted so far after
+    every batch (the cards only become visible once all of them are inserted).
+    Returns (dataset_id, card_count), or (None, 0) if the dataset name already exists.
+    If iterating card_rows or inserting fails, nothing (not even the dataset row)
+    is kept and the exception is re-raised to the caller.
+
+    The dataset row is added as pending, hidden from every query, and each batch of
+    cards is committed by the writer thread on its own, so study writes are never
+    kept waiting for the whole import. The dataset is shown once its last batch is
+    in. A pending dataset left behind by a process that died mid-import is removed
+    by discard_pending_datasets().
+
+    With DATASET_SHARDS the cards are written to a new shard instead, see _import_shard.
+    """
+    if DATASET_SHARDS:
+        return _import_shard(name, card_rows, batch_size, on_batch)
+
+    try:
+        dataset_id = _write_queue.call(_add_pending_dataset, name)
+    except sqlite3.IntegrityError:
+        print(f"Dataset name '{name}' already exists.")
+        return None, 0
+    try:
+        card_count, _ = _insert_cards(
+            lambda batch: _write_queue.call(_insert_card_batch, batch),
+            dataset_id, card_rows, batch_size, on_batch,
+        )
+        _write_queue.call(_publish_dataset, dataset_id)
+    except Exception as e:
+        print(f"Error importing dataset '{name}', removing its cards: {e}")
+        _discard_pending_dataset(dataset_id)
+        raise
+    print(f"Dataset '{name}' imported with ID {dataset_id} and {card_count} cards.")
+    return dataset_id, card_count
+
+
+def _add_pending_dataset(cursor, name):
+    cursor.execute("INSERT INTO datasets (name, pending) VALUES (?, 1)", (name,))
+    return cursor.lastrowid
+
+
+def _publish_dataset(cursor, dataset_id):
+    # Also bumps the catalog version, so the dataset list shows it
+    cursor.execute("UPDATE datasets SET pending = 0 WHERE id = ?", (dataset_id,))
+
+
+def discard_pending_datasets():
+    """
+    Removes the datasets left pending by imports that never finished (e.g. the
+    process was killed mid-import), together with their cards. Call it only
+    while no import can be running, i.e. with IMPORT_LOCK_PATH held.
+    """
+    try:
+        dataset_ids = _pending_dataset_ids(get_db_connection())
+    except sqlite3.Error as e:
+        print(f"Error looking for unfinished imports: {e}")
+        return
+    for dataset_id in dataset_ids:
+        print(f"Removing dataset {dataset_id} left behind by an unfinished import.")
+        _discard_pending_dataset(dataset_id)
+
+
+def _discard_unfinished_imports(conn):
+    """
+    discard_pending_datasets() for init_db, on its own connection instead of the
+    writer. The import lock is only waited for if a dataset is pending at all.
+    """
+    try:
+        if not _pending_dataset_ids(conn):
+            return
+        with file_lock(IMPORT_LOCK_PATH):
+            for dataset_id in _pending_dataset_ids(conn):
+                print(f"Removing dataset {dataset_id} left behind by an unfinished import.")
+                while _delete_pending_cards(conn.cursor(), dataset_id, IMPORT_BATCH_SIZE):
+                    conn.commit()
+                _delete_pending_dataset(conn.cursor(), dataset_id)
+                conn.commit()
+    except sqlite3.Error as e:
+        # Hidden either way; removed by the next import or restart
+        print(f"Error removing unfinished imports: {e}")
+        conn.rollback()
+
+
+def _pending_dataset_ids(conn):
+    return [row["id"] for row in conn.execute("SELECT id FROM datasets WHERE pending = 1")]
+
+
+def _discard_pending_dataset(dataset_id):
+    """Deletes a pending dataset's cards batch by batch, then the dataset row itself."""
+    try:
+        while _write_queue.call(_delete_pending_cards, dataset_id, IMPORT_BATCH_SIZE):
+            pass
+        _write_queue.call(_delete_pending_dataset, dataset_id)
+    except (sqlite3.Error, writer.WriterBusy) as e:
+        # Hidden either way; removed by the next discard_pending_datasets()
+        print(f"Error removing pending dataset {dataset_id}: {e}")
+
+
+def _delete_pending_cards(cursor, dataset_id, limit):
+    cursor.execute(
+        """
+        DELETE FROM cards WHERE id IN (
+            SELECT cards.id FROM cards JOIN datasets ON datasets.id = cards.dataset_id
+            WHERE cards.dataset_id = ? AND datasets.pending = 1 LIMIT ?
+        )
+        """,
+        (dataset_id, limit),
+    )
+    return cursor.rowcount
+
+
+def _delete_pending_dataset(cursor, dataset_id):
+    cursor.execute("DELETE FROM datasets WHERE id = ? AND pending = 1", (dataset_id,))
+
+
+def _import_shard(name, card_rows, batch_size, on_batch):
+    """
+    import_dataset for a new sharded dataset. Its ID is reserved first, then the
+    cards are written to a new shard file without holding the main database's
+    write lock. Only once the shard is complete and in place is the dataset row
+    added, so the dataset appears with all of its cards at once.
+    """
+    if get_dataset_id_by_name(name) is not None:
+        print(f"Dataset name '{name}' already exists.")
+        return None, 0
+    dataset_id = _write_queue.call(_reserve_dataset_id)
+    path = shard_path(dataset_id)
+    build_path = f"{path}.importing"
+
+    conn = _open_new_shard(dataset_id, build_path)
+    cursor = conn.cursor()
+    try:
+        card_count, review_count = _insert_cards(
+            lambda batch: _insert_card_batch(cursor, batch), dataset_id, card_rows, batch_size, on_batch
+        )
+        conn.commit()
+    except Exception as e:
+        print(f"Error importing dataset '{name}', rolling back: {e}")
+        cursor.close()
+        conn.close()
+        remove_shard_files(build_path)
+        raise
+    cursor.close()
+    # Closing the only connection checkpoints the WAL into the file itself, so
+    # the file can be renamed into place
+    conn.close()
+    remove_shard_files(path)
+    os.replace(build_path, path)
+
+    try:
+        _write_queue.call(_add_shard_dataset, dataset_id, name, card_count, review_count)
+    except Exception as e:
+        remove_shard_files(path)
+        if isinstance(e, sqlite3.IntegrityError):
+            print(f"Dataset name '{name}' already exists.")
+            return None, 0
+        print(f"Error importing dataset '{name}', rolling back: {e}")
+        raise
+    print(f"Dataset '{name}' imported with ID {dataset_id} and {card_count} cards into {path}.")
+    return dataset_id, card_count
+
+
+def _reserve_dataset_id(cursor):
+    # AUTOINCREMENT never hands out an ID at or below the stored sequence value,
+    # so raising it reserves the next ID without inserting the row yet
+    cursor.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'datasets' RETURNING seq")
+    rows = cursor.fetchall()
+    if rows:
+        return rows[0][0]
+    cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM datasets")
+    dataset_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('datasets', ?)", (dataset_id,))
+    return dataset_id
+
+
+def _add_shard_dataset(cursor, dataset_id, name, card_count, review_count):
+    cursor.execute(
+        "INSERT INTO datasets (id, name, sharded, card_count, review_count) VALUES (?, ?, 1, ?, ?)",
+        (dataset_id, name, card_count, review_count),
+    )
+
+
+def _insert_cards(insert_batch, dataset_id, card_rows, batch_size, on_batch):
+    """
+    Inserts the cards of a new dataset batch by batch, numbering their positions
+    from 0: insert_batch is called with each list of card tuples (see
+    _insert_card_batch), then on_batch. Returns (card_count, review_count).
+    """
+    card_count = 0
+    review_count = 0
+    batch = []
+    for card in card_rows:
+        marked = 1 if card.get("mark_for_review") else 0
+        batch.append(
+            (
+                dataset_id,
+                card_count,  # Position of the card within the new dataset
+                card["question"],
+                card["correct_answer"],
+                card["choice1"],
+                card["choice2"],
+                card["choice3"],
+                card["choice4"],
+                card.get("choice5"),
+                card.get("notes", ""),
+                marked,
+                *_card_hashes(card),
+            )
+        )
+        card_count += 1
+        review_count += marked
+        if len(batch) >= batch_size:
+            insert_batch(batch)
+            batch = []
+            if on_batch:
+                on_batch(card_count)
+    if batch:
+        insert_batch(batch)
+        if on_batch:
+            on_batch(card_count)
+    return card_count, review_count
+
+
+def _insert_card_batch(cursor, batch, schema="main"):
+    """Inserts a batch of card tuples prepared by _insert_cards or merge_dataset."""
+    cursor.executemany(
+        f"""
+        INSERT INTO {schema}.cards (dataset_id, position, question, correct_answer, choice1, choice2, choice3, choice4, choice5, notes, mark_for_review, question_hash, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        batch,
+    )
+
+
+class MergeConflict(Exception):
+    """Raised by merge_dataset when cards were added to the dataset while the merge was prepared."""
+
+
+def merge_dataset(dataset_id, card_rows, batch_size=IMPORT_BATCH_SIZE, on_batch=None):
+    """
+    Updates an existing dataset in place from a fresh copy of its cards.
+
+    Cards are matched by question through the stored hashes (the nth occurrence of a
+    question matches the nth stored card with that question, in deck order), so only
+    changed rows are written: new questions are inserted, cards whose answer or
+    choices changed are updated, cards that moved get their new position and cards
+    missing from card_rows are deleted. Matched cards keep their notes, review flag
+    and SM-2 state; notes and review flags in card_rows only apply to new cards.
+    Learn-mode progress follows the card it pointed at.
+
+    The stored hashes are read from one snapshot and card_rows is matched against
+    them without any lock; only the resulting changes are written, all at once by
+    the writer thread (see _apply_merge). If cards were added to the dataset in
+    between, nothing is written and MergeConflict is raised, so the caller can
+    merge again.
+
+    card_rows is consumed lazily like in import_dataset; on_batch, if given, is called
+    with the number of rows processed so far after every batch_size rows.
+    Returns a dict counting the inserted, updated, moved, deleted and unchanged cards,
+    or None if the dataset does not exist. On any exception nothing is changed and
+    the exception is re-raised to the caller.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # A shard is attached before the transaction begins, so it is read in it
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            print(f"Dataset {dataset_id} not found for merging.")
+            return None
+        # Stored cards by question hash, in deck order (read from idx_cards_dataset_hashes)
+        existing = {}
+        cursor.execute("BEGIN")
+        cursor.execute(
+            f"""
+            SELECT id, question_hash, content_hash, position FROM {schema}.cards
+            WHERE dataset_id = ? ORDER BY position
+            """,
+            (dataset_id,),
+        )
+        stored_ids = []
+        for card_id, question_hash, content_hash, position in cursor.fetchall():
+            existing.setdefault(question_hash, deque()).append((card_id, content_hash, position))
+            stored_ids.append(card_id)
+        conn.commit()
+        # _apply_merge checks that the dataset still holds exactly these cards
+        snapshot = (len(stored_ids), max(stored_ids, default=None))
+
+        # Moved and new cards are parked at negative positions (-1 - position) while the
+        # others still hold theirs, which keeps idx_cards_dataset_position unique
+        counts = dict.fromkeys(("inserted", "updated", "moved", "deleted", "unchanged"), 0)
+        inserts, updates, moves = [], [], []
+        row_count = 0
+        for position, card in enumerate(card_rows):
+            question_hash, content_hash = _card_hashes(card)
+            matches = existing.get(question_hash)
+            if not matches:
+                inserts.append(
+                    (
+                        dataset_id,
+                        -1 - position,
+                        card["question"],
+                        card["correct_answer"],
+                        card["choice1"],
+                        card["choice2"],
+                        card["choice3"],
+                        card["choice4"],
+                        card.get("choice5"),
+                        card.get("notes", ""),
+                        1 if card.get("mark_for_review") else 0,
+                        question_hash,
+                        content_hash,
+                    )
+                )
+                counts["inserted"] += 1
+            else:
+                card_id, stored_content_hash, stored_position = matches.popleft()
+                if stored_content_hash != content_hash:
+                    updates.append(
+                        (
+                            card["question"],
+                            card["correct_answer"],
+                            card["choice1"],
+                            card["choice2"],
+                            card["choice3"],
+                            card["choice4"],
+                            card.get("choice5"),
+                            content_hash,
+                            card_id,
+                        )
+                    )
+                    counts["updated"] += 1
+                if stored_position != position:
+                    moves.append((-1 - position, card_id))
+                    counts["moved"] += 1
+                if stored_content_hash == content_hash and stored_position == position:
+                    counts["unchanged"] += 1
+            row_count = position + 1
+
+            if on_batch and row_count % batch_size == 0:
+                on_batch(row_count)
+
+        # Stored cards left unmatched are no longer part of the dataset
+        deleted_ids = [(card_id,) for matches in existing.values() for card_id, _, _ in matches]
+        counts["deleted"] = len(deleted_ids)
+        changed = counts["unchanged"] != row_count or counts["deleted"] > 0
+
+        merged = _write_queue.call(
+            _apply_merge, dataset_id, snapshot, row_count, inserts, updates, moves, deleted_ids, changed
+        )
+        if not merged:
+            print(f"Dataset {dataset_id} not found for merging.")
+            return None
+        if on_batch:
+            on_batch(row_count)
+        print(f"Dataset {dataset_id} merged: {counts}")
+        return counts
+    except Exception as e:
+        print(f"Error merging into dataset {dataset_id}, nothing was changed: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _apply_merge(cursor, dataset_id, snapshot, row_count, inserts, updates, moves, deleted_ids, changed):
+    """
+    Writer operation of merge_dataset: writes the changes it collected. Returns False
+    if the dataset no longer exists; raises MergeConflict if its cards changed since
+    the snapshot (card count, highest card ID) the changes were computed from.
+    """
+    schema = _dataset_schema(cursor, dataset_id, write=True)
+    if schema is None:
+        return False
+    # Merges take turns under the import lock and cards are never deleted one by
+    # one, so only added cards can change a dataset meanwhile, and they get new IDs
+    cursor.execute(f"SELECT COUNT(*), MAX(id) FROM {schema}.cards WHERE dataset_id = ?", (dataset_id,))
+    if tuple(cursor.fetchone()) != snapshot:
+        raise MergeConflict(f"Cards were added to dataset {dataset_id} during the merge.")
+
+    # Card the learn-mode progress points at, to follow it to its new position
+    cursor.execute(
+        f"""
+        SELECT cards.id FROM progress
+        JOIN {schema}.cards AS cards ON cards.dataset_id = progress.dataset_id AND cards.position = progress.card_index
+        WHERE progress.dataset_id = ?
+        """,
+        (dataset_id,),
+    )
+    progress_card = cursor.fetchone()
+
+    _apply_merge_batch(cursor, schema, inserts, updates, moves)
+    cursor.executemany(f"DELETE FROM {schema}.cards WHERE id = ?", deleted_ids)
+    # Give the parked cards their final positions; all others already have theirs
+    cursor.execute(
+        f"UPDATE {schema}.cards SET position = -1 - position WHERE dataset_id = ? AND position < 0",
+        (dataset_id,),
+    )
+    cursor.execute(
+        f"""
+        UPDATE progress SET card_index = COALESCE(
+            (SELECT position FROM {schema}.cards WHERE id = ?), MIN(card_index, MAX(? - 1, 0))
+        )
+        WHERE dataset_id = ?
+        """,
+        (progress_card["id"] if progress_card else None, row_count, dataset_id),
+    )
+    if changed:
+        # Card contents or order changed, so invalidate cached pages and exports
+        cursor.execute("UPDATE datasets SET version = version + 1 WHERE id = ?", (dataset_id,))
+    return True
+
+
+def _apply_merge_batch(cursor, schema, inserts, updates, moves):
+    """Writes the inserts, content updates and moves collected by merge_dataset."""
+    if inserts:
+        _insert_card_batch(cursor, inserts, schema)
+    if updates:
+        cursor.executemany(
+            f"""
+            UPDATE {schema}.cards SET question = ?, correct_answer = ?, choice1 = ?, choice2 = ?,
+                             choice3 = ?, choice4 = ?, choice5 = ?, content_hash = ?
+            WHERE id = ?
+            """,
+            updates,
+        )
+    if moves:
+        cursor.executemany(f"UPDATE {schema}.cards SET position = ? WHERE id = ?", moves)
+
+
+def get_datasets():
+    """
+    Retrieves all datasets with their statistics: card_count, review_count and
+    last_studied (the learn-mode card index, or None if never studied). The counts
+    are kept up to date by triggers, so this is one query regardless of deck sizes.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # Explicitly list columns, rely on DB default for mark_for_review
         cursor.execute(
             """
-            INSERT INTO cards (dataset_id, question, correct_answer, choice1, choice2, choice3, choice4, choice5, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                dataset_id,
-                question,
-                correct_answer,
-                choice1,
-                choice2,
-                choice3,
-                choice4,
-                choice5,
-                notes,
-            ),
+            SELECT datasets.id, datasets.name, datasets.card_count, datasets.review_count,
+                   progress.card_index AS last_studied
+            FROM datasets LEFT JOIN progress ON progress.dataset_id = datasets.id
+            WHERE datasets.pending = 0
+            ORDER BY datasets.name
+            """
         )
-        conn.commit()
-        # print(f"Card added to dataset {dataset_id}: {question[:30]}...") # Optional logging
-        return True
+        datasets = cursor.fetchall()
+        return datasets
     except sqlite3.Error as e:
-        print(f"Error adding card to dataset {dataset_id}: {e}")
-        conn.rollback()
-        return False
+        print(f"Error fetching datasets: {e}")
+        return []
     finally:
-        conn.close()
+        cursor.close()
 
 
-def get_datasets():
-    """Retrieves all datasets from the database."""
+def get_catalog_version():
+    """
+    Returns a counter that changes whenever a dataset is added, changed or deleted.
+    Returns None if it cannot be read.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id, name FROM datasets ORDER BY name")
-        datasets = cursor.fetchall()
-        return datasets
+        cursor.execute("SELECT version FROM catalog_state WHERE id = 1")
+        result = cursor.fetchone()
+        return result["version"] if result else None
     except sqlite3.Error as e:
-        print(f"Error fetching datasets: {e}")
-        return []
+        print(f"Error fetching catalog version: {e}")
+        return None
     finally:
-        conn.close()
+        cursor.close()
 
 
 def get_cards_by_dataset(dataset_id):
     """
-    Retrieves all cards for a specific dataset, ordered by ID.
+    Retrieves all cards for a specific dataset, ordered by position.
     Includes the 'notes' and 'mark_for_review' fields.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            return []
         # SELECT * will include the new columns
         cursor.execute(
-            "SELECT * FROM cards WHERE dataset_id = ? ORDER BY id", (dataset_id,)
+            f"SELECT * FROM {schema}.cards WHERE dataset_id = ? ORDER BY position", (dataset_id,)
         )
         cards = cursor.fetchall()
         return cards
@@ -180,19 +1538,22 @@ def get_cards_by_dataset(dataset_id):
         print(f"Error fetching cards for dataset {dataset_id}: {e}")
         return []
     finally:
-        conn.close()
+        cursor.close()
 
 
 def get_review_cards_by_dataset(dataset_id):
     """
-    Retrieves cards marked for review for a specific dataset, ordered by ID.
+    Retrieves cards marked for review for a specific dataset, ordered by position.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            return []
         # Filter by mark_for_review = 1 (TRUE)
         cursor.execute(
-            "SELECT * FROM cards WHERE dataset_id = ? AND mark_for_review = 1 ORDER BY id",
+            f"SELECT * FROM {schema}.cards WHERE dataset_id = ? AND mark_for_review = 1 ORDER BY position",
             (dataset_id,),
         )
         cards = cursor.fetchall()
@@ -201,7 +1562,320 @@ def get_review_cards_by_dataset(dataset_id):
         print(f"Error fetching review cards for dataset {dataset_id}: {e}")
         return []
     finally:
-        conn.close()
+        cursor.close()
+
+
+def iter_dataset_cards(dataset_id, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every card of a dataset in deck order, for exports.
+
+    Rows are read through a single SELECT, batch_size at a time, so memory stays
+    constant regardless of the deck size and the export sees one consistent
+    snapshot of the dataset. Errors are logged and re-raised, since the caller
+    may already have sent part of the rows.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            return
+        cursor.execute(
+            f"""
+            SELECT question, correct_answer, choice1, choice2, choice3, choice4, choice5,
+                   notes, mark_for_review
+            FROM {schema}.cards WHERE dataset_id = ? ORDER BY position
+            """,
+            (dataset_id,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except sqlite3.Error as e:
+        print(f"Error exporting cards for dataset {dataset_id}: {e}")
+        raise
+    finally:
+        cursor.close()
+
+
+def _count_deck_cards(cursor, dataset_id, review_only):
+    """
+    Returns (card_count, sharded): the number of cards in a deck, or in its review
+    set when review_only is True, and whether the dataset is kept in a shard.
+    """
+    # The counters are maintained by triggers on cards, so this is a single-row lookup
+    cursor.execute(
+        "SELECT card_count, review_count, sharded FROM datasets WHERE id = ? AND pending = 0", (dataset_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return 0, False
+    return (row["review_count"] if review_only else row["card_count"]), bool(row["sharded"])
+
+
+def get_cards_window(dataset_id, offset, limit):
+    """
+    Retrieves up to `limit` consecutive cards of a dataset starting at the 0-based
+    index `offset`, in learn order. Returns a (cards, total_cards) tuple, where
+    total_cards is the size of the deck.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        total_cards, sharded = _count_deck_cards(cursor, dataset_id, review_only=False)
+        if not (0 <= offset < total_cards) or limit <= 0:
+            return [], total_cards
+        schema = _attach_shard(conn, dataset_id) if sharded else "main"
+        # Index range scan over (dataset_id, position)
+        cursor.execute(
+            f"""
+            SELECT * FROM {schema}.cards WHERE dataset_id = ? AND position >= ? AND position < ?
+            ORDER BY position
+            """,
+            (dataset_id, offset, offset + limit),
+        )
+        return cursor.fetchall(), total_cards
+    except sqlite3.Error as e:
+        print(f"Error fetching cards {offset}-{offset + limit} for dataset {dataset_id}: {e}")
+        return [], 0
+    finally:
+        cursor.close()
+
+
+def get_card_by_position(dataset_id, card_index):
+    """
+    Retrieves a single card by its 0-based position within a dataset, together with
+    the number of cards in the deck. Returns a (card, total_cards) tuple; card is
+    None if the index is out of range.
+    """
+    cards, total_cards = get_cards_window(dataset_id, card_index, 1)
+    return (cards[0] if cards else None), total_cards
+
+
+def get_review_cards(dataset_id, position, limit, before=False):
+    """
+    Retrieves up to `limit` review-marked cards of a dataset next to a deck position:
+    the first ones after it, or with before=True the last ones before it (returned
+    in deck order either way). Returns a (cards, review_count) tuple.
+
+    The review set is walked by deck position rather than by its own index, so each
+    call is a seek into the partial review index, however deep into the set it is.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        review_count, sharded = _count_deck_cards(cursor, dataset_id, review_only=True)
+        if review_count == 0 or limit <= 0:
+            return [], review_count
+        schema = _attach_shard(conn, dataset_id) if sharded else "main"
+        cursor.execute(
+            f"""
+            SELECT * FROM {schema}.cards
+            WHERE dataset_id = ? AND mark_for_review = 1 AND position {"<" if before else ">"} ?
+            ORDER BY position {"DESC" if before else "ASC"} LIMIT ?
+            """,
+            (dataset_id, position, limit),
+        )
+        cards = cursor.fetchall()
+        return (cards[::-1] if before else cards), review_count
+    except sqlite3.Error as e:
+        print(f"Error fetching review cards around position {position} for dataset {dataset_id}: {e}")
+        return [], 0
+    finally:
+        cursor.close()
+
+
+def get_review_card(dataset_id, position):
+    """
+    Retrieves the first review-marked card of a dataset at or after a deck position.
+    Returns a (card, prev_position, next_position, review_count) tuple, where the
+    positions are those of the marked cards before and after it (None at either
+    end of the review set); card is None if no marked card follows the position.
+    """
+    cards, review_count = get_review_cards(dataset_id, position - 1, 2)
+    if not cards:
+        return None, None, None, review_count
+    card = cards[0]
+    next_position = cards[1]["position"] if len(cards) > 1 else None
+    previous, _ = get_review_cards(dataset_id, card["position"], 1, before=True)
+    prev_position = previous[0]["position"] if previous else None
+    return card, prev_position, next_position, review_count
+
+
+def get_next_due_card(dataset_id, now):
+    """
+    Retrieves the card of a dataset that is due the earliest (due_at <= now).
+    Returns a (card, due_count) tuple; card is None when nothing is due, and
+    due_count is capped at DUE_COUNT_LIMIT.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            return None, 0
+        # Both queries seek into the (dataset_id, due_at) index instead of scanning
+        cursor.execute(
+            f"""
+            SELECT * FROM {schema}.cards WHERE dataset_id = ? AND due_at <= ?
+            ORDER BY due_at, id LIMIT 1
+            """,
+            (dataset_id, now),
+        )
+        card = cursor.fetchone()
+        if card is None:
+            return None, 0
+        cursor.execute(
+            f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM {schema}.cards WHERE dataset_id = ? AND due_at <= ? LIMIT ?
+            )
+            """,
+            (dataset_id, now, DUE_COUNT_LIMIT),
+        )
+        return card, cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Error fetching due card for dataset {dataset_id}: {e}")
+        return None, 0
+    finally:
+        cursor.close()
+
+
+def grade_card(card_id, quality, now):
+    """
+    Records an SM-2 grade (0-5) for a card and schedules its next review.
+    Returns the new schedule as a dict, or None if the card was not found or on error.
+    """
+    try:
+        schedule = _write_queue.call(_grade_card, card_id, quality, now)
+    except sqlite3.Error as e:
+        print(f"Error grading card {card_id}: {e}")
+        return None
+    if schedule is None:
+        print(f"Card {card_id} not found for grading.")
+    return schedule
+
+
+def _grade_card(cursor, card_id, quality, now):
+    # Runs on the writer, inside its write transaction, so concurrent grades
+    # of the same card cannot overwrite each other's schedule
+    schema = _card_schema(cursor, card_id, write=True)
+    if schema is None:
+        return None
+    cursor.execute(
+        f"SELECT ease, interval_days, repetitions FROM {schema}.cards WHERE id = ?", (card_id,)
+    )
+    card = cursor.fetchone()
+    if card is None:
+        return None
+    schedule = scheduler.schedule_review(
+        card["ease"], card["interval_days"], card["repetitions"], quality, now
+    )
+    cursor.execute(
+        f"""
+        UPDATE {schema}.cards SET ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+        WHERE id = ?
+        """,
+        (
+            schedule["ease"],
+            schedule["interval_days"],
+            schedule["repetitions"],
+            schedule["due_at"],
+            card_id,
+        ),
+    )
+    return schedule
+
+
+# Markers wrapped around matched terms in search snippets (escaped before display)
+SEARCH_HIGHLIGHT_START = "\x02"
+SEARCH_HIGHLIGHT_END = "\x03"
+# Relative weight of each FTS_COLUMNS column when ranking search results
+SEARCH_COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 2.0, 2.0, 2.0, 3.0)
+
+
+def _fts_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as a prefix.
+    Words are quoted, so FTS5 operators typed by the user are searched for literally.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_cards(text, dataset_id=None, limit=20, offset=0):
+    """
+    Full-text search over question, answer, choices and notes of all (or one) datasets.
+    Returns a (results, has_more) tuple; results are ranked best first and include the
+    card's dataset name, position and a highlighted snippet of question and answer.
+
+    Every shard has a search index of its own. A search over all datasets queries
+    the main database and each shard and merges their results by score.
+    """
+    query = _fts_query(text)
+    if not query:
+        return [], False
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if dataset_id is not None:
+            schema = _dataset_schema(cursor, dataset_id)
+            if schema is None:
+                return [], False
+            # Fetch one extra row to learn whether another page exists
+            results = _search_schema(cursor, schema, query, dataset_id, limit + 1, offset)
+            return results[:limit], len(results) > limit
+
+        cursor.execute("SELECT id FROM datasets WHERE sharded = 1")
+        shard_ids = [row["id"] for row in cursor.fetchall()]
+        # Without shards the main index answers the whole page
+        if not shard_ids:
+            results = _search_schema(cursor, "main", query, None, limit + 1, offset)
+            return results[:limit], len(results) > limit
+        # Otherwise every index returns its best rows up to the end of the page
+        results = _search_schema(cursor, "main", query, None, offset + limit + 1, 0)
+        for shard_id in shard_ids:
+            schema = _attach_shard(conn, shard_id)
+            results += _search_schema(cursor, schema, query, None, offset + limit + 1, 0)
+        results.sort(key=lambda row: row["score"])
+        results = results[offset : offset + limit + 1]
+        return results[:limit], len(results) > limit
+    except sqlite3.Error as e:
+        print(f"Error searching cards for '{text}': {e}")
+        return [], False
+    finally:
+        cursor.close()
+
+
+def _search_schema(cursor, schema, query, dataset_id, limit, offset):
+    """Runs an FTS5 query against the search index of one schema, best match (lowest score) first."""
+    weights = ", ".join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    dataset_filter = "AND c.dataset_id = ?" if dataset_id is not None else ""
+    params = [SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_END] * 2 + [query]
+    if dataset_id is not None:
+        params.append(dataset_id)
+    params += [limit, offset]
+    cursor.execute(
+        f"""
+        SELECT c.id, c.dataset_id, c.position, d.name AS dataset_name,
+               snippet(cards_fts, 0, ?, ?, '...', 16) AS question_snippet,
+               snippet(cards_fts, 1, ?, ?, '...', 16) AS answer_snippet,
+               bm25(cards_fts, {weights}) AS score
+        FROM {schema}.cards_fts AS cards_fts
+        JOIN {schema}.cards c ON c.id = cards_fts.rowid
+        JOIN datasets d ON d.id = c.dataset_id
+        WHERE cards_fts MATCH ? AND d.pending = 0 {dataset_filter}
+        ORDER BY score
+        LIMIT ? OFFSET ?
+        """,
+        params,
+    )
+    return cursor.fetchall()
 
 
 def get_dataset_id_by_name(name):
@@ -209,14 +1883,14 @@ def get_dataset_id_by_name(name):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id FROM datasets WHERE name = ?", (name,))
+        cursor.execute("SELECT id FROM datasets WHERE name = ? AND pending = 0", (name,))
         result = cursor.fetchone()
         return result["id"] if result else None
     except sqlite3.Error as e:
         print(f"Error fetching dataset ID for name '{name}': {e}")
         return None
     finally:
-        conn.close()
+        cursor.close()
 
 
 def get_dataset_by_id(dataset_id):
@@ -224,84 +1898,429 @@ def get_dataset_by_id(dataset_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT id, name FROM datasets WHERE id = ?", (dataset_id,))
+        cursor.execute(
+            "SELECT id, name, version FROM datasets WHERE id = ? AND pending = 0", (dataset_id,)
+        )
         result = cursor.fetchone()
         return result # Returns the row object or None
     except sqlite3.Error as e:
         print(f"Error fetching dataset for ID '{dataset_id}': {e}")
         return None
     finally:
-        conn.close()
+        cursor.close()
 
 
 def delete_dataset(dataset_id):
-    """Deletes a dataset and all its associated cards (due to ON DELETE CASCADE)."""
+    """
+    Deletes a dataset and all its associated cards and progress (due to ON DELETE CASCADE).
+    A sharded dataset only loses its row in the transaction; its shard file is
+    removed once that is committed.
+    """
+    try:
+        sharded = _write_queue.call(_delete_dataset, dataset_id)
+    except sqlite3.Error as e:
+        print(f"Error deleting dataset {dataset_id}: {e}")
+        return False
+    if sharded is None:
+        print(f"Dataset {dataset_id} not found for deletion.")
+        return False  # The dataset wasn't found
+    if sharded:
+        # Connections that still have the shard attached keep reading the removed
+        # file until they detach it, but no query looks for the dataset anymore
+        try:
+            remove_shard_files(shard_path(dataset_id))
+        except OSError as e:
+            print(f"Error removing the shard of dataset {dataset_id}: {e}")
+    print(f"Dataset {dataset_id} deleted successfully.")
+    return True
+
+
+def _delete_dataset(cursor, dataset_id):
+    cursor.execute("DELETE FROM datasets WHERE id = ? RETURNING sharded", (dataset_id,))
+    rows = cursor.fetchall()
+    return bool(rows[0]["sharded"]) if rows else None
+
+
+def get_progress(dataset_id):
+    """Retrieves the last viewed card index for a dataset. Returns 0 if none is stored."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM datasets WHERE id = ?", (dataset_id,))
-        conn.commit()
-        if cursor.rowcount > 0:
-            print(f"Dataset {dataset_id} deleted successfully.")
-            return True
-        else:
-            print(f"Dataset {dataset_id} not found for deletion.")
-            return False  # Indicate dataset wasn't found
+        cursor.execute(
+            "SELECT card_index FROM progress WHERE dataset_id = ?", (dataset_id,)
+        )
+        result = cursor.fetchone()
+        return result["card_index"] if result else 0
     except sqlite3.Error as e:
-        print(f"Error deleting dataset {dataset_id}: {e}")
-        conn.rollback()
+        print(f"Error fetching progress for dataset {dataset_id}: {e}")
+        return 0
+    finally:
+        cursor.close()
+
+
+def save_progress(dataset_id, card_index):
+    """Stores the last viewed card index for a dataset with a single-row upsert."""
+    start = time.perf_counter()
+    try:
+        _write_queue.call(_save_progress, dataset_id, card_index)
+        return True
+    except sqlite3.Error as e:
+        # Also raised if the dataset does not exist (foreign key violation)
+        print(f"Error saving progress for dataset {dataset_id}: {e}")
         return False
     finally:
-        conn.close()
+        metrics.PROGRESS_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+
+def _save_progress(cursor, dataset_id, card_index):
+    cursor.execute(
+        """
+        INSERT INTO progress (dataset_id, card_index) VALUES (?, ?)
+        ON CONFLICT (dataset_id) DO UPDATE SET card_index = excluded.card_index
+        """,
+        (dataset_id, card_index),
+    )
 
 
 def update_card_notes(card_id, notes):
     """Updates the notes for a specific card."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE cards SET notes = ? WHERE id = ?", (notes, card_id))
-        conn.commit()
-        if cursor.rowcount > 0:
-            # print(f"Notes updated for card {card_id}.") # Optional logging
-            return True
-        else:
-            print(f"Card {card_id} not found for notes update.")
-            return False  # Indicate card wasn't found
+        updated = _write_queue.call(_update_card_notes, card_id, notes)
     except sqlite3.Error as e:
         print(f"Error updating notes for card {card_id}: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
+    if not updated:
+        print(f"Card {card_id} not found for notes update.")
+    return updated  # False if the card wasn't found
+
+
+def _update_card_notes(cursor, card_id, notes):
+    schema = _card_schema(cursor, card_id, write=True)
+    if schema is None:
+        return False
+    cursor.execute(f"UPDATE {schema}.cards SET notes = ? WHERE id = ?", (notes, card_id))
+    return cursor.rowcount > 0
 
 
 def toggle_card_review_status(card_id):
-    """Toggles the mark_for_review status for a specific card."""
+    """
+    Toggles the mark_for_review status for a specific card.
+    Returns the new status (True/False), or None if the card was not found or on error.
+    """
+    try:
+        new_status = _write_queue.call(_toggle_card_review_status, card_id)
+    except sqlite3.Error as e:
+        print(f"Error toggling review status for card {card_id}: {e}")
+        return None
+    if new_status is None:
+        print(f"Card {card_id} not found for review status toggle.")
+    return new_status
+
+
+def _toggle_card_review_status(cursor, card_id):
+    schema = _card_schema(cursor, card_id, write=True)
+    if schema is None:
+        return None
+    # Toggle the boolean value (0 becomes 1, 1 becomes 0) and read back the result
+    cursor.execute(
+        f"""
+        UPDATE {schema}.cards SET mark_for_review = NOT mark_for_review WHERE id = ?
+        RETURNING mark_for_review
+        """,
+        (card_id,),
+    )
+    rows = cursor.fetchall()
+    return bool(rows[0]["mark_for_review"]) if rows else None
+
+
+def apply_card_updates(note_updates=(), review_updates=()):
+    """
+    Applies many note edits and review flag changes in a single transaction.
+
+    note_updates is an iterable of (card_id, notes) pairs and review_updates of
+    (card_id, marked) pairs; review flags are set explicitly, not toggled, so
+    replaying a batch is harmless. Returns the sorted list of card IDs that do
+    not exist, or None if the batch failed and was rolled back.
+
+    The updates are queued as one writer operation per shard (a single one
+    without shards). A batch spanning more shards than a connection can attach
+    is split over transactions, so only the failed part is rolled back then.
+    """
+    updates_by_shard = {}
+    for card_id, notes in note_updates:
+        updates_by_shard.setdefault(card_id >> SHARD_ID_BITS, ([], []))[0].append((card_id, notes))
+    for card_id, marked in review_updates:
+        updates_by_shard.setdefault(card_id >> SHARD_ID_BITS, ([], []))[1].append((card_id, marked))
+    try:
+        futures = [
+            _write_queue.submit(_apply_card_updates, shard_notes, shard_reviews)
+            for shard_notes, shard_reviews in updates_by_shard.values()
+        ]
+        return sorted(set().union(*(future.result() for future in futures)))
+    except sqlite3.Error as e:
+        print(f"Error applying batched card updates: {e}")
+        return None
+
+
+def _apply_card_updates(cursor, note_updates, review_updates):
+    # All updates belong to cards of the same schema
+    card_id = (note_updates or review_updates)[0][0]
+    schema = _card_schema(cursor, card_id, write=True)
+    if schema is None:
+        return {card_id for card_id, _ in note_updates + review_updates}
+    missing_card_ids = set()
+    for card_id, notes in note_updates:
+        cursor.execute(f"UPDATE {schema}.cards SET notes = ? WHERE id = ?", (notes, card_id))
+        if cursor.rowcount == 0:
+            missing_card_ids.add(card_id)
+    for card_id, marked in review_updates:
+        cursor.execute(
+            f"UPDATE {schema}.cards SET mark_for_review = ? WHERE id = ?",
+            (1 if marked else 0, card_id),
+        )
+        if cursor.rowcount == 0:
+            missing_card_ids.add(card_id)
+    return missing_card_ids
+
+
+# --- Answer Events ---
+def record_answer_events(events):
+    """
+    Appends answer events to the log. events is a list of (card_id, chosen_answer,
+    latency_ms, answered_at_ms) tuples; whether the answer was correct is decided
+    here against the stored card, and events for unknown cards are dropped.
+    The accuracy aggregates are updated by a trigger in the same transaction.
+
+    The events are queued on the writer without waiting for them to be stored,
+    one operation per shard they belong to (a single one without shards), and
+    a list of Futures of the number of events stored is returned. Events that
+    fail to be written are logged and counted in the metrics, since the caller
+    does not wait for them. Raises writer.WriterBusy if the write queue is full.
+    """
+    events_by_shard = {}
+    for event in events:
+        events_by_shard.setdefault(event[0] >> SHARD_ID_BITS, []).append(event)
+    futures = []
+    for shard_events in events_by_shard.values():
+        future = _write_queue.submit(_record_answer_events, shard_events)
+        future.add_done_callback(
+            lambda done, event_count=len(shard_events): _answer_events_written(done, event_count)
+        )
+        futures.append(future)
+    return futures
+
+
+def _answer_events_written(future, event_count):
+    """Counts the outcome of a queued _record_answer_events and logs a failure."""
+    error = future.exception()
+    if error is not None:
+        print(f"Error recording {event_count} answer events: {error}")
+        metrics.ANSWER_EVENTS.inc(event_count, status="failed")
+        return
+    stored = future.result()
+    metrics.ANSWER_EVENTS.inc(stored, status="stored")
+    if stored < event_count:
+        # Events for cards that no longer exist
+        metrics.ANSWER_EVENTS.inc(event_count - stored, status="dropped")
+
+
+def _record_answer_events(cursor, events):
+    # All events belong to cards of the same schema
+    schema = _card_schema(cursor, events[0][0], write=True)
+    if schema is None:
+        return 0
+    cursor.executemany(
+        f"""
+        INSERT INTO {schema}.answer_events (card_id, dataset_id, chosen_answer, correct, latency_ms, answered_at)
+        SELECT id, dataset_id, ?2, ?2 = correct_answer, ?3, ?4 FROM {schema}.cards WHERE id = ?1
+        """,
+        events,
+    )
+    return cursor.rowcount
+
+
+def get_answer_stats(dataset_id, limit=50, offset=0):
+    """
+    Returns (dataset_stats, card_stats) for a dataset from the incrementally
+    maintained aggregates: dataset_stats is a row (None if nothing was answered)
+    and card_stats lists answered cards, least accurate first.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # Toggle the boolean value (0 becomes 1, 1 becomes 0)
+        schema = _dataset_schema(cursor, dataset_id)
+        if schema is None:
+            return None, []
+        cursor.execute(
+            f"""
+            SELECT attempts, correct, total_latency_ms, last_answered_at
+            FROM {schema}.dataset_answer_stats WHERE dataset_id = ?
+            """,
+            (dataset_id,),
+        )
+        dataset_stats = cursor.fetchone()
         cursor.execute(
-            "UPDATE cards SET mark_for_review = NOT mark_for_review WHERE id = ?",
-            (card_id,),
+            f"""
+            SELECT stats.card_id, cards.position, cards.question, stats.attempts, stats.correct,
+                   stats.total_latency_ms, stats.last_answered_at
+            FROM {schema}.card_answer_stats AS stats JOIN {schema}.cards AS cards ON cards.id = stats.card_id
+            WHERE stats.dataset_id = ?
+            ORDER BY CAST(stats.correct AS REAL) / stats.attempts, stats.attempts DESC, cards.position
+            LIMIT ? OFFSET ?
+            """,
+            (dataset_id, limit, offset),
         )
-        conn.commit()
-        if cursor.rowcount > 0:
-            # Optionally, fetch the new status to return it? For now, just success/fail.
-            # cursor.execute("SELECT mark_for_review FROM cards WHERE id = ?", (card_id,))
-            # new_status = cursor.fetchone()['mark_for_review']
-            # print(f"Review status toggled for card {card_id}. New status: {new_status}")
-            return True
-        else:
-            print(f"Card {card_id} not found for review status toggle.")
-            return False  # Indicate card wasn't found
+        return dataset_stats, cursor.fetchall()
     except sqlite3.Error as e:
-        print(f"Error toggling review status for card {card_id}: {e}")
-        conn.rollback()
-        return False
+        print(f"Error fetching answer stats for dataset {dataset_id}: {e}")
+        return None, []
     finally:
-        conn.close()
+        cursor.close()
+
+
+# --- Exam Sessions ---
+def create_exam_session(dataset_ids, card_count, now):
+    """
+    Samples card_count distinct cards (fewer if the pool is smaller) uniformly from
+    the pooled cards of dataset_ids and stores them, in random order, as a new exam.
+
+    Positions are dense per dataset (0 to card_count - 1), so the sample is drawn
+    as random offsets into the pool and resolved through idx_cards_dataset_position;
+    no query scans or sorts the pool. Returns (exam_id, card_count), or (None, 0)
+    if the datasets hold no cards or on error.
+    """
+    try:
+        return _write_queue.call(_create_exam_session, list(dataset_ids), card_count, now)
+    except sqlite3.Error as e:
+        print(f"Error creating an exam over datasets {list(dataset_ids)}: {e}")
+        return None, 0
+
+
+def _create_exam_session(cursor, dataset_ids, card_count, now):
+    # Runs on the writer: counts and positions are read in the same transaction
+    # as the insert, so an import or merge cannot shift the positions in between
+    placeholders = ",".join("?" * len(dataset_ids))
+    cursor.execute(
+        f"""
+        SELECT id, card_count, sharded FROM datasets
+        WHERE id IN ({placeholders}) AND card_count > 0 AND pending = 0 ORDER BY id
+        """,
+        list(dataset_ids),
+    )
+    pools = cursor.fetchall()
+    # Offset of each dataset's first card within the pool
+    starts = []
+    pool_size = 0
+    for pool in pools:
+        starts.append(pool_size)
+        pool_size += pool["card_count"]
+    if pool_size == 0:
+        return None, 0
+
+    # random.sample() of a range draws without materializing the range
+    offsets = random.sample(range(pool_size), min(card_count, pool_size))
+    positions_by_dataset = {}
+    for offset in offsets:
+        pool_index = bisect.bisect_right(starts, offset) - 1
+        dataset_id = pools[pool_index]["id"]
+        positions_by_dataset.setdefault(dataset_id, []).append(offset - starts[pool_index])
+
+    card_ids_by_offset = {}
+    for pool_index, pool in enumerate(pools):
+        positions = positions_by_dataset.get(pool["id"])
+        if not positions:
+            continue
+        for position, card_id in _sampled_card_ids(cursor, pool, positions):
+            card_ids_by_offset[starts[pool_index] + position] = card_id
+    card_ids = array(EXAM_CARD_ID_TYPECODE, (card_ids_by_offset[offset] for offset in offsets))
+
+    cursor.execute("DELETE FROM exam_sessions WHERE created_at < ?", (now - EXAM_SESSION_TTL_SECONDS,))
+    cursor.execute(
+        "INSERT INTO exam_sessions (dataset_ids, card_count, card_ids, created_at) VALUES (?, ?, ?, ?)",
+        (json.dumps([pool["id"] for pool in pools]), len(card_ids), card_ids.tobytes(), now),
+    )
+    return cursor.lastrowid, len(card_ids)
+
+
+def _sampled_card_ids(cursor, pool, positions):
+    """Returns (position, card_id) rows for the cards at the given positions of a pool's dataset."""
+    # CROSS JOIN keeps json_each as the outer loop: one index seek per sampled position
+    sql = """
+        SELECT cards.position, cards.id FROM json_each(?) AS sampled
+        CROSS JOIN cards ON cards.dataset_id = ? AND cards.position = sampled.value
+    """
+    params = (json.dumps(positions), pool["id"])
+    if not pool["sharded"]:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    # An exam may span more shards than the writer's connection can attach
+    # within one transaction, so shards are read through a connection of their own
+    shard = sqlite3.connect(_shard_uri(pool["id"], mode="ro"), uri=True)
+    try:
+        return shard.execute(sql, params).fetchall()
+    finally:
+        shard.close()
+
+
+def get_exam_cards(exam_id, offset, limit):
+    """
+    Retrieves up to `limit` cards of an exam starting at the 0-based exam position
+    `offset`, each with its dataset_name and dataset_version.
+    Returns a (cards, total_cards) tuple; total_cards is 0 if the exam does not exist.
+    A card deleted since the exam was created is returned as None, so list
+    positions still match exam positions.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Only the requested slice of the ID array is read
+        cursor.execute(
+            "SELECT card_count, substr(card_ids, ?, ?) AS card_ids FROM exam_sessions WHERE id = ?",
+            (offset * EXAM_CARD_ID_SIZE + 1, max(limit, 0) * EXAM_CARD_ID_SIZE, exam_id),
+        )
+        exam = cursor.fetchone()
+        if exam is None:
+            return [], 0
+        if not (0 <= offset < exam["card_count"]) or limit <= 0:
+            return [], exam["card_count"]
+
+        card_ids = array(EXAM_CARD_ID_TYPECODE, exam["card_ids"]).tolist()
+        card_ids_by_shard = {}
+        for card_id in card_ids:
+            card_ids_by_shard.setdefault(card_id >> SHARD_ID_BITS, []).append(card_id)
+        cards_by_id = {}
+        for shard_id, shard_card_ids in card_ids_by_shard.items():
+            schema = _dataset_schema(cursor, shard_id) if shard_id else "main"
+            if schema is None:
+                continue  # The dataset has been deleted
+            # One primary key lookup per card
+            cursor.execute(
+                f"""
+                SELECT cards.*, datasets.name AS dataset_name, datasets.version AS dataset_version
+                FROM json_each(?) AS exam
+                CROSS JOIN {schema}.cards AS cards ON cards.id = exam.value
+                JOIN datasets ON datasets.id = cards.dataset_id
+                """,
+                (json.dumps(shard_card_ids),),
+            )
+            for card in cursor.fetchall():
+                cards_by_id[card["id"]] = card
+        return [cards_by_id.get(card_id) for card_id in card_ids], exam["card_count"]
+    except sqlite3.Error as e:
+        print(f"Error fetching cards {offset}-{offset + limit} of exam {exam_id}: {e}")
+        return [], 0
+    finally:
+        cursor.close()
+
+
+def get_exam_card(exam_id, card_index):
+    """
+    Retrieves the card at a 0-based exam position, together with the number of
+    cards in the exam. Returns a (card, total_cards) tuple; card is None if the
+    index is out of range or the card has been deleted since.
+    """
+    cards, total_cards = get_exam_cards(exam_id, card_index, 1)
+    return (cards[0] if cards else None), total_cards
 
 
 if __name__ == "__main__":
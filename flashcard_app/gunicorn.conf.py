@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for the production server (the Dockerfile's entry point):
+
+    gunicorn --config gunicorn.conf.py app:app
+
+Every setting can be overridden through the FLASHCARD_* environment variables below.
+"""
+import os
+
+# --- Server ---
+bind = os.environ.get("FLASHCARD_BIND", "0.0.0.0:5000")
+# Worker processes; SQLite serializes writers, so a few processes with
+# several threads each serve reads well without piling up on the write lock
+workers = int(os.environ.get("FLASHCARD_WORKERS", "4"))
+threads = int(os.environ.get("FLASHCARD_THREADS", "4"))
+worker_class = "gthread"
+# Large uploads are spooled to disk within the request
+timeout = int(os.environ.get("FLASHCARD_WORKER_TIMEOUT", "120"))
+accesslog = "-"
+
+
+def on_starting(server):
+    """
+    Runs the database migrations once in the master, before any worker is forked.
+    The workers inherit the result and skip their own schema check, so the server
+    does not start if the migrations fail. Metrics files left by an earlier run
+    are removed, so the counters start from zero.
+    """
+    import database
+    import metrics
+
+    if not database.ensure_schema():
+        # gunicorn prints a RuntimeError and exits
+        raise RuntimeError("The database schema could not be brought up to date, see the log above.")
+    metrics.clear_process_files()
+
+
+def post_worker_init(worker):
+    """Shares the worker's metrics with the others through its metrics file."""
+    import metrics
+
+    metrics.start_flusher()
+
+
+def worker_exit(server, worker):
+    """Writes the final metrics of an exiting worker, so its counts are kept."""
+    import metrics
+
+    metrics.write_process_file()
+
+
+def child_exit(server, worker):
+    """Folds the counters of a worker that exited into the dead workers' file, in the master."""
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,319 @@
+import os
+import re
+import csv
+import html
+import json
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+import database
+
+# --- Importer Registry ---
+# Importers by file extension. Each one is called with the spooled upload opened
+# in binary mode and returns an iterator of card dicts (see
+# database.import_dataset) that reads the file lazily, so even huge uploads are
+# streamed into the bulk insert. Importers raise ValueError (or csv.Error and
+# UnicodeDecodeError) for invalid input; jobs.start_import reports those to the
+# user. Register a new format with the @importer decorator.
+IMPORTERS = {}
+
+
+def importer(extension):
+    """Decorator registering a function as the importer of files with this extension."""
+
+    def register(parse_rows):
+        IMPORTERS[extension] = parse_rows
+        return parse_rows
+
+    return register
+
+
+def file_extension(filename):
+    """Returns the lower-cased extension of a filename, or "" if it has none."""
+    return filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+
+
+def get_importer(filename):
+    """Returns the importer for an uploaded file's name, or None if the format is not supported."""
+    return IMPORTERS.get(file_extension(filename))
+
+
+# --- CSV ---
+@importer("csv")
+def parse_csv_upload(binary_file):
+    """Returns an iterator of card dicts read lazily from a binary CSV file."""
+    # Decode line by line, so the file is never held in memory as a whole
+    stream = (line.decode("UTF-8") for line in binary_file)
+    return iter_csv_cards(csv.reader(stream))
+
+
+def iter_csv_cards(csv_reader):
+    """
+    Yields card dicts from an uploaded CSV reader, one row at a time.
+    Raises ValueError for malformed rows or when the file has no data rows.
+    """
+    # Skip the header row
+    next(csv_reader, None)
+
+    line_num = 1 # Start line count from 1 (after header)
+    for row in csv_reader:
+        line_num += 1
+        # Expecting 6 to 9 columns: question, correct_answer, choice1-4, [choice5],
+        # plus [notes] and [mark_for_review] in files written by the CSV export
+        if not (6 <= len(row) <= 9):
+            raise ValueError(
+                f"Incorrect number of columns ({len(row)}) on line {line_num}. Expected 6 to 9."
+            )
+
+        # Extract data, handle optional 7th column
+        question = row[0].strip()
+        correct_answer = row[1].strip()
+        choice1 = row[2].strip()
+        choice2 = row[3].strip()
+        choice3 = row[4].strip()
+        choice4 = row[5].strip()
+        # An empty 7th column means there is no fifth choice
+        choice5 = (row[6].strip() or None) if len(row) >= 7 else None
+
+        # Basic validation (ensure required fields are not empty)
+        if not all([question, correct_answer]):
+            raise ValueError(f"Missing required data (question or answer) on line {line_num}.")
+        check_choices([choice1, choice2, choice3, choice4], choice5, line_num)
+
+        card = {
+            "question": question,
+            "correct_answer": correct_answer,
+            "choice1": choice1,
+            "choice2": choice2,
+            "choice3": choice3,
+            "choice4": choice4,
+            "choice5": choice5,
+            # Notes default to an empty string in database.import_dataset
+        }
+        if len(row) >= 8:
+            card["notes"] = row[7]
+        if len(row) == 9:
+            card["mark_for_review"] = parse_review_flag(row[8], line_num)
+        yield card
+
+    if line_num == 1:
+        raise ValueError("CSV file is empty or contains no valid data rows after the header.")
+
+
+def check_choices(choices, choice5, line_num):
+    """
+    Raises ValueError unless choices 1-4 are all given, or all empty together with
+    choice5 for a card that is studied by revealing the answer (e.g. from Anki).
+    """
+    if all(choices) or not any(choices + [choice5]):
+        return
+    raise ValueError(
+        f"Choices 1-4 must all be filled in, or all left empty, on line {line_num}."
+    )
+
+
+# Accepted spellings of the mark_for_review column
+REVIEW_FLAG_VALUES = {"": False, "0": False, "false": False, "no": False, "1": True, "true": True, "yes": True}
+
+
+def parse_review_flag(value, line_num):
+    """Parses a mark_for_review cell, raising ValueError for unknown values."""
+    flag = REVIEW_FLAG_VALUES.get(value.strip().lower())
+    if flag is None:
+        raise ValueError(
+            f"Invalid review flag '{value}' on line {line_num}. Expected 1/0, true/false or yes/no."
+        )
+    return flag
+
+
+# --- JSON Lines ---
+@importer("jsonl")
+def parse_jsonl_upload(binary_file):
+    """Returns an iterator of card dicts read lazily from a binary JSON Lines file."""
+    return iter_jsonl_cards(line.decode("UTF-8") for line in binary_file)
+
+
+def iter_jsonl_cards(lines):
+    """
+    Yields card dicts from JSON Lines, one object per line as written by the JSONL
+    export: question, correct_answer, choices (4 or 5, or none for a card studied by
+    revealing the answer), and optional notes and mark_for_review. Raises ValueError
+    for malformed lines or when there are no cards.
+    """
+    card_count = 0
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_num}: {e.msg}.")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_num} is not a JSON object.")
+
+        choices = record.get("choices", [])
+        if not isinstance(choices, list) or len(choices) not in (0, 4, 5):
+            raise ValueError(f"Expected a list of 0, 4 or 5 choices on line {line_num}.")
+        choices = ["" if choice is None else str(choice).strip() for choice in choices]
+        # Pad a card without choices to the five columns
+        choices += [""] * (5 - len(choices))
+        question = str(record.get("question") or "").strip()
+        correct_answer = str(record.get("correct_answer") or "").strip()
+
+        if not all([question, correct_answer]):
+            raise ValueError(f"Missing required data (question or answer) on line {line_num}.")
+        check_choices(choices[:4], choices[4], line_num)
+
+        yield {
+            "question": question,
+            "correct_answer": correct_answer,
+            "choice1": choices[0],
+            "choice2": choices[1],
+            "choice3": choices[2],
+            "choice4": choices[3],
+            "choice5": choices[4] or None,
+            "notes": str(record.get("notes") or ""),
+            "mark_for_review": bool(record.get("mark_for_review")),
+        }
+        card_count += 1
+
+    if card_count == 0:
+        raise ValueError("JSONL file is empty or contains no cards.")
+
+
+# --- Anki Packages ---
+# An .apkg file is a zip archive holding the collection as an SQLite database.
+# Newer Anki versions name it collection.anki21, older ones collection.anki2.
+ANKI_COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+# Anki 2.1.50+ writes a zstd-compressed collection.anki21b unless "Support older
+# Anki versions" is ticked; the collection.anki2 next to it is a placeholder
+ANKI_COMPRESSED_COLLECTION_NAME = "collection.anki21b"
+# The collection is extracted next to the spooled uploads (jobs.SPOOL_DIR), on
+# disk rather than in memory, this many bytes at a time
+ANKI_EXTRACT_DIR = os.path.join(database.DATABASE_DIR, "import_spool")
+ANKI_EXTRACT_CHUNK_SIZE = 1024 * 1024
+# Separates the fields of a note in notes.flds
+ANKI_FIELD_SEPARATOR = "\x1f"
+# Notes tagged like this in Anki are marked for review
+ANKI_MARKED_TAG = "marked"
+
+_HTML_LINE_BREAK = re.compile(r"<br\s*/?>|</(?:div|p|li)>", re.IGNORECASE)
+_HTML_TAG = re.compile(r"<[^>]*>")
+_ANKI_SOUND = re.compile(r"\[sound:[^\]]*\]")
+# {{c1::text}} or {{c1::text::hint}}
+_ANKI_CLOZE = re.compile(r"\{\{c\d+::(.*?)(?:::(.*?))?\}\}", re.DOTALL)
+
+
+@importer("apkg")
+def parse_apkg_upload(binary_file):
+    """Returns an iterator of card dicts read lazily from an Anki .apkg package."""
+    return iter_apkg_cards(binary_file)
+
+
+def iter_apkg_cards(binary_file):
+    """
+    Yields one card dict per note of an Anki package, in the order the notes were
+    created. The first field becomes the question and the second the answer; any
+    further fields are kept as the card's notes. Anki notes have no answer choices,
+    so the choices are left empty and the card is studied by revealing the answer.
+    Cloze notes ask the text with its deletions hidden and answer it in full.
+
+    Fields are converted from HTML to plain text; images and sounds are dropped.
+    Notes without text on either side are skipped. Raises ValueError if the file is
+    not a readable Anki package or holds no notes.
+    """
+    collection_path = _extract_anki_collection(binary_file)
+    try:
+        conn = sqlite3.connect(collection_path)
+        try:
+            card_count = 0
+            skipped = 0
+            # Iterating the cursor steps through the notes without loading them all
+            for fields, tags in conn.execute("SELECT flds, tags FROM notes ORDER BY id"):
+                card = anki_note_to_card(fields.split(ANKI_FIELD_SEPARATOR), tags)
+                if card is None:
+                    skipped += 1
+                    continue
+                card_count += 1
+                yield card
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"The Anki collection could not be read: {e}.")
+    finally:
+        try:
+            os.remove(collection_path)
+        except OSError as e:
+            print(f"Error removing extracted Anki collection {collection_path}: {e}")
+
+    if skipped:
+        print(f"Skipped {skipped} Anki notes without question or answer text.")
+    if card_count == 0:
+        raise ValueError("The Anki package contains no notes with text.")
+
+
+def anki_note_to_card(fields, tags):
+    """Converts the fields and tags of an Anki note to a card dict, or None if it has no text."""
+    front = _anki_field_text(fields[0])
+    if _ANKI_CLOZE.search(front):
+        question = _ANKI_CLOZE.sub(lambda m: f"[{m.group(2) or '...'}]", front)
+        correct_answer = _ANKI_CLOZE.sub(r"\1", front)
+        extra_fields = fields[1:]
+    else:
+        question = front
+        correct_answer = _anki_field_text(fields[1]) if len(fields) > 1 else ""
+        extra_fields = fields[2:]
+    if not question or not correct_answer:
+        return None
+
+    extra = [_anki_field_text(field) for field in extra_fields]
+    return {
+        "question": question,
+        "correct_answer": correct_answer,
+        "choice1": "",
+        "choice2": "",
+        "choice3": "",
+        "choice4": "",
+        "choice5": None,
+        "notes": "\n\n".join(text for text in extra if text),
+        "mark_for_review": ANKI_MARKED_TAG in tags.lower().split(),
+    }
+
+
+def _anki_field_text(value):
+    """Turns the HTML of an Anki field into plain text."""
+    text = _HTML_LINE_BREAK.sub("\n", value)
+    text = _ANKI_SOUND.sub("", _HTML_TAG.sub("", text))
+    return html.unescape(text).replace("\xa0", " ").strip()
+
+
+def _extract_anki_collection(binary_file):
+    """
+    Copies the collection database out of an .apkg archive into a temporary file,
+    decompressing it in chunks. Returns the file's path; the caller removes it.
+    """
+    try:
+        archive = zipfile.ZipFile(binary_file)
+    except zipfile.BadZipFile:
+        raise ValueError("The file is not a valid Anki package (.apkg).")
+    with archive:
+        names = set(archive.namelist())
+        member = next((name for name in ANKI_COLLECTION_NAMES if name in names), None)
+        if ANKI_COMPRESSED_COLLECTION_NAME in names and member != "collection.anki21":
+            raise ValueError(
+                "This Anki package uses the compressed format of Anki 2.1.50 and later. "
+                "Export it again with 'Support older Anki versions' ticked."
+            )
+        if member is None:
+            raise ValueError("The Anki package does not contain a collection.")
+
+        os.makedirs(ANKI_EXTRACT_DIR, exist_ok=True)
+        fd, collection_path = tempfile.mkstemp(suffix=".anki2", dir=ANKI_EXTRACT_DIR)
+        try:
+            with archive.open(member) as source, os.fdopen(fd, "wb") as target:
+                shutil.copyfileobj(source, target, ANKI_EXTRACT_CHUNK_SIZE)
+        except (OSError, zipfile.BadZipFile) as e:
+            os.remove(collection_path)
+            raise ValueError(f"The Anki package could not be extracted: {e}.")
+    return collection_path
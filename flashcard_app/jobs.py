@@ -0,0 +1,269 @@
+import os
+import re
+import csv
+import json
+import uuid
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import database
+import metrics
+
+# --- Configuration ---
+# Number of imports processed at the same time
+IMPORT_WORKERS = int(os.environ.get("FLASHCARD_IMPORT_WORKERS", "2"))
+# Uploads are written here before a worker picks them up
+SPOOL_DIR = os.path.join(database.DATABASE_DIR, "import_spool")
+# Finished jobs kept in memory so their status can still be polled
+MAX_FINISHED_JOBS = 100
+# Chunk size used while copying an upload to the spool directory
+SPOOL_CHUNK_SIZE = 1024 * 1024
+# Job status is mirrored to files here, so any worker process can report it
+JOB_STATUS_DIR = os.path.join(database.DATABASE_DIR, "import_jobs")
+# Status files of jobs that finished longer ago than this are deleted
+JOB_STATUS_TTL_SECONDS = 24 * 60 * 60
+# Parsed rows counted between two status file updates during validation
+VALIDATION_REPORT_INTERVAL = database.IMPORT_BATCH_SIZE
+# Times a merge is tried before giving up on a dataset that keeps changing under it
+MERGE_ATTEMPTS = 3
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+_jobs = {}
+_jobs_lock = threading.Lock()
+# Workers parse and validate concurrently, but take turns for the insert or
+# merge, which the database writes in short transactions. The thread lock
+# covers this process and database.IMPORT_LOCK_PATH the other worker processes.
+_insert_lock = threading.Lock()
+_JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class ImportJob:
+    """Status of one background import, as reported by /jobs/<id>."""
+
+    def __init__(self, job_id, dataset_name, spool_path, parse_rows, mode="create"):
+        self.id = job_id
+        self.dataset_name = dataset_name
+        self.spool_path = spool_path
+        self.parse_rows = parse_rows
+        self.mode = mode  # "create" a new dataset or "update" (merge into) an existing one
+        self.status = "queued"  # queued -> validating -> importing -> done | failed
+        self.rows_parsed = 0
+        self.rows_processed = 0
+        self.rows_inserted = 0
+        self.changes = None  # Counts reported by database.merge_dataset in update mode
+        self.rows_failed = 0
+        self.dataset_id = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "dataset_name": self.dataset_name,
+            "mode": self.mode,
+            "status": self.status,
+            "rows_parsed": self.rows_parsed,
+            "rows_processed": self.rows_processed,
+            "rows_inserted": self.rows_inserted,
+            "changes": self.changes,
+            "rows_failed": self.rows_failed,
+            "dataset_id": self.dataset_id,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds a job (without its spool file) from a to_dict() snapshot."""
+        job = cls(data["id"], data["dataset_name"], None, None, data["mode"])
+        for key in ("status", "rows_parsed", "rows_processed", "rows_inserted", "changes",
+                    "rows_failed", "dataset_id", "error", "created_at", "finished_at"):
+            setattr(job, key, data[key])
+        return job
+
+    def save(self):
+        """Writes the job's status file, atomically replacing the previous one."""
+        path = _job_status_path(self.id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error saving status of import job {self.id}: {e}")
+
+
+def start_import(dataset_name, upload_stream, parse_rows, mode="create"):
+    """
+    Spools an uploaded file to disk and queues it for a background import.
+
+    In "create" mode the file becomes a new dataset; in "update" mode it is merged
+    into the existing dataset of that name (see database.merge_dataset).
+
+    parse_rows is called with the spooled file opened in binary mode and must
+    return an iterator of card dicts (see database.import_dataset); it may raise
+    ValueError, csv.Error or UnicodeDecodeError for invalid input.
+    Returns the queued ImportJob immediately.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    os.makedirs(JOB_STATUS_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    spool_path = os.path.join(SPOOL_DIR, f"{job_id}.upload")
+    with open(spool_path, "wb") as f:
+        shutil.copyfileobj(upload_stream, f, SPOOL_CHUNK_SIZE)
+
+    job = ImportJob(job_id, dataset_name, spool_path, parse_rows, mode)
+    job.save()
+    with _jobs_lock:
+        _jobs[job.id] = job
+        _forget_old_jobs()
+    _forget_old_job_files()
+    _executor.submit(_run_import, job)
+    return job
+
+
+def get_job(job_id):
+    """
+    Returns the ImportJob with the given ID, or None if it is unknown.
+    Jobs run by other worker processes are read from their status file.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None or not _JOB_ID_PATTERN.fullmatch(job_id):
+        return job
+    try:
+        with open(_job_status_path(job_id)) as f:
+            return ImportJob.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading status of import job {job_id}: {e}")
+        return None
+
+
+def _job_status_path(job_id):
+    return os.path.join(JOB_STATUS_DIR, f"{job_id}.json")
+
+
+def _forget_old_job_files():
+    """Deletes status files not updated within JOB_STATUS_TTL_SECONDS."""
+    cutoff = time.time() - JOB_STATUS_TTL_SECONDS
+    try:
+        with os.scandir(JOB_STATUS_DIR) as entries:
+            for entry in entries:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+    except OSError as e:
+        print(f"Error removing old import job status files: {e}")
+
+
+def _forget_old_jobs():
+    """Drops the oldest finished jobs beyond MAX_FINISHED_JOBS (call with _jobs_lock held)."""
+    finished = [job for job in _jobs.values() if job.finished_at is not None]
+    if len(finished) > MAX_FINISHED_JOBS:
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[: len(finished) - MAX_FINISHED_JOBS]:
+            del _jobs[job.id]
+
+
+def _run_import(job):
+    """Worker: validates the spooled file, then imports or merges it."""
+    try:
+        # First pass: parse and validate every row without touching the
+        # database, so bad files fail fast and never hold the write lock
+        job.status = "validating"
+        job.save()
+        with open(job.spool_path, "rb") as f:
+            for _ in job.parse_rows(f):
+                job.rows_parsed += 1
+                if job.rows_parsed % VALIDATION_REPORT_INTERVAL == 0:
+                    job.save()
+
+        # Second pass: stream the same rows into the bulk insert
+        job.status = "importing"
+        job.save()
+        with _insert_lock, database.file_lock(database.IMPORT_LOCK_PATH):
+            # No other import runs now, so any pending dataset is a leftover
+            database.discard_pending_datasets()
+            import_started = time.perf_counter()
+            if job.mode == "update":
+                dataset_id = database.get_dataset_id_by_name(job.dataset_name)
+                if dataset_id is not None:
+                    job.changes = _merge_spooled_file(job, dataset_id)
+                if job.changes is None:
+                    raise ValueError(f"Dataset '{job.dataset_name}' no longer exists.")
+                added_count = job.changes["inserted"]
+            else:
+                with open(job.spool_path, "rb") as f:
+                    dataset_id, added_count = database.import_dataset(
+                        job.dataset_name, job.parse_rows(f), on_batch=_batch_reporter(job)
+                    )
+            import_seconds = time.perf_counter() - import_started
+        if dataset_id is None:
+            raise ValueError(
+                f"Failed to create dataset '{job.dataset_name}'. It might already exist."
+            )
+        job.dataset_id = dataset_id
+        job.rows_inserted = added_count
+        job.status = "done"
+        metrics.IMPORT_ROWS.inc(added_count, status="inserted")
+        if job.changes:
+            metrics.IMPORT_ROWS.inc(job.changes["updated"], status="updated")
+            metrics.IMPORT_ROWS.inc(job.changes["deleted"], status="deleted")
+        metrics.IMPORT_SECONDS.observe(import_seconds)
+        if import_seconds > 0:
+            metrics.IMPORT_ROWS_PER_SECOND.set(job.rows_parsed / import_seconds)
+    except Exception as e:
+        # Nothing was committed, so every parsed row counts as failed
+        job.rows_inserted = 0
+        job.rows_failed = job.rows_parsed
+        job.error = _describe_import_error(e)
+        job.status = "failed"
+        metrics.IMPORT_ROWS.inc(job.rows_failed, status="failed")
+        if job.error.startswith("An unexpected error"):
+            print(f"Unexpected upload error: {e}")  # Log for debugging
+    finally:
+        job.finished_at = time.time()
+        job.save()
+        try:
+            os.remove(job.spool_path)
+        except OSError as e:
+            print(f"Error removing spooled upload {job.spool_path}: {e}")
+
+
+def _merge_spooled_file(job, dataset_id):
+    """Merges the spooled file into a dataset, reading it again if cards were added meanwhile."""
+    for attempt in range(1, MERGE_ATTEMPTS + 1):
+        try:
+            with open(job.spool_path, "rb") as f:
+                return database.merge_dataset(dataset_id, job.parse_rows(f), on_batch=_batch_reporter(job))
+        except database.MergeConflict:
+            if attempt == MERGE_ATTEMPTS:
+                raise
+            print(f"Cards were added to dataset {dataset_id} during merge attempt {attempt}, merging again.")
+
+
+def _batch_reporter(job):
+    """Returns an import_dataset/merge_dataset on_batch callback updating the job's counters."""
+
+    def report(rows_so_far):
+        job.rows_processed = rows_so_far
+        if job.mode == "create":
+            job.rows_inserted = rows_so_far
+        job.save()
+
+    return report
+
+
+def _describe_import_error(error):
+    """Turns an import exception into a message suitable for the user."""
+    if isinstance(error, UnicodeDecodeError):
+        return "Error decoding file. Please ensure the file is UTF-8 encoded."
+    if isinstance(error, csv.Error):
+        return f"Error parsing CSV file: {error}"
+    if isinstance(error, ValueError):
+        return f"Error processing uploaded data: {error}"
+    return f"An unexpected error occurred during upload: {error}"
@@ -0,0 +1,571 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import contextlib
+import sqlite3
+import threading
+from flask import g, has_request_context, request
+
+try:
+    import fcntl  # POSIX only: keeps readers from seeing a dead process's file half folded
+except ImportError:
+    fcntl = None
+
+# --- Configuration ---
+# Requests slower than this many milliseconds are logged (0 disables the log)
+SLOW_REQUEST_MS = float(os.environ.get("FLASHCARD_SLOW_REQUEST_MS", "0"))
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Every worker process writes its metrics to a file here, and render() adds up
+# the files of all workers (see write_process_file)
+METRICS_DIR = os.environ.get(
+    "FLASHCARD_METRICS_DIR", os.path.join(os.environ.get("FLASHCARD_DATA_DIR", "/data"), "metrics")
+)
+# The counters and histograms of exited processes are added up in this one file
+DEAD_FILE_NAME = "dead.json"
+# Seconds between two writes of a worker's metrics file
+METRICS_FLUSH_SECONDS = float(os.environ.get("FLASHCARD_METRICS_FLUSH_SECONDS", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+IMPORT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+_registry = []
+# Tells the files of processes apart when the system reuses a process ID
+_process_token = uuid.uuid4().hex
+_flusher = None
+
+
+# --- Metric Types ---
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class of the in-process metrics rendered by render()."""
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def snapshot(self):
+        """Returns the values of this process as a JSON-serializable list of [key, value] pairs."""
+        with self._lock:
+            return [[list(key), self._copy_value(value)] for key, value in self._values.items()]
+
+    def _copy_value(self, value):
+        return value
+
+    def render(self, processes):
+        """Renders the values of all processes, given as the dicts of their metrics files."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples(sorted(self._merge(processes).items())))
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _merge(self, processes):
+        # Exited workers still count, so the totals never go down
+        totals = {}
+        for process in processes:
+            for key, value in process["metrics"].get(self.name, []):
+                totals[tuple(key)] = totals.get(tuple(key), 0) + value
+        return totals
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _merge(self, processes):
+        # A gauge cannot be added up, so each live worker reports its own under a pid label
+        values = {}
+        for process in processes:
+            if process["live"]:
+                for key, value in process["metrics"].get(self.name, []):
+                    values[tuple(key) + (str(process["pid"]),)] = value
+        return values
+
+    def _render_samples(self, items):
+        label_names = self.label_names + ("pid",)
+        for key, value in items:
+            yield f"{self.name}{_format_labels(label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _copy_value(self, value):
+        bucket_counts, total, count = value
+        return [list(bucket_counts), total, count]
+
+    def _merge(self, processes):
+        states = {}
+        for process in processes:
+            for key, (bucket_counts, total, count) in process["metrics"].get(self.name, []):
+                state = states.get(tuple(key))
+                if state is None:
+                    states[tuple(key)] = [list(bucket_counts), total, count]
+                    continue
+                state[0] = [a + b for a, b in zip(state[0], bucket_counts)]
+                state[1] += total
+                state[2] += count
+        return states
+
+    def _render_samples(self, items):
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+def render():
+    """
+    Returns every registered metric in the Prometheus text exposition format, added
+    up over this process and the metrics files of the other worker processes.
+    """
+    own_path = _process_file_path()
+    processes = [_process_state(live=True)]
+    with _files_lock():
+        files = _read_process_files()
+    processes.extend(state for path, state in files if path != own_path)
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(processes))
+    return "\n".join(lines) + "\n"
+
+
+# --- Sharing Between Processes ---
+# Each gunicorn worker keeps its metrics in memory and writes them to its own file
+# in METRICS_DIR every METRICS_FLUSH_SECONDS and when it exits, so whichever
+# worker answers /metrics reports all of them (the others up to a flush behind).
+# When a worker exits, the gunicorn master adds its counters and histograms to
+# DEAD_FILE_NAME and removes its file, so counters do not drop when a worker is
+# replaced, its gauges go and the directory does not grow with every restart.
+def _process_file_path(pid=None):
+    return os.path.join(METRICS_DIR, f"{pid or os.getpid()}-{_process_token}.json")
+
+
+def _process_state(live):
+    return {
+        "pid": os.getpid(),
+        "live": live,
+        "metrics": {metric.name: metric.snapshot() for metric in _registry},
+    }
+
+
+def _write_json(path, state):
+    # Replaced in one step, so readers never see a partly written file
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+@contextlib.contextmanager
+def _files_lock(exclusive=False):
+    """
+    Holds the lock on METRICS_DIR while the block runs: shared to read the files,
+    exclusive to fold a dead process's file. Without fcntl (non-POSIX systems)
+    nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        lock_file = open(os.path.join(METRICS_DIR, "metrics.lock"), "a")
+    except OSError as e:
+        print(f"Error locking the metrics files: {e}")
+        yield
+        return
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        # Closing the file releases the lock
+        yield
+
+
+def _read_process_files():
+    """Returns (path, state) of every metrics file in METRICS_DIR."""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in sorted(names):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            with open(path) as f:
+                files.append((path, json.load(f)))
+        except (OSError, ValueError) as e:
+            print(f"Error reading metrics file {path}: {e}")
+    return files
+
+
+def write_process_file():
+    """Writes the metrics of this process to its file in METRICS_DIR."""
+    path = _process_file_path()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(path, _process_state(live=True))
+    except OSError as e:
+        print(f"Error writing metrics file {path}: {e}")
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        write_process_file()
+
+
+def start_flusher():
+    """Starts writing this process's metrics file in the background (gunicorn's post_worker_init)."""
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_periodically, name="metrics-flusher", daemon=True)
+        _flusher.start()
+
+
+def mark_process_dead(pid):
+    """
+    Folds the metrics files of an exited process into DEAD_FILE_NAME and removes
+    them (gunicorn's child_exit, in the master). Its counters and histograms are
+    added to those of the processes that exited before; its gauges are dropped.
+    """
+    dead_path = os.path.join(METRICS_DIR, DEAD_FILE_NAME)
+    with _files_lock(exclusive=True):
+        files = _read_process_files()
+        dead_files = [(path, state) for path, state in files if path != dead_path and state.get("pid") == pid]
+        if not dead_files:
+            return
+        processes = [state for path, state in files if path == dead_path]
+        processes.extend(state for _, state in dead_files)
+        dead_state = {
+            "pid": None,
+            "live": False,
+            "metrics": {
+                metric.name: [[list(key), value] for key, value in metric._merge(processes).items()]
+                for metric in _registry
+                if not isinstance(metric, Gauge)
+            },
+        }
+        try:
+            _write_json(dead_path, dead_state)
+            for path, _ in dead_files:
+                os.remove(path)
+        except OSError as e:
+            print(f"Error folding the metrics files of process {pid}: {e}")
+
+
+def clear_process_files():
+    """Removes the metrics files of an earlier server run (gunicorn's on_starting)."""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError as e:
+            print(f"Error removing metrics file {name}: {e}")
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero rather than counting the master's work again.
+    # The locks are replaced too, as another thread may have held one at the fork.
+    global _process_token, _flusher
+    _process_token = uuid.uuid4().hex
+    _flusher = None
+    for metric in _registry:
+        metric._values = {}
+        metric._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# --- Application Metrics ---
+REQUEST_SECONDS = Histogram(
+    "flashcard_http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("endpoint", "method", "status"),
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    "flashcard_http_request_sql_statements",
+    "SQL statements executed while handling one HTTP request.",
+    ("endpoint",),
+    buckets=STATEMENT_COUNT_BUCKETS,
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "flashcard_http_request_sql_seconds",
+    "Time spent in SQLite while handling one HTTP request.",
+    ("endpoint",),
+)
+SQL_STATEMENTS = Counter(
+    "flashcard_sql_statements_total",
+    "SQL statements executed, including background imports.",
+)
+SQL_SECONDS = Counter(
+    "flashcard_sql_seconds_total",
+    "Time spent in SQLite, including background imports.",
+)
+PROGRESS_WRITE_SECONDS = Histogram(
+    "flashcard_progress_write_seconds",
+    "Time spent saving study progress.",
+)
+IMPORT_ROWS = Counter(
+    "flashcard_import_rows_total",
+    "Rows processed by background imports.",
+    ("status",),
+)
+IMPORT_SECONDS = Histogram(
+    "flashcard_import_duration_seconds",
+    "Time spent inserting the rows of a background import.",
+    buckets=IMPORT_BUCKETS,
+)
+IMPORT_ROWS_PER_SECOND = Gauge(
+    "flashcard_import_rows_per_second",
+    "Rows per second written by the most recent successful import.",
+)
+ANSWER_EVENTS = Counter(
+    "flashcard_answer_events_total",
+    "Answer events logged in the background, by outcome (stored, dropped or failed).",
+    ("status",),
+)
+BACKUP_SECONDS = Histogram(
+    "flashcard_backup_duration_seconds",
+    "Time taken by online database backups.",
+    buckets=IMPORT_BUCKETS,
+)
+BACKUP_BYTES = Counter(
+    "flashcard_backup_bytes_total",
+    "Bytes written by online database backups, shards included.",
+)
+
+WRITER_ITEMS = Counter(
+    "flashcard_writer_items_total",
+    "Write operations handled by the background writer, by outcome.",
+    ("writer", "status"),
+)
+WRITER_QUEUE_DEPTH = Gauge(
+    "flashcard_writer_queue_depth",
+    "Write operations waiting for the background writer.",
+    ("writer",),
+)
+WRITER_BATCH_SIZE = Histogram(
+    "flashcard_writer_batch_size",
+    "Write operations per group commit of the background writer.",
+    ("writer",),
+    buckets=BATCH_SIZE_BUCKETS,
+)
+WRITER_BATCH_SECONDS = Histogram(
+    "flashcard_writer_batch_seconds",
+    "Time spent writing one batch, including the commit.",
+    ("writer",),
+)
+
+CACHE_LOOKUPS = Counter(
+    "flashcard_cache_lookups_total",
+    "Lookups in in-process caches, by result (hit or miss).",
+    ("cache", "result"),
+)
+CACHE_EVICTIONS = Counter(
+    "flashcard_cache_evictions_total",
+    "Entries evicted from in-process caches to stay within their limits.",
+    ("cache",),
+)
+CACHE_ENTRIES = Gauge(
+    "flashcard_cache_entries",
+    "Entries held by an in-process cache.",
+    ("cache",),
+)
+CACHE_BYTES = Gauge(
+    "flashcard_cache_bytes",
+    "Approximate memory used by the entries of an in-process cache.",
+    ("cache",),
+)
+
+
+# --- SQL Instrumentation ---
+def record_sql(seconds, statements=1):
+    """Accounts SQL work to the global counters and to the current request, if any."""
+    SQL_STATEMENTS.inc(statements)
+    SQL_SECONDS.inc(seconds)
+    if has_request_context():
+        g._metrics_sql_statements = g.get("_metrics_sql_statements", 0) + statements
+        g._metrics_sql_seconds = g.get("_metrics_sql_seconds", 0.0) + seconds
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement and fetch (fetches add time, not statements)."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            record_sql(time.perf_counter() - start, statements=0)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            record_sql(time.perf_counter() - start, statements=0)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record_sql(time.perf_counter() - start, statements=0)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, shortcut execute*() calls and commits are timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_sql(time.perf_counter() - start)
+
+
+# --- Request Instrumentation ---
+def _start_request_timer():
+    g._metrics_started = time.perf_counter()
+    g._metrics_sql_statements = 0
+    g._metrics_sql_seconds = 0.0
+
+
+def _record_request(status):
+    started = g.pop("_metrics_started", None)
+    if started is None:
+        return  # Already recorded, or before_request never ran
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or "unmatched"
+    sql_statements = g.get("_metrics_sql_statements", 0)
+    sql_seconds = g.get("_metrics_sql_seconds", 0.0)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=status)
+    REQUEST_SQL_STATEMENTS.observe(sql_statements, endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(sql_seconds, endpoint=endpoint)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        print(
+            f"Slow request: {request.method} {request.full_path.rstrip('?')} -> {status} "
+            f"in {elapsed * 1000:.1f} ms ({sql_statements} SQL statements, "
+            f"{sql_seconds * 1000:.1f} ms in SQL)"
+        )
+
+
+def _record_response(response):
+    _record_request(response.status_code)
+    return response
+
+
+def _record_failed_request(exception=None):
+    # Only reached without a recorded response when a view raised an unhandled error
+    if exception is not None:
+        _record_request(500)
+
+
+def init_app(app):
+    """Times every request of the app and accounts its SQL work."""
+    app.before_request(_start_request_timer)
+    app.after_request(_record_response)
+    app.teardown_request(_record_failed_request)
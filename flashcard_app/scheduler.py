@@ -0,0 +1,43 @@
+# --- SM-2 Spaced Repetition ---
+# Grades follow the original SM-2 scale: 0-2 mean the card was forgotten,
+# 3 = recalled with difficulty, 4 = recalled, 5 = recalled easily.
+MIN_QUALITY = 0
+MAX_QUALITY = 5
+PASSING_QUALITY = 3
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+SECONDS_PER_DAY = 24 * 60 * 60
+# Intervals grow geometrically; capping them keeps due_at within SQLite's 64-bit INTEGER
+MAX_INTERVAL_DAYS = 100 * 365
+
+
+def schedule_review(ease, interval_days, repetitions, quality, now):
+    """
+    Computes the next SM-2 schedule of a card graded with `quality` at unix time `now`.
+    Returns a dict with the new ease, interval_days, repetitions and due_at.
+    """
+    if not (MIN_QUALITY <= quality <= MAX_QUALITY):
+        raise ValueError(f"Quality must be between {MIN_QUALITY} and {MAX_QUALITY}, got {quality}.")
+
+    if quality < PASSING_QUALITY:
+        # Forgotten: start the repetition sequence over
+        repetitions = 0
+        interval_days = 1
+    else:
+        if repetitions == 0:
+            interval_days = 1
+        elif repetitions == 1:
+            interval_days = 6
+        else:
+            interval_days = min(round(interval_days * ease), MAX_INTERVAL_DAYS)
+        repetitions += 1
+
+    # The ease factor is adjusted after every grade, but never drops below MIN_EASE
+    ease = max(MIN_EASE, ease + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
+
+    return {
+        "ease": ease,
+        "interval_days": interval_days,
+        "repetitions": repetitions,
+        "due_at": int(now + interval_days * SECONDS_PER_DAY),
+    }
@@ -0,0 +1,67 @@
+// --- Import Job Polling ---
+const importStatus = document.getElementById('import-status');
+const importStatusText = document.getElementById('import-status-text');
+const importProgress = document.getElementById('import-progress');
+const IMPORT_POLL_INTERVAL_MS = 1000;
+
+function describeImportJob(job) {
+    switch (job.status) {
+        case 'queued':
+            return `Import of '${job.dataset_name}' is queued...`;
+        case 'validating':
+            return `Checking '${job.dataset_name}': ${job.rows_parsed} rows read...`;
+        case 'importing':
+            return `Importing '${job.dataset_name}': ${job.rows_processed} of ${job.rows_parsed} cards...`;
+        case 'done':
+            if (job.mode === 'update') {
+                const changes = job.changes;
+                return `Updated '${job.dataset_name}': ${changes.inserted} added, ${changes.updated} changed, ` +
+                       `${changes.moved} moved, ${changes.deleted} removed, ${changes.unchanged} unchanged.`;
+            }
+            return `Imported '${job.dataset_name}' with ${job.rows_inserted} cards.`;
+        default:
+            return `Import of '${job.dataset_name}' failed: ${job.error}`;
+    }
+}
+
+function pollImportJob() {
+    fetch(importStatus.dataset.jobUrl)
+    .then(response => {
+        if (!response.ok) {
+            return response.json().then(err => { throw new Error(err.message || `HTTP error! status: ${response.status}`) });
+        }
+        return response.json();
+    })
+    .then(job => {
+        importStatusText.textContent = describeImportJob(job);
+        if (job.status === 'importing' && job.rows_parsed > 0) {
+            importProgress.max = job.rows_parsed;
+            importProgress.value = job.rows_processed;
+        }
+
+        if (job.status === 'done') {
+            importProgress.max = 1;
+            importProgress.value = 1;
+            importStatusText.style.color = 'green';
+            // Reload without the job parameter so the new dataset is listed
+            setTimeout(() => { window.location.href = window.location.pathname; }, 1500);
+        } else if (job.status === 'failed') {
+            importProgress.remove();
+            importStatusText.style.color = 'red';
+        } else {
+            setTimeout(pollImportJob, IMPORT_POLL_INTERVAL_MS);
+        }
+    })
+    .catch(error => {
+        console.error('Error polling import job:', error);
+        importProgress.remove();
+        importStatusText.textContent = 'Could not get the import status.';
+        importStatusText.style.color = 'red';
+    });
+}
+
+// Only poll when the page was opened right after an upload
+if (importStatus) {
+    pollImportJob();
+}
+// --- End Import Job Polling ---
@@ -3,10 +3,108 @@ function toggleAnswer() {
     cardElement.classList.toggle('show-answer');
 }
 
+// --- Batched Card Edits ---
+// Note edits and review flag changes are queued and sent together to the
+// batch endpoint once the user pauses, instead of one request per change.
+const CARD_EDITS_URL = '/api/cards/batch';
+const CARD_EDITS_DEBOUNCE_MS = 800;
+const pendingNoteEdits = new Map(); // card id -> latest notes text
+const pendingReviewEdits = new Map(); // card id -> latest review flag
+let cardEditsTimeout;
+let cardEditsInFlight = null;
+
+function cardEditsPayload() {
+    const payload = {
+        notes: Array.from(pendingNoteEdits, ([cardId, notes]) => ({ card_id: cardId, notes: notes })),
+        review: Array.from(pendingReviewEdits, ([cardId, marked]) => ({ card_id: cardId, mark_for_review: marked })),
+    };
+    pendingNoteEdits.clear();
+    pendingReviewEdits.clear();
+    return payload;
+}
+
+function queueCardEdit(edits, cardId, value) {
+    edits.set(parseInt(cardId, 10), value);
+    clearTimeout(cardEditsTimeout);
+    cardEditsTimeout = setTimeout(flushCardEdits, CARD_EDITS_DEBOUNCE_MS);
+}
+
+function flushCardEdits() {
+    if (pendingNoteEdits.size === 0 && pendingReviewEdits.size === 0) {
+        return;
+    }
+    if (cardEditsInFlight) {
+        // Send what accumulates meanwhile once the current batch is done
+        cardEditsInFlight.finally(flushCardEdits);
+        return;
+    }
+
+    const payload = cardEditsPayload();
+    cardEditsInFlight = fetch(CARD_EDITS_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    })
+    .then(response => {
+        if (!response.ok) {
+            return response.json().then(err => { throw new Error(err.message || `HTTP error! status: ${response.status}`) });
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (data.status !== 'success') {
+            throw new Error(data.message || 'Unknown error saving changes.');
+        }
+        if (payload.notes.length) {
+            showEditStatus(notesStatus, 'Saved', 'green');
+        }
+        if (payload.review.length) {
+            showEditStatus(reviewStatus, 'Status updated', 'green');
+        }
+    })
+    .catch(error => {
+        console.error('Error saving card changes:', error);
+        if (payload.notes.length) {
+            showEditStatus(notesStatus, 'Error saving!', 'red');
+        }
+        if (payload.review.length) {
+            showEditStatus(reviewStatus, 'Error updating!', 'red');
+        }
+    })
+    .finally(() => {
+        cardEditsInFlight = null;
+    });
+}
+
+const statusTimeouts = new Map();
+
+function showEditStatus(element, text, color, clearAfterMs = 3000) {
+    if (!element) {
+        return;
+    }
+    clearTimeout(statusTimeouts.get(element));
+    element.textContent = text;
+    element.style.color = color;
+    if (clearAfterMs) {
+        statusTimeouts.set(element, setTimeout(() => {
+            element.textContent = '';
+        }, clearAfterMs));
+    }
+}
+
+// Send queued edits before the page goes away
+window.addEventListener('pagehide', function() {
+    clearTimeout(cardEditsTimeout);
+    if (pendingNoteEdits.size || pendingReviewEdits.size) {
+        const body = new Blob([JSON.stringify(cardEditsPayload())], { type: 'application/json' });
+        navigator.sendBeacon(CARD_EDITS_URL, body);
+    }
+});
+// --- End Batched Card Edits ---
+
 // --- Notes Auto-Save Logic ---
 const notesTextarea = document.getElementById('card-notes');
 const notesStatus = document.getElementById('notes-status');
-let saveTimeout;
 
 // Check if notesTextarea exists before adding listener
 if (notesTextarea) {
@@ -14,41 +112,9 @@ if (notesTextarea) {
         const cardId = this.dataset.cardId;
         const notesContent = this.value;
 
-        clearTimeout(saveTimeout);
-        notesStatus.textContent = 'Saving...';
-        notesStatus.style.color = 'orange';
-
-        const formData = new FormData();
-        formData.append('notes', notesContent);
-
-        fetch(`/update_note/${cardId}`, {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(err => { throw new Error(err.message || `HTTP error! status: ${response.status}`) });
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data.status === 'success') {
-                notesStatus.textContent = 'Saved';
-                notesStatus.style.color = 'green';
-            } else {
-                throw new Error(data.message || 'Unknown error saving notes.');
-            }
-        })
-        .catch(error => {
-            console.error('Error saving notes:', error);
-            notesStatus.textContent = 'Error saving!';
-            notesStatus.style.color = 'red';
-        })
-        .finally(() => {
-            saveTimeout = setTimeout(() => {
-                notesStatus.textContent = '';
-            }, 3000);
-        });
+        updateCachedCard(cardId, { notes: notesContent });
+        queueCardEdit(pendingNoteEdits, cardId, notesContent);
+        showEditStatus(notesStatus, 'Saving...', 'orange', 0);
     });
 }
 // --- End Notes Auto-Save Logic ---
@@ -57,12 +123,9 @@ if (notesTextarea) {
 const reviewStatus = document.getElementById('review-status');
 const reviewIndicator = document.getElementById('review-indicator');
 const reviewToggleButton = document.getElementById('review-toggle-button'); // Get button for event listener
-let reviewTimeout;
 
 // Check if reviewToggleButton exists before adding listener
 if (reviewToggleButton) {
-    // Note: The onclick attribute is removed from the HTML later.
-    // We add the listener here instead.
     reviewToggleButton.addEventListener('click', function() {
         toggleReviewStatus(this); // Pass the button element itself
     });
@@ -71,59 +134,476 @@ if (reviewToggleButton) {
 function toggleReviewStatus(button) {
     const cardId = button.dataset.cardId;
 
-    clearTimeout(reviewTimeout);
-    // Check if reviewStatus exists before manipulating
-    if (reviewStatus) {
-        reviewStatus.textContent = 'Updating...';
-        reviewStatus.style.color = 'orange';
+    // Update the page right away; the explicit new state is queued, so
+    // repeated clicks coalesce into a single change
+    button.classList.toggle('marked');
+    const newIsMarked = button.classList.contains('marked');
+    button.textContent = newIsMarked ? 'Unmark for Review' : 'Mark for Review';
+    if (reviewIndicator) {
+        reviewIndicator.classList.toggle('visible', newIsMarked);
     }
 
+    updateCachedCard(cardId, { mark_for_review: newIsMarked });
+    queueCardEdit(pendingReviewEdits, cardId, newIsMarked);
+    showEditStatus(reviewStatus, 'Updating...', 'orange', 0);
+}
+// --- End Review Toggle Logic ---
+
+// --- Answer Recording ---
+// Picking a choice reveals the answer, marks the choice right or wrong and
+// logs it in the background. Only the first choice per card view is logged.
+const ANSWERS_URL = '/api/answers';
+const cardChoices = document.getElementById('card-choices');
+let cardShownAt = performance.now();
+let answerRecorded = false;
+
+function resetAnswerState() {
+    cardShownAt = performance.now();
+    answerRecorded = false;
+}
+
+function chooseAnswer(item) {
+    document.getElementById('card-container').classList.add('show-answer');
+    if (answerRecorded) {
+        return;
+    }
+    answerRecorded = true;
+
+    const chosenAnswer = item.dataset.choice;
+    const correct = chosenAnswer === document.getElementById('card-answer').textContent;
+    item.classList.add(correct ? 'chosen-correct' : 'chosen-incorrect');
 
-    fetch(`/toggle_review/${cardId}`, {
-        method: 'POST'
+    // Fire and forget: the server queues the event and answers right away
+    fetch(ANSWERS_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        keepalive: true,
+        body: JSON.stringify({
+            card_id: parseInt(notesTextarea.dataset.cardId, 10),
+            chosen_answer: chosenAnswer,
+            latency_ms: Math.round(performance.now() - cardShownAt)
+        })
     })
+    .catch(error => console.error('Error recording answer:', error));
+}
+
+if (cardChoices) {
+    cardChoices.addEventListener('click', function(event) {
+        const item = event.target.closest('li');
+        if (!item) {
+            return;
+        }
+        // The question area toggles the answer; picking a choice only reveals it
+        event.stopPropagation();
+        chooseAnswer(item);
+    });
+}
+// --- End Answer Recording ---
+
+// --- Client-Side Navigation with Prefetch ---
+// Cards are loaded in pages from the JSON API and rendered in place, so
+// Next/Previous do not reload the page. Progress is synced in the background.
+// Learn and exam cards are addressed by their index, review cards by their deck
+// position: the review set is walked through the marked cards after or before a
+// position (see fetchReviewPage), never by an offset into it.
+const cardNavigation = document.getElementById('card-navigation');
+const CARDS_PAGE_SIZE = 20; // Cards requested per API call
+const PREFETCH_MARGIN = 5; // Fetch the next page when this close to its start
+const PROGRESS_SYNC_DELAY_MS = 1000;
+const CHOICE_LETTERS = ['A', 'B', 'C', 'D', 'E'];
+
+const deck = cardNavigation ? {
+    mode: cardNavigation.dataset.mode,
+    keyset: cardNavigation.dataset.mode === 'review',
+    index: parseInt(cardNavigation.dataset.currentIndex, 10),
+    total: parseInt(cardNavigation.dataset.totalCards, 10),
+    cardsApiUrl: cardNavigation.dataset.cardsApiUrl,
+    progressApiUrl: cardNavigation.dataset.progressApiUrl,
+    learnUrl: cardNavigation.dataset.learnUrl,
+    cards: new Map(), // card index -> card JSON
+    pages: new Map(), // page offset (or review page key) -> Promise of the page request
+    // Review mode: position -> position of the next/previous marked card, null at the end
+    next: new Map(),
+    prev: new Map(),
+} : null;
+let progressSyncTimeout;
+let pendingProgressIndex = null;
+
+function cardUrl(index) {
+    // Exam positions are addressed without a mode (see show_exam_card)
+    if (deck.mode === 'exam') {
+        return `${deck.learnUrl}/${index}`;
+    }
+    return `${deck.learnUrl}/${index}/${deck.mode}`;
+}
+
+function fetchJson(url) {
+    return fetch(url)
     .then(response => {
         if (!response.ok) {
             return response.json().then(err => { throw new Error(err.message || `HTTP error! status: ${response.status}`) });
         }
         return response.json();
+    });
+}
+
+function fetchCardPage(index) {
+    const pageOffset = Math.floor(index / CARDS_PAGE_SIZE) * CARDS_PAGE_SIZE;
+    if (deck.pages.has(pageOffset)) {
+        return deck.pages.get(pageOffset);
+    }
+
+    const url = `${deck.cardsApiUrl}?mode=${encodeURIComponent(deck.mode)}&offset=${pageOffset}&limit=${CARDS_PAGE_SIZE}`;
+    const request = fetchJson(url)
+    .then(data => {
+        deck.total = data.total;
+        data.cards.forEach(card => deck.cards.set(card.index, card));
     })
+    .catch(error => {
+        deck.pages.delete(pageOffset); // Allow a retry
+        throw error;
+    });
+    deck.pages.set(pageOffset, request);
+    return request;
+}
+
+function linkReviewCards(previous, next) {
+    deck.next.set(previous, next);
+    deck.prev.set(next, previous);
+}
+
+// Loads the marked cards right after (direction 'after') or before ('before') a
+// deck position, and records how they and the position link up
+function fetchReviewPage(position, direction) {
+    const pageKey = `${direction}:${position}`;
+    if (deck.pages.has(pageKey)) {
+        return deck.pages.get(pageKey);
+    }
+
+    const url = `${deck.cardsApiUrl}?mode=review&${direction}=${position}&limit=${CARDS_PAGE_SIZE}`;
+    const request = fetchJson(url)
     .then(data => {
-        if (data.status === 'success') {
-            button.classList.toggle('marked');
-            const newIsMarked = button.classList.contains('marked');
-            button.textContent = newIsMarked ? 'Unmark for Review' : 'Mark for Review';
-
-            // Toggle visual indicator class if it exists
-            if (reviewIndicator) {
-                reviewIndicator.classList.toggle('visible', newIsMarked);
+        deck.total = data.total;
+        const positions = data.cards.map(card => {
+            deck.cards.set(card.index, card);
+            return card.index;
+        });
+        for (let i = 1; i < positions.length; i++) {
+            linkReviewCards(positions[i - 1], positions[i]);
+        }
+        const complete = positions.length < CARDS_PAGE_SIZE; // Nothing further in this direction
+        if (direction === 'after') {
+            const first = positions.length ? positions[0] : null;
+            if (first !== null && deck.cards.has(position)) {
+                linkReviewCards(position, first);
+            } else {
+                deck.next.set(position, first);
             }
-
-            if (reviewStatus) {
-                reviewStatus.textContent = 'Status updated';
-                reviewStatus.style.color = 'green';
+            if (complete) {
+                deck.next.set(positions.length ? positions[positions.length - 1] : position, null);
             }
         } else {
-            throw new Error(data.message || 'Unknown error toggling review status.');
+            const last = positions.length ? positions[positions.length - 1] : null;
+            if (last !== null && deck.cards.has(position)) {
+                linkReviewCards(last, position);
+            } else {
+                deck.prev.set(position, last);
+            }
+            if (complete) {
+                deck.prev.set(positions.length ? positions[0] : position, null);
+            }
         }
     })
     .catch(error => {
-        console.error('Error toggling review status:', error);
-        if (reviewStatus) {
-            reviewStatus.textContent = 'Error updating!';
-            reviewStatus.style.color = 'red';
+        deck.pages.delete(pageKey); // Allow a retry
+        throw error;
+    });
+    deck.pages.set(pageKey, request);
+    return request;
+}
+
+function getCard(index) {
+    if (deck.cards.has(index)) {
+        return Promise.resolve(deck.cards.get(index));
+    }
+    const request = deck.keyset ? fetchReviewPage(index - 1, 'after') : fetchCardPage(index);
+    return request.then(() => {
+        if (!deck.cards.has(index)) {
+            throw new Error(`Card ${index} is not available.`);
         }
+        return deck.cards.get(index);
+    });
+}
+
+// Index of the card before (step -1) or after (step 1) a card: null past the end,
+// undefined while the review set around it is not loaded yet
+function knownNeighbour(index, step) {
+    if (deck.keyset) {
+        return (step > 0 ? deck.next : deck.prev).get(index);
+    }
+    const neighbour = index + step;
+    return neighbour >= 0 && neighbour < deck.total ? neighbour : null;
+}
+
+function neighbourIndex(index, step) {
+    const neighbour = knownNeighbour(index, step);
+    if (neighbour !== undefined) {
+        return Promise.resolve(neighbour);
+    }
+    return fetchReviewPage(index, step > 0 ? 'after' : 'before')
+        .then(() => knownNeighbour(index, step) ?? null);
+}
+
+function prefetchAround(index) {
+    if (!deck.keyset) {
+        [index + PREFETCH_MARGIN, index - 1].forEach(neighbour => {
+            if (neighbour >= 0 && neighbour < deck.total && !deck.cards.has(neighbour)) {
+                fetchCardPage(neighbour).catch(error => console.error('Error prefetching cards:', error));
+            }
+        });
+        return;
+    }
+    // Follow the loaded review cards up to PREFETCH_MARGIN ahead and continue from there
+    let ahead = index;
+    for (let i = 0; i < PREFETCH_MARGIN && deck.next.get(ahead) != null; i++) {
+        ahead = deck.next.get(ahead);
+    }
+    [[ahead, 1], [index, -1]].forEach(([position, step]) => {
+        if (knownNeighbour(position, step) === undefined) {
+            fetchReviewPage(position, step > 0 ? 'after' : 'before')
+            .then(() => {
+                if (deck.index === index) {
+                    renderNavigation(index); // The neighbours of the shown card may be known now
+                }
+            })
+            .catch(error => console.error('Error prefetching cards:', error));
+        }
+    });
+}
+
+// Keep cached cards in sync with edits made on the page (no-op without a deck)
+function updateCachedCard(cardId, changes) {
+    if (!deck) {
+        return;
+    }
+    deck.cards.forEach(card => {
+        if (String(card.id) === String(cardId)) {
+            Object.assign(card, changes);
+        }
+    });
+}
+
+function shuffled(items) {
+    const copy = items.slice();
+    for (let i = copy.length - 1; i > 0; i--) {
+        const j = Math.floor(Math.random() * (i + 1));
+        [copy[i], copy[j]] = [copy[j], copy[i]];
+    }
+    return copy;
+}
+
+// The server renders the choices in their stored order, so a page revalidated
+// with a 304 is not stuck with one order; they are shuffled here for every view
+function shuffleRenderedChoices() {
+    const items = shuffled(Array.from(cardChoices.children));
+    items.forEach((item, i) => {
+        item.querySelector('kbd').textContent = CHOICE_LETTERS[i];
+    });
+    cardChoices.replaceChildren(...items);
+}
+
+function renderNavigation(index) {
+    // In review mode index is a deck position, not a rank in the review set
+    document.getElementById('card-counter').textContent = deck.keyset
+        ? `${deck.total} marked for review`
+        : `Card ${index + 1} of ${deck.total}`;
+    // Unknown review neighbours keep their links; they are looked up on click
+    const prevIndex = knownNeighbour(index, -1);
+    const nextIndex = knownNeighbour(index, 1);
+    document.getElementById('prev-card-item').hidden = prevIndex === null;
+    document.getElementById('prev-card-link').href = cardUrl(prevIndex ?? index);
+    const nextLink = document.getElementById('next-card-link');
+    nextLink.href = cardUrl(nextIndex ?? index);
+    nextLink.classList.toggle('disabled', nextIndex === null);
+}
+
+function renderCard(card, index) {
+    deck.index = index;
+    document.getElementById('card-container').classList.remove('show-answer');
+    document.getElementById('card-question').textContent = card.question;
+    document.getElementById('card-answer').textContent = card.correct_answer;
+    if (card.dataset_name) {
+        // Exam cards can come from several datasets
+        document.getElementById('card-dataset-name').textContent = card.dataset_name;
+    }
+
+    const choiceItems = shuffled(card.choices).map((choice, i) => {
+        const item = document.createElement('li');
+        const label = document.createElement('kbd');
+        label.textContent = CHOICE_LETTERS[i];
+        item.dataset.choice = choice;
+        item.append(label, ` ${choice}`);
+        return item;
+    });
+    document.getElementById('card-choices').replaceChildren(...choiceItems);
+    resetAnswerState();
+
+    if (notesTextarea) {
+        notesTextarea.value = card.notes;
+        notesTextarea.dataset.cardId = card.id;
+        notesStatus.textContent = '';
+    }
+    if (reviewToggleButton) {
+        reviewToggleButton.dataset.cardId = card.id;
+        reviewToggleButton.classList.toggle('marked', card.mark_for_review);
+        reviewToggleButton.textContent = card.mark_for_review ? 'Unmark for Review' : 'Mark for Review';
+    }
+    if (reviewIndicator) {
+        reviewIndicator.classList.toggle('visible', card.mark_for_review);
+    }
+    if (reviewStatus) {
+        reviewStatus.textContent = '';
+    }
+
+    renderNavigation(index);
+}
+
+function navigateToCard(index, pushHistory = true) {
+    if (!deck.keyset && (index < 0 || index >= deck.total)) {
+        return;
+    }
+    getCard(index)
+    .then(card => {
+        renderCard(card, index);
+        if (pushHistory) {
+            history.pushState({ cardIndex: index }, '', cardUrl(index));
+        }
+        scheduleProgressSync(index);
+        prefetchAround(index);
     })
-    .finally(() => {
-        // Check if reviewStatus exists before setting timeout
-        if (reviewStatus) {
-            reviewTimeout = setTimeout(() => {
-                reviewStatus.textContent = '';
-            }, 3000);
+    .catch(error => {
+        // Fall back to a regular page load
+        console.error('Error loading card:', error);
+        window.location.href = cardUrl(index);
+    });
+}
+
+// Moves to the previous (step -1) or next (step 1) card, if there is one
+function navigateBy(step) {
+    const from = deck.index;
+    neighbourIndex(from, step)
+    .then(index => {
+        if (index !== null && deck.index === from) {
+            navigateToCard(index);
+        }
+    })
+    .catch(error => console.error('Error loading cards:', error));
+}
+
+// Progress is only tracked in learn mode, like the server-rendered pages do
+function scheduleProgressSync(index) {
+    if (deck.mode !== 'learn') {
+        return;
+    }
+    pendingProgressIndex = index;
+    clearTimeout(progressSyncTimeout);
+    progressSyncTimeout = setTimeout(syncProgress, PROGRESS_SYNC_DELAY_MS);
+}
+
+function syncProgress() {
+    if (pendingProgressIndex === null) {
+        return;
+    }
+    const body = JSON.stringify({ card_index: pendingProgressIndex });
+    pendingProgressIndex = null;
+    fetch(deck.progressApiUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: body
+    })
+    .catch(error => console.error('Error saving progress:', error));
+}
+
+if (deck) {
+    shuffleRenderedChoices();
+    if (deck.keyset) {
+        // The server already looked up the marked cards around this one
+        const { prevIndex, nextIndex } = cardNavigation.dataset;
+        deck.prev.set(deck.index, prevIndex === '' ? null : parseInt(prevIndex, 10));
+        deck.next.set(deck.index, nextIndex === '' ? null : parseInt(nextIndex, 10));
+    }
+    history.replaceState({ cardIndex: deck.index }, '', window.location.href);
+    // Warm the cache with the page of the current card and its neighbours
+    getCard(deck.index).then(() => prefetchAround(deck.index))
+        .catch(error => console.error('Error prefetching cards:', error));
+
+    document.getElementById('prev-card-link').addEventListener('click', function(event) {
+        event.preventDefault();
+        navigateBy(-1);
+    });
+    document.getElementById('next-card-link').addEventListener('click', function(event) {
+        event.preventDefault();
+        if (!this.classList.contains('disabled')) {
+            navigateBy(1);
+        }
+    });
+
+    window.addEventListener('popstate', function(event) {
+        if (event.state && typeof event.state.cardIndex === 'number') {
+            navigateToCard(event.state.cardIndex, false);
+        }
+    });
+
+    // Send a pending progress update before the page goes away
+    window.addEventListener('pagehide', function() {
+        if (pendingProgressIndex !== null) {
+            const body = new Blob([JSON.stringify({ card_index: pendingProgressIndex })], { type: 'application/json' });
+            navigator.sendBeacon(deck.progressApiUrl, body);
+            pendingProgressIndex = null;
         }
     });
 }
-// --- End Review Toggle Logic ---
+// --- End Client-Side Navigation ---
+
+// --- Due Mode Grading ---
+const gradeSection = document.getElementById('grade-section');
+const gradeStatus = document.getElementById('grade-status');
+const gradeButtons = document.querySelectorAll('.grade-button');
+
+function gradeCard(quality) {
+    gradeButtons.forEach(button => { button.disabled = true; });
+    showEditStatus(gradeStatus, 'Saving...', 'orange', 0);
+
+    // Queued card edits must not be lost when moving to the next card
+    flushCardEdits();
+
+    fetch(gradeSection.dataset.gradeUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ quality: quality })
+    })
+    .then(response => {
+        if (!response.ok) {
+            return response.json().then(err => { throw new Error(err.message || `HTTP error! status: ${response.status}`) });
+        }
+        return response.json();
+    })
+    .then(() => {
+        window.location.href = gradeSection.dataset.nextUrl;
+    })
+    .catch(error => {
+        console.error('Error grading card:', error);
+        showEditStatus(gradeStatus, 'Error saving grade!', 'red');
+        gradeButtons.forEach(button => { button.disabled = false; });
+    });
+}
+
+gradeButtons.forEach(button => {
+    button.addEventListener('click', function() {
+        gradeCard(parseInt(this.dataset.quality, 10));
+    });
+});
+// --- End Due Mode Grading ---
 
 // --- Keyboard Navigation ---
 // Add this event listener to the document
@@ -133,21 +613,30 @@ document.addEventListener('keydown', function(event) {
         return; // Exit if not on the learn page
     }
 
+    // Let the notes textarea receive spaces and arrow keys
+    if (event.target.tagName === 'TEXTAREA') {
+        return;
+    }
+
     // Prevent default behavior for spacebar if needed (e.g., scrolling)
     if (event.code === 'Space') {
         event.preventDefault();
         toggleAnswer();
-    } else if (event.code === 'ArrowLeft') {
-        // Updated selector for Previous button
-        const prevButton = document.querySelector('.navigation ul:first-of-type a');
-        if (prevButton && !prevButton.classList.contains('disabled')) {
-            window.location.href = prevButton.href; // Navigate
-        }
-    } else if (event.code === 'ArrowRight') {
-        // Updated selector for Next button
-        const nextButton = document.querySelector('.navigation ul:last-of-type a');
-        if (nextButton && !nextButton.classList.contains('disabled')) {
-            window.location.href = nextButton.href; // Navigate
+    } else if (deck && event.code === 'ArrowLeft') {
+        navigateBy(-1);
+    } else if (deck && event.code === 'ArrowRight') {
+        navigateBy(1);
+    } else if (cardChoices && /^Key[A-E]$/.test(event.code) && !event.ctrlKey && !event.metaKey && !event.altKey) {
+        // Keys A-E pick the choice with that label
+        const choiceItem = cardChoices.children['ABCDE'.indexOf(event.code.slice(-1))];
+        if (choiceItem) {
+            chooseAnswer(choiceItem);
+        }
+    } else if (gradeSection && /^Digit[1-4]$/.test(event.code)) {
+        // Keys 1-4 press the matching grade button
+        const gradeButton = gradeButtons[parseInt(event.code.slice(-1), 10) - 1];
+        if (gradeButton && !gradeButton.disabled) {
+            gradeButton.click();
         }
     }
 });
@@ -0,0 +1,332 @@
+"""
+Concurrency stress test for the production server.
+
+Starts gunicorn (gunicorn.conf.py) with several worker processes on a temporary
+data directory and hammers the write endpoints from many client threads while
+other datasets are being imported. Afterwards the database is checked for lost
+updates:
+
+* review flags: each card's flag matches the parity of its successful toggles
+* SM-2 grades: each card's repetitions equal its successful "Good" grades
+* notes and progress: the stored value is one of the values written
+* imports: every upload finishes with all its rows, and its status can be polled
+  from whichever worker answers
+
+    python stress.py --workers 4 --threads 4 --clients 32 --operations 5000
+
+With --shards every dataset is stored in a shard file of its own.
+
+Exits with status 1 if a check fails.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import encode_multipart, synthetic_csv
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Seconds to wait for the server to start and for imports to finish
+STARTUP_TIMEOUT = 30
+IMPORT_TIMEOUT = 300
+# Generous, so a slow response is never mistaken for a failed (unapplied) write
+REQUEST_TIMEOUT = 60
+OPERATIONS = ("toggle_review", "grade", "update_note", "save_progress")
+
+
+# --- Server ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir, port, workers, threads, shards=False):
+    """Starts gunicorn on the data directory and waits until it answers."""
+    env = dict(
+        os.environ,
+        FLASHCARD_DATA_DIR=data_dir,
+        FLASHCARD_BIND=f"127.0.0.1:{port}",
+        FLASHCARD_WORKERS=str(workers),
+        FLASHCARD_THREADS=str(threads),
+        FLASHCARD_DATASET_SHARDS="1" if shards else "0",
+    )
+    log_file = open(os.path.join(data_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "app:app"],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=log_file,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start, see {log_file.name}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# --- Client ---
+def call(base_url, method, path, json_body=None, form=None):
+    """Sends one request and returns (status, decoded JSON body or None)."""
+    headers = {"Accept": "application/json"}
+    body = None
+    if json_body is not None:
+        body = json.dumps(json_body).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    elif form is not None:
+        body, headers["Content-Type"] = encode_multipart(form)
+    http_request = urllib.request.Request(base_url + path, data=body, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(http_request, timeout=REQUEST_TIMEOUT) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    try:
+        return status, json.loads(payload)
+    except ValueError:
+        return status, None
+
+
+def upload(base_url, name, rows, seed):
+    """Starts an import through the upload form; returns its job ID."""
+    form = {"dataset_name": name, "csv_file": (io.BytesIO(synthetic_csv(rows, seed)), f"{name}.csv")}
+    status, job = call(base_url, "POST", "/upload", form=form)
+    if status != 202:
+        raise RuntimeError(f"Upload of '{name}' failed with status {status}")
+    return job["id"]
+
+
+def wait_for_job(base_url, job_id):
+    """Polls a job (answered by any worker) until it finishes; returns its final status."""
+    deadline = time.time() + IMPORT_TIMEOUT
+    while time.time() < deadline:
+        status, job = call(base_url, "GET", f"/jobs/{job_id}")
+        if status != 200:
+            return {"status": f"unknown to a worker (HTTP {status})"}
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.2)
+    return {"status": "timed out"}
+
+
+# --- Workload ---
+class Ledger:
+    """Successful writes per card, recorded by the client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.toggles = Counter()
+        self.grades = Counter()
+        self.notes = defaultdict(set)
+        self.progress = set()
+        self.succeeded = Counter()
+        self.failed = Counter()
+
+
+def run_client(base_url, dataset_id, card_ids, deck_size, operations, ledger, seed):
+    rng = random.Random(seed)
+    for sequence in range(operations):
+        operation = rng.choice(OPERATIONS)
+        card_id = rng.choice(card_ids)
+        if operation == "toggle_review":
+            status, _ = call(base_url, "POST", f"/toggle_review/{card_id}")
+        elif operation == "grade":
+            status, _ = call(base_url, "POST", f"/api/cards/{card_id}/grade", json_body={"quality": 4})
+        elif operation == "update_note":
+            note = f"note {seed}-{sequence}"
+            status, _ = call(base_url, "POST", f"/update_note/{card_id}", json_body={"notes": note})
+        else:
+            card_index = rng.randrange(deck_size)
+            status, _ = call(
+                base_url, "POST", f"/api/datasets/{dataset_id}/progress", json_body={"card_index": card_index}
+            )
+        with ledger.lock:
+            if status != 200:
+                ledger.failed[operation] += 1
+                continue
+            ledger.succeeded[operation] += 1
+            if operation == "toggle_review":
+                ledger.toggles[card_id] += 1
+            elif operation == "grade":
+                ledger.grades[card_id] += 1
+            elif operation == "update_note":
+                ledger.notes[card_id].add(note)
+            else:
+                ledger.progress.add(card_index)
+
+
+# --- Checks ---
+def cards_database(database_path, dataset_id):
+    """Returns the file holding a dataset's cards: its shard if it has one, else the main database."""
+    shard_path = os.path.join(os.path.dirname(database_path), "datasets", f"{dataset_id}.db")
+    return shard_path if os.path.exists(shard_path) else database_path
+
+
+def count_cards(database_path, dataset_id):
+    """Counts the cards stored for a dataset."""
+    with sqlite3.connect(cards_database(database_path, dataset_id)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM cards WHERE dataset_id = ?", (dataset_id,)).fetchone()[0]
+
+
+def check_database(database_path, dataset_id, card_ids, ledger, import_results):
+    """Returns a list of human-readable failures (empty if no update was lost)."""
+    failures = []
+    conn = sqlite3.connect(database_path)
+    conn.row_factory = sqlite3.Row
+    cards_conn = sqlite3.connect(cards_database(database_path, dataset_id))
+    cards_conn.row_factory = sqlite3.Row
+    try:
+        placeholders = ",".join("?" * len(card_ids))
+        rows = cards_conn.execute(
+            f"SELECT id, mark_for_review, repetitions, notes FROM cards WHERE id IN ({placeholders})",
+            card_ids,
+        ).fetchall()
+        for row in rows:
+            card_id = row["id"]
+            expected_flag = ledger.toggles[card_id] % 2
+            if row["mark_for_review"] != expected_flag:
+                failures.append(
+                    f"card {card_id}: review flag {row['mark_for_review']} after "
+                    f"{ledger.toggles[card_id]} toggles"
+                )
+            if row["repetitions"] != ledger.grades[card_id]:
+                failures.append(
+                    f"card {card_id}: {row['repetitions']} repetitions after "
+                    f"{ledger.grades[card_id]} grades"
+                )
+            written = ledger.notes[card_id]
+            if (row["notes"] or "") not in (written or {""}):
+                failures.append(f"card {card_id}: notes '{row['notes']}' were never written")
+
+        progress = conn.execute(
+            "SELECT card_index FROM progress WHERE dataset_id = ?", (dataset_id,)
+        ).fetchone()
+        if ledger.progress and (progress is None or progress["card_index"] not in ledger.progress):
+            failures.append(f"progress {progress and progress['card_index']} was never written")
+
+        for name, rows_expected, job in import_results:
+            imported = conn.execute("SELECT id FROM datasets WHERE name = ?", (name,)).fetchone()
+            count = count_cards(database_path, imported["id"]) if imported else 0
+            if job.get("status") != "done" or count != rows_expected:
+                failures.append(
+                    f"import '{name}': job {job.get('status')}, {count} of {rows_expected} rows"
+                )
+    finally:
+        cards_conn.close()
+        conn.close()
+    return failures
+
+
+# --- Main ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check the production server for lost updates under load.")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes (default: 4)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker (default: 4)")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent client threads (default: 32)")
+    parser.add_argument("--operations", type=int, default=4000, help="Total write requests (default: 4000)")
+    parser.add_argument("--deck-size", type=int, default=500, help="Cards in the stressed deck (default: 500)")
+    parser.add_argument("--hot-cards", type=int, default=20,
+                        help="Cards the writes are spread over; fewer means more contention (default: 20)")
+    parser.add_argument("--imports", type=int, default=4, help="Uploads running during the writes (default: 4)")
+    parser.add_argument("--import-rows", type=int, default=5000, help="Rows per concurrent upload (default: 5000)")
+    parser.add_argument("--shards", action="store_true", help="Store each dataset in a shard file of its own")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the temporary data directory")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = tempfile.mkdtemp(prefix="flashcard-stress-")
+    process, base_url = start_server(data_dir, free_port(), args.workers, args.threads, args.shards)
+    print(f"Started {args.workers} workers x {args.threads} threads at {base_url} (data in {data_dir})")
+    try:
+        deck_job = wait_for_job(base_url, upload(base_url, "stress-deck", args.deck_size, args.seed))
+        if deck_job.get("status") != "done":
+            raise RuntimeError(f"Could not import the stress deck: {deck_job}")
+        dataset_id = deck_job["dataset_id"]
+        with sqlite3.connect(cards_database(os.path.join(data_dir, "flashcard.db"), dataset_id)) as conn:
+            card_ids = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM cards WHERE dataset_id = ? ORDER BY position LIMIT ?",
+                    (dataset_id, args.hot_cards),
+                )
+            ]
+
+        ledger = Ledger()
+        operations_per_client = max(args.operations // args.clients, 1)
+        import_names = [f"stress-import-{i}" for i in range(args.imports)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients + args.imports) as pool:
+            import_futures = [
+                pool.submit(lambda name, i: wait_for_job(base_url, upload(base_url, name, args.import_rows, i)), name, i)
+                for i, name in enumerate(import_names)
+            ]
+            client_futures = [
+                pool.submit(
+                    run_client, base_url, dataset_id, card_ids, args.deck_size,
+                    operations_per_client, ledger, args.seed * 1000 + client,
+                )
+                for client in range(args.clients)
+            ]
+            for future in client_futures:
+                future.result()
+            import_results = [
+                (name, args.import_rows, future.result())
+                for name, future in zip(import_names, import_futures)
+            ]
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_server(process)
+
+    total = sum(ledger.succeeded.values()) + sum(ledger.failed.values())
+    print(f"{total} write requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    for operation in OPERATIONS:
+        print(f"  {operation:<14} {ledger.succeeded[operation]:>6} ok  {ledger.failed[operation]:>4} failed")
+
+    failures = check_database(
+        os.path.join(data_dir, "flashcard.db"), dataset_id, card_ids, ledger, import_results
+    )
+    if not args.keep_data:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if failures:
+        print(f"FAILED: {len(failures)} lost or inconsistent updates")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("OK: no lost updates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import os
+import sys
+import uuid
+import shutil
+import tempfile
+
+# The app's modules read their configuration when they are imported, so point
+# them at a scratch data directory before any test imports them
+DATA_DIR = tempfile.mkdtemp(prefix="flashcard-tests-")
+os.environ["FLASHCARD_DATA_DIR"] = DATA_DIR
+os.environ["FLASHCARD_DATASET_SHARDS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import database
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """Migrates the scratch database once for the whole session."""
+    assert database.init_db()
+    yield
+    database.flush_writes()
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def dataset_name():
+    """Returns a dataset name no other test uses (they all share one database)."""
+    return f"test-{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def make_cards():
+    """Returns a function building count card dicts in the shape import_dataset expects."""
+
+    def make(count, prefix="Question"):
+        return [
+            {
+                "question": f"{prefix} {i}",
+                "correct_answer": f"Answer {i}",
+                "choice1": f"Answer {i}",
+                "choice2": f"Wrong {i}a",
+                "choice3": f"Wrong {i}b",
+                "choice4": f"Wrong {i}c",
+                "choice5": None,
+                "notes": "",
+                "mark_for_review": i % 10 == 0,
+            }
+            for i in range(count)
+        ]
+
+    return make
@@ -0,0 +1,75 @@
+import io
+import sqlite3
+import zipfile
+import pytest
+import database
+import importers
+from app import app
+
+ANKI_NOTES = [
+    ("Capital of France?\x1fParis", "marked"),
+    ("The {{c1::mitochondria}} is the powerhouse of the cell\x1fBiology", ""),
+    ("2 + 2<br>in decimal\x1f<b>4</b>\x1fArithmetic", ""),
+]
+
+
+def make_apkg(tmp_path, notes):
+    """Returns an .apkg file holding a collection with the given (flds, tags) notes."""
+    collection_path = tmp_path / "collection.anki2"
+    conn = sqlite3.connect(collection_path)
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, flds TEXT NOT NULL, tags TEXT NOT NULL)")
+    conn.executemany("INSERT INTO notes (flds, tags) VALUES (?, ?)", notes)
+    conn.commit()
+    conn.close()
+    package = io.BytesIO()
+    with zipfile.ZipFile(package, "w") as archive:
+        archive.write(collection_path, "collection.anki2")
+    package.seek(0)
+    return package
+
+
+def deck_cards(dataset_id):
+    cards, _ = database.get_cards_window(dataset_id, 0, 100)
+    return [
+        (card["question"], card["correct_answer"], card["notes"], bool(card["mark_for_review"]))
+        for card in cards
+    ]
+
+
+@pytest.mark.parametrize("export_format", ["csv", "jsonl"])
+def test_anki_deck_survives_export_and_reimport(tmp_path, dataset_name, export_format):
+    package = make_apkg(tmp_path, ANKI_NOTES)
+    dataset_id, card_count = database.import_dataset(dataset_name, importers.parse_apkg_upload(package))
+    assert card_count == len(ANKI_NOTES)
+
+    response = app.test_client().get(f"/export/{dataset_id}.{export_format}")
+    assert response.status_code == 200
+
+    parse_upload = importers.get_importer(f"deck.{export_format}")
+    reimported_id, reimported_count = database.import_dataset(
+        f"{dataset_name}-reimported", parse_upload(io.BytesIO(response.data))
+    )
+    assert reimported_count == len(ANKI_NOTES)
+    assert deck_cards(reimported_id) == deck_cards(dataset_id)
+    # Still studied by revealing the answer
+    cards, _ = database.get_cards_window(reimported_id, 0, 100)
+    assert all(card["choice1"] == "" and card["choice5"] is None for card in cards)
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        ['"Q","A","One","","",""'],
+        ['"Q","A","","","","","Five"'],
+    ],
+    ids=["some-choices", "only-choice5"],
+)
+def test_csv_rejects_partial_choices(lines):
+    with pytest.raises(ValueError, match="Choices 1-4"):
+        list(importers.parse_csv_upload(io.BytesIO(("header\n" + "\n".join(lines) + "\n").encode())))
+
+
+def test_upload_form_accepts_every_importer():
+    page = app.test_client().get("/").get_data(as_text=True)
+    assert 'accept=".apkg,.csv,.jsonl"' in page
+    assert sorted(importers.IMPORTERS) == ["apkg", "csv", "jsonl"]
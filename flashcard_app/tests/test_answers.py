@@ -0,0 +1,106 @@
+import sqlite3
+import pytest
+import app as flashcard_app
+import database
+import metrics
+
+
+@pytest.fixture
+def client():
+    return flashcard_app.app.test_client()
+
+
+@pytest.fixture
+def deck(dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(3))
+    cards, _ = database.get_cards_window(dataset_id, 0, 3)
+    return dataset_id, cards
+
+
+def answer_count(status):
+    return metrics.ANSWER_EVENTS._values.get((status,), 0)
+
+
+def post_answers(client, events):
+    response = client.post("/api/answers", json={"events": events})
+    database.flush_writes()
+    return response
+
+
+def test_answers_are_aggregated_per_dataset_and_card(client, deck):
+    dataset_id, cards = deck
+    first, second, _ = cards
+    response = post_answers(
+        client,
+        [
+            {"card_id": first["id"], "chosen_answer": first["correct_answer"], "latency_ms": 1000},
+            {"card_id": first["id"], "chosen_answer": "Wrong", "latency_ms": 3000},
+            {"card_id": second["id"], "chosen_answer": second["correct_answer"], "latency_ms": 2000},
+        ],
+    )
+    assert response.status_code == 202
+    assert response.get_json()["events"] == 3
+
+    stats = client.get(f"/api/datasets/{dataset_id}/answer_stats").get_json()
+    assert (stats["attempts"], stats["correct"]) == (3, 2)
+    assert stats["accuracy"] == pytest.approx(2 / 3)
+    assert stats["average_latency_ms"] == pytest.approx(2000)
+    # Least accurate card first; the unanswered card is not listed
+    assert [(card["index"], card["attempts"], card["correct"]) for card in stats["cards"]] == [
+        (0, 2, 1),
+        (1, 1, 1),
+    ]
+    assert stats["cards"][0]["accuracy"] == 0.5
+
+
+def test_unanswered_dataset_has_empty_stats(client, deck):
+    dataset_id, _ = deck
+    stats = client.get(f"/api/datasets/{dataset_id}/answer_stats").get_json()
+    assert (stats["attempts"], stats["accuracy"], stats["cards"]) == (0, None, [])
+    assert client.get("/api/datasets/999999/answer_stats").status_code == 404
+
+
+def test_events_of_unknown_cards_are_dropped(client, deck):
+    _, cards = deck
+    stored, dropped = answer_count("stored"), answer_count("dropped")
+
+    post_answers(
+        client,
+        [
+            {"card_id": cards[0]["id"], "chosen_answer": "Wrong"},
+            {"card_id": 999999999, "chosen_answer": "Wrong"},
+        ],
+    )
+
+    assert answer_count("stored") == stored + 1
+    assert answer_count("dropped") == dropped + 1
+
+
+def test_failed_writes_are_counted(client, deck, monkeypatch, capsys):
+    _, cards = deck
+
+    def failing_write(cursor, events):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database, "_record_answer_events", failing_write)
+    failed = answer_count("failed")
+
+    response = post_answers(client, [{"card_id": cards[0]["id"], "chosen_answer": "Wrong"}])
+
+    # Already accepted, so the failure shows up in the log and the metrics
+    assert response.status_code == 202
+    assert answer_count("failed") == failed + 1
+    assert "Error recording 1 answer events: disk I/O error" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"events": []},
+        {"card_id": 1},
+        {"card_id": 1, "chosen_answer": "A", "latency_ms": -5},
+        {"card_id": "one", "chosen_answer": "A"},
+    ],
+)
+def test_invalid_events_are_refused(client, body):
+    assert client.post("/api/answers", json=body).status_code == 400
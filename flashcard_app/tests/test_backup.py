@@ -0,0 +1,66 @@
+import os
+import pytest
+import backup
+import database
+
+
+@pytest.fixture(params=[False, True], ids=["main", "shard"])
+def shards(request, monkeypatch):
+    monkeypatch.setattr(database, "DATASET_SHARDS", request.param)
+    return request.param
+
+
+def catalog_version():
+    conn = database.get_db_connection()
+    return conn.execute("SELECT version FROM catalog_state").fetchone()[0]
+
+
+def test_backup_and_restore_round_trip(tmp_path, shards, dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(30))
+    card, _ = database.get_card_by_position(dataset_id, 4)
+    assert database.update_card_notes(card["id"], "Before the backup")
+    assert database.save_progress(dataset_id, 4)
+    database.flush_writes()
+    backup_path = str(tmp_path / "snapshot.db")
+
+    # Small steps, so the copy takes several of them
+    result = backup.backup_database(backup_path, step_pages=2, step_sleep_ms=0)
+
+    assert result["path"] == backup_path and result["steps"] > 1
+    assert result["shards"] == (1 if shards else 0)
+    assert os.path.isdir(backup.shard_backup_dir(backup_path)) == shards
+    # Only the finished backup is left behind
+    assert sorted(os.listdir(tmp_path)) == sorted(["snapshot.db"] + (["snapshot.db.shards"] if shards else []))
+
+    # Everything changes after the backup...
+    assert database.update_card_notes(card["id"], "After the backup")
+    assert database.save_progress(dataset_id, 20)
+    later_id, _ = database.import_dataset(f"{dataset_name}-later", make_cards(5))
+    database.flush_writes()
+    card_version = database.get_card_by_position(dataset_id, 4)[0]["version"]
+    versions_before_restore = (catalog_version(), card_version)
+
+    backup.restore_database(backup_path)
+
+    # ...and is back as it was when the backup was taken
+    restored, _ = database.get_card_by_position(dataset_id, 4)
+    assert restored["notes"] == "Before the backup"
+    assert database.get_progress(dataset_id) == 4
+    assert database.get_cards_window(dataset_id, 0, 100)[1] == 30
+    assert database.get_dataset_by_id(later_id) is None
+    if shards:
+        assert not os.path.exists(database.shard_path(later_id))
+    # Versions only move forward, so nothing cached before the restore is reused
+    assert catalog_version() > versions_before_restore[0]
+    assert restored["version"] > versions_before_restore[1]
+    # Neither is an ID of the removed dataset handed out again
+    assert database.import_dataset(f"{dataset_name}-new", make_cards(1))[0] > later_id
+
+
+def test_restore_refuses_a_file_that_is_no_backup(tmp_path):
+    not_a_backup = tmp_path / "notes.txt"
+    not_a_backup.write_text("Just some text, not a database.")
+    with pytest.raises(ValueError):
+        backup.restore_database(str(not_a_backup))
+    with pytest.raises(ValueError):
+        backup.restore_database(str(tmp_path / "missing.db"))
@@ -0,0 +1,107 @@
+import pytest
+import app as flashcard_app
+import cache
+import database
+
+
+@pytest.fixture
+def client():
+    return flashcard_app.app.test_client()
+
+
+@pytest.fixture
+def fragments(monkeypatch):
+    """A fresh fragment cache, so entries of other tests do not count."""
+    fragment_cache = cache.LRUCache("card_fragments", 100, 1024 * 1024)
+    monkeypatch.setattr(flashcard_app, "card_fragments", fragment_cache)
+    return fragment_cache
+
+
+def first_card(dataset_id):
+    card, _ = database.get_card_by_position(dataset_id, 0)
+    return card
+
+
+def test_card_text_cannot_break_the_fragment(client, fragments, dataset_name, make_cards):
+    cards = make_cards(1)
+    cards[0]["question"] = "Q \x00choices\x00 x"
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+
+    response = client.get(f"/learn/{dataset_id}/0/learn")
+    assert response.status_code == 200
+    assert "\x00choices\x00" in response.get_data(as_text=True)
+
+
+def test_fragment_is_served_from_the_cache(fragments, dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(1))
+    card = first_card(dataset_id)
+
+    with flashcard_app.app.test_request_context():
+        rendered = flashcard_app.card_fragment(card, "learn")
+        assert flashcard_app.card_fragment(card, "learn") is rendered
+        # Each mode has a fragment of its own
+        assert flashcard_app.card_fragment(card, "review") is not rendered
+    assert len(fragments._entries) == 2
+
+
+def test_note_edit_renders_a_new_fragment(client, fragments, dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(1))
+    card = first_card(dataset_id)
+    assert "Fresh note" not in client.get(f"/learn/{dataset_id}/0/learn").get_data(as_text=True)
+
+    assert database.update_card_notes(card["id"], "Fresh note")
+    database.flush_writes()
+
+    assert first_card(dataset_id)["version"] > card["version"]
+    assert "Fresh note" in client.get(f"/learn/{dataset_id}/0/learn").get_data(as_text=True)
+
+
+def test_lru_cache_evicts_beyond_the_entry_limit():
+    lru = cache.LRUCache("test_entries", 2, 1000)
+    lru.put("a", 1, 10)
+    lru.put("b", 2, 10)
+    assert lru.get("a") == 1  # "b" is now the least recently used
+    lru.put("c", 3, 10)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+
+
+def test_lru_cache_evicts_beyond_the_byte_limit():
+    lru = cache.LRUCache("test_bytes", 10, 100)
+    lru.put("a", 1, 60)
+    lru.put("b", 2, 30)
+    lru.put("c", 3, 30)
+
+    assert lru.get("a") is None
+    assert lru.get("b") == 2 and lru.get("c") == 3
+    assert lru._bytes == 60
+    # A value larger than the whole cache is not cached at all
+    lru.put("d", 4, 101)
+    assert lru.get("d") is None
+    assert lru.get("b") == 2
+
+
+def test_lru_cache_replaces_an_entry_under_the_same_key():
+    lru = cache.LRUCache("test_replace", 10, 100)
+    lru.put("a", 1, 40)
+    lru.put("a", 2, 50)
+    assert lru.get("a") == 2
+    assert lru._bytes == 50
+
+
+def test_revalidated_card_page_writes_no_progress(client, dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(10))
+    first = client.get(f"/learn/{dataset_id}/3/learn")
+    database.flush_writes()
+    assert database.get_progress(dataset_id) == 3
+    # The same page always carries the same body: the choices are shuffled by learn.js
+    assert client.get(f"/learn/{dataset_id}/3/learn").get_data() == first.get_data()
+
+    assert database.save_progress(dataset_id, 7)
+    response = client.get(f"/learn/{dataset_id}/3/learn", headers={"If-None-Match": first.headers["ETag"]})
+    database.flush_writes()
+
+    assert response.status_code == 304
+    assert database.get_progress(dataset_id) == 7
@@ -0,0 +1,102 @@
+import pytest
+import app as flashcard_app
+import database
+
+
+@pytest.fixture(params=[False, True], ids=["main", "shard"])
+def deck(request, monkeypatch, dataset_name, make_cards):
+    """A 40-card dataset (4 marked for review) and its cards."""
+    monkeypatch.setattr(database, "DATASET_SHARDS", request.param)
+    cards = make_cards(40)
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+    stored, _ = database.get_cards_window(dataset_id, 0, 100)
+    return dataset_id, cards, stored
+
+
+def listed_counts(dataset_id):
+    """The counts shown on the index page, read from the datasets' counter columns."""
+    row = next(row for row in database.get_datasets() if row["id"] == dataset_id)
+    return row["card_count"], row["review_count"]
+
+
+def actual_counts(dataset_id):
+    """The counts the counters replace, from the cards themselves."""
+    cards = list(database.iter_dataset_cards(dataset_id))
+    return len(cards), sum(1 for card in cards if card["mark_for_review"])
+
+
+def dataset_name(dataset_id):
+    return database.get_dataset_by_id(dataset_id)["name"]
+
+
+def assert_counts(dataset_id, expected):
+    database.flush_writes()
+    assert listed_counts(dataset_id) == actual_counts(dataset_id) == expected
+
+
+def test_import_sets_the_counters(deck):
+    dataset_id, _, _ = deck
+    assert_counts(dataset_id, (40, 4))
+
+
+def test_review_toggles_move_the_review_count(deck):
+    dataset_id, _, stored = deck
+    assert database.toggle_card_review_status(stored[1]["id"]) is True
+    assert database.toggle_card_review_status(stored[2]["id"]) is True
+    assert database.toggle_card_review_status(stored[0]["id"]) is False
+    assert_counts(dataset_id, (40, 5))
+    # Note edits leave the counts alone
+    assert database.update_card_notes(stored[3]["id"], "A note")
+    assert_counts(dataset_id, (40, 5))
+
+
+def test_batch_updates_move_the_review_count(deck):
+    dataset_id, _, stored = deck
+    missing = database.apply_card_updates(
+        note_updates=[(stored[5]["id"], "Batched note")],
+        review_updates=[
+            (stored[5]["id"], True),
+            (stored[6]["id"], True),
+            # Already marked: setting it again must not count twice
+            (stored[10]["id"], True),
+            (stored[20]["id"], False),
+        ],
+    )
+    assert missing == []
+    assert_counts(dataset_id, (40, 5))
+
+    # Replaying the same batch changes nothing
+    database.apply_card_updates(review_updates=[(stored[5]["id"], True), (stored[20]["id"], False)])
+    assert_counts(dataset_id, (40, 5))
+
+
+def test_added_and_merged_cards_move_the_card_count(deck, make_cards):
+    dataset_id, cards, _ = deck
+    assert database.add_card(dataset_id, "Added", "A", "A", "B", "C", "D")
+    assert_counts(dataset_id, (41, 4))
+
+    # Keep cards 10-29 (2 of them marked) and add 3 new ones
+    updated = cards[10:30] + make_cards(3, prefix="New")
+    counts = database.merge_dataset(dataset_id, updated)
+    assert (counts["inserted"], counts["deleted"]) == (3, 21)
+    assert_counts(dataset_id, (23, 3))
+
+
+def test_delete_leaves_other_datasets_alone(deck, dataset_name, make_cards):
+    dataset_id, _, _ = deck
+    other_id, _ = database.import_dataset(f"{dataset_name}-other", make_cards(12))
+
+    assert database.delete_dataset(dataset_id)
+
+    database.flush_writes()
+    assert all(row["id"] != dataset_id for row in database.get_datasets())
+    assert_counts(other_id, (12, 2))
+
+
+def test_index_page_shows_the_counters(deck):
+    dataset_id, _, stored = deck
+    database.toggle_card_review_status(stored[7]["id"])
+    database.flush_writes()
+    page = flashcard_app.app.test_client().get("/").get_data(as_text=True)
+    assert f'<option value="{dataset_id}">{dataset_name(dataset_id)} (40)</option>' in page
+    assert "&middot; 5 marked for review" in page
@@ -0,0 +1,90 @@
+import time
+from array import array
+import pytest
+import app as flashcard_app
+import database
+
+
+@pytest.fixture
+def pools(monkeypatch, dataset_name, make_cards):
+    """Two datasets of 40 and 15 cards, the second one in a shard, with their card IDs."""
+    first_id, _ = database.import_dataset(f"{dataset_name}-a", make_cards(40, prefix="First"))
+    monkeypatch.setattr(database, "DATASET_SHARDS", True)
+    second_id, _ = database.import_dataset(f"{dataset_name}-b", make_cards(15, prefix="Second"))
+    card_ids = set()
+    for dataset_id in (first_id, second_id):
+        cards, _ = database.get_cards_window(dataset_id, 0, 100)
+        card_ids.update(card["id"] for card in cards)
+    return [first_id, second_id], card_ids
+
+
+def stored_card_ids(exam_id):
+    """Decodes an exam's whole card ID array, the way it was written."""
+    conn = database.get_db_connection()
+    blob = conn.execute("SELECT card_ids FROM exam_sessions WHERE id = ?", (exam_id,)).fetchone()[0]
+    return array(database.EXAM_CARD_ID_TYPECODE, blob).tolist()
+
+
+def test_cards_are_sampled_without_replacement(pools):
+    dataset_ids, pool_ids = pools
+    exam_id, card_count = database.create_exam_session(dataset_ids, 30, int(time.time()))
+
+    card_ids = stored_card_ids(exam_id)
+    assert card_count == len(card_ids) == 30
+    assert len(set(card_ids)) == 30
+    assert set(card_ids) <= pool_ids
+
+
+def test_asking_for_more_cards_than_exist_takes_them_all(pools):
+    dataset_ids, pool_ids = pools
+    exam_id, card_count = database.create_exam_session(dataset_ids, 500, int(time.time()))
+
+    card_ids = stored_card_ids(exam_id)
+    assert card_count == len(card_ids) == len(pool_ids)
+    assert set(card_ids) == pool_ids
+
+
+def test_no_exam_without_cards():
+    assert database.create_exam_session([999999], 10, int(time.time())) == (None, 0)
+
+
+def test_every_exam_position_reads_its_own_card(pools):
+    dataset_ids, _ = pools
+    exam_id, card_count = database.create_exam_session(dataset_ids, 25, int(time.time()))
+    card_ids = stored_card_ids(exam_id)
+
+    for index, card_id in enumerate(card_ids):
+        card, total = database.get_exam_card(exam_id, index)
+        assert (card["id"], total) == (card_id, card_count)
+    # Windows read the same slices of the array, up to its end
+    cards, _ = database.get_exam_cards(exam_id, 7, 5)
+    assert [card["id"] for card in cards] == card_ids[7:12]
+    cards, _ = database.get_exam_cards(exam_id, card_count - 2, 5)
+    assert [card["id"] for card in cards] == card_ids[-2:]
+    assert database.get_exam_card(exam_id, card_count) == (None, card_count)
+
+
+def test_exam_page_shows_the_card_at_its_index(pools):
+    dataset_ids, _ = pools
+    exam_id, card_count = database.create_exam_session(dataset_ids, 20, int(time.time()))
+    client = flashcard_app.app.test_client()
+
+    for index in (0, 1, card_count // 2, card_count - 1):
+        card, _ = database.get_exam_card(exam_id, index)
+        page = client.get(f"/exam/{exam_id}/{index}").get_data(as_text=True)
+        assert f'<span id="card-question">{card["question"]}</span>' in page
+    assert client.get(f"/exam/{exam_id}/{card_count}").status_code == 302
+
+
+def test_deleted_card_leaves_a_gap(pools, dataset_name, make_cards):
+    dataset_ids, _ = pools
+    exam_id, card_count = database.create_exam_session(dataset_ids, 100, int(time.time()))
+    card_ids = stored_card_ids(exam_id)
+    # Every card of the sharded dataset goes with it
+    database.delete_dataset(dataset_ids[1])
+
+    cards, total = database.get_exam_cards(exam_id, 0, card_count)
+    assert total == card_count
+    assert [card["id"] if card else None for card in cards] == [
+        card_id if card_id >> database.SHARD_ID_BITS == 0 else None for card_id in card_ids
+    ]
@@ -0,0 +1,151 @@
+import time
+import sqlite3
+import threading
+import pytest
+import database
+
+# Another worker process waits this long for the write lock before failing
+OTHER_WORKER_BUSY_TIMEOUT = 1.0
+
+
+def slow_rows(cards, pause_every=50, pause=0.005):
+    """Yields cards like a large upload would, taking a while between batches."""
+    for i, card in enumerate(cards):
+        if i % pause_every == 0:
+            time.sleep(pause)
+        yield card
+
+
+def test_import_leaves_study_writes_unblocked(dataset_name, make_cards):
+    study_id, _ = database.import_dataset(f"{dataset_name}-study", make_cards(20))
+    # Long enough that holding the write lock for all of it would time out the other worker
+    cards = make_cards(20000)
+    result = {"inserted": 0}
+
+    def report(count):
+        result["inserted"] = count
+
+    def run_import():
+        result["imported"] = database.import_dataset(dataset_name, slow_rows(cards), batch_size=200, on_batch=report)
+
+    importer = threading.Thread(target=run_import)
+    # Plays the writer of another gunicorn worker, with a shorter busy timeout
+    other_worker = sqlite3.connect(database.DATABASE_PATH, timeout=OTHER_WORKER_BUSY_TIMEOUT, isolation_level=None)
+
+    importer.start()
+    writes_during_import = 0
+    slowest_write = 0.0
+    try:
+        while importer.is_alive():
+            started = time.perf_counter()
+            assert database.save_progress(study_id, writes_during_import % 20)
+            other_worker.execute("BEGIN IMMEDIATE")
+            other_worker.execute("UPDATE progress SET card_index = card_index WHERE dataset_id = ?", (study_id,))
+            other_worker.execute("COMMIT")
+            slowest_write = max(slowest_write, time.perf_counter() - started)
+            # The dataset stays hidden until all of its cards are in
+            names = [row["name"] for row in database.get_datasets()]
+            assert dataset_name not in names or result["inserted"] == len(cards)
+            writes_during_import += 1
+    finally:
+        importer.join()
+        other_worker.close()
+
+    dataset_id, card_count = result["imported"]
+    assert card_count == len(cards)
+    assert writes_during_import > 10
+    assert slowest_write < OTHER_WORKER_BUSY_TIMEOUT
+    listed = {row["name"]: row for row in database.get_datasets()}
+    assert listed[dataset_name]["card_count"] == len(cards)
+    assert database.get_cards_window(dataset_id, len(cards) - 1, 1)[0][0]["question"] == cards[-1]["question"]
+
+
+def test_failed_import_keeps_nothing(dataset_name, make_cards):
+    def broken_rows():
+        yield from make_cards(250)
+        raise ValueError("Bad row")
+
+    with pytest.raises(ValueError):
+        database.import_dataset(dataset_name, broken_rows(), batch_size=100)
+
+    assert database.get_dataset_id_by_name(dataset_name) is None
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM datasets WHERE name = ?", (dataset_name,)).fetchone()[0] == 0
+    # The name is free again
+    assert database.import_dataset(dataset_name, make_cards(5))[1] == 5
+
+
+def leave_unfinished_import(dataset_name, make_cards):
+    """Writes what a process killed mid-import leaves behind; returns the pending dataset's ID."""
+    dataset_id = database._write_queue.call(database._add_pending_dataset, dataset_name)
+    batch = [
+        (dataset_id, i, card["question"], card["correct_answer"], card["choice1"], card["choice2"],
+         card["choice3"], card["choice4"], None, "", 0, *database._card_hashes(card))
+        for i, card in enumerate(make_cards(30))
+    ]
+    database._write_queue.call(database._insert_card_batch, batch)
+    assert database.get_dataset_by_id(dataset_id) is None
+    assert database.get_cards_window(dataset_id, 0, 10) == ([], 0)
+    return dataset_id
+
+
+def assert_discarded(dataset_id):
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM cards WHERE dataset_id = ?", (dataset_id,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM datasets WHERE id = ?", (dataset_id,)).fetchone()[0] == 0
+
+
+def test_discard_pending_datasets_removes_unfinished_imports(dataset_name, make_cards):
+    dataset_id = leave_unfinished_import(dataset_name, make_cards)
+
+    database.discard_pending_datasets()
+
+    assert_discarded(dataset_id)
+
+
+def test_startup_removes_unfinished_imports(dataset_name, make_cards):
+    dataset_id = leave_unfinished_import(dataset_name, make_cards)
+
+    # What the next process to start runs, before any import of its own
+    assert database.init_db()
+
+    assert_discarded(dataset_id)
+
+
+def test_merge_applies_changes(dataset_name, make_cards):
+    cards = make_cards(50)
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+    database.save_progress(dataset_id, 10)
+    database.flush_writes()
+
+    # Drop the first card, change one answer and add a new card at the end
+    updated = [dict(card) for card in cards[1:]]
+    updated[5]["correct_answer"] = "Changed"
+    updated.append(make_cards(1, prefix="New")[0])
+    counts = database.merge_dataset(dataset_id, updated)
+
+    assert counts["deleted"] == 1
+    assert counts["updated"] == 1
+    assert counts["inserted"] == 1
+    deck, total = database.get_cards_window(dataset_id, 0, 100)
+    assert total == 50
+    assert [card["question"] for card in deck] == [card["question"] for card in updated]
+    # Progress followed the card it pointed at
+    assert database.get_progress(dataset_id) == 9
+
+
+def test_merge_refuses_cards_added_meanwhile(dataset_name, make_cards):
+    cards = make_cards(20)
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+
+    def rows_with_concurrent_add():
+        # Another request adds a card after the merge read the stored ones
+        database.add_card(dataset_id, "Added", "A", "A", "B", "C", "D")
+        yield from cards[:10]
+
+    with pytest.raises(database.MergeConflict):
+        database.merge_dataset(dataset_id, rows_with_concurrent_add())
+
+    deck, total = database.get_cards_window(dataset_id, 0, 100)
+    assert total == 21
+    assert deck[-1]["question"] == "Added"
@@ -0,0 +1,53 @@
+import os
+import metrics
+
+COUNTER_LINE = 'flashcard_import_rows_total{status="test-workers"}'
+
+
+def sample_lines(prefix):
+    return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+
+def run_other_worker():
+    """Forks a process that records metrics and writes its file like a gunicorn worker; returns its pid."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            metrics.IMPORT_ROWS.inc(5, status="test-workers")
+            metrics.IMPORT_ROWS_PER_SECOND.set(123)
+            metrics.write_process_file()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+def test_render_adds_up_all_workers():
+    metrics.clear_process_files()
+    metrics.IMPORT_ROWS.inc(2, status="test-workers")
+    other_pid = run_other_worker()
+
+    # The forked worker started from zero, so its 5 rows are not added to ours twice
+    assert sample_lines(COUNTER_LINE) == [f"{COUNTER_LINE} 7"]
+    assert f'flashcard_import_rows_per_second{{pid="{other_pid}"}} 123' in sample_lines("flashcard_import_rows_per_second")
+
+    # Once the worker has exited, its counts stay but its gauges go
+    metrics.mark_process_dead(other_pid)
+    assert sample_lines(COUNTER_LINE) == [f"{COUNTER_LINE} 7"]
+    assert not any(f'pid="{other_pid}"' in line for line in sample_lines("flashcard_import_rows_per_second"))
+    metrics.clear_process_files()
+
+
+def test_exited_workers_are_folded_into_one_file():
+    metrics.clear_process_files()
+    metrics.IMPORT_ROWS.inc(2, status="test-workers")
+    own_rows = metrics.IMPORT_ROWS._values[("test-workers",)]
+
+    for _ in range(3):
+        metrics.mark_process_dead(run_other_worker())
+
+    # Their counts are added up in one file and their own files are gone
+    assert sample_lines(COUNTER_LINE) == [f"{COUNTER_LINE} {own_rows + 15}"]
+    assert [name for name in os.listdir(metrics.METRICS_DIR) if name.endswith(".json")] == [metrics.DEAD_FILE_NAME]
+    assert sample_lines("flashcard_import_rows_per_second") == []
+    metrics.clear_process_files()
@@ -0,0 +1,63 @@
+import re
+import time
+import pytest
+import database
+
+REVIEW_INDEX = "idx_cards_review_position"
+POSITION_INDEX = "idx_cards_dataset_position"
+DUE_INDEX = "idx_cards_dataset_due"
+# A full pass over a cards table, whichever schema holds it
+FULL_SCAN = re.compile(r"^SCAN (\w+\.)?cards\b")
+
+
+@pytest.fixture(params=[False, True], ids=["main", "shard"])
+def deck(request, monkeypatch, dataset_name, make_cards):
+    """Imports a deck into the main database or, for the second run, into a shard of its own."""
+    monkeypatch.setattr(database, "DATASET_SHARDS", request.param)
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(500))
+    return dataset_id
+
+
+def card_query_plans(operation):
+    """Runs operation and returns the query plan details of each statement it ran against a cards table."""
+    conn = database.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        operation()
+    finally:
+        conn.set_trace_callback(None)
+    plans = []
+    for sql in statements:
+        if re.search(r"FROM \w+\.cards\b", sql):
+            plans.append([row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")])
+    assert plans, "No cards query was run"
+    return plans
+
+
+def assert_uses_index(plans, index_name):
+    for details in plans:
+        assert any(index_name in detail for detail in details), details
+        assert not any(FULL_SCAN.match(detail) for detail in details), details
+
+
+def test_learn_window_seeks_position_index(deck):
+    assert_uses_index(card_query_plans(lambda: database.get_cards_window(deck, 250, 20)), POSITION_INDEX)
+
+
+def test_card_by_position_seeks_position_index(deck):
+    assert_uses_index(card_query_plans(lambda: database.get_card_by_position(deck, 400)), POSITION_INDEX)
+
+
+@pytest.mark.parametrize("before", [False, True], ids=["after", "before"])
+def test_review_window_seeks_review_index(deck, before):
+    plans = card_query_plans(lambda: database.get_review_cards(deck, 250, 20, before=before))
+    assert_uses_index(plans, REVIEW_INDEX)
+
+
+def test_review_card_seeks_review_index(deck):
+    assert_uses_index(card_query_plans(lambda: database.get_review_card(deck, 250)), REVIEW_INDEX)
+
+
+def test_due_card_seeks_due_index(deck):
+    assert_uses_index(card_query_plans(lambda: database.get_next_due_card(deck, int(time.time()))), DUE_INDEX)
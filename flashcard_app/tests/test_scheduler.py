@@ -0,0 +1,71 @@
+import pytest
+import database
+import scheduler
+
+NOW = 1_700_000_000
+DAY = scheduler.SECONDS_PER_DAY
+
+
+def test_first_passing_grades_follow_sm2_steps():
+    first = scheduler.schedule_review(scheduler.DEFAULT_EASE, 0, 0, 4, NOW)
+    assert (first["interval_days"], first["repetitions"], first["due_at"]) == (1, 1, NOW + DAY)
+    second = scheduler.schedule_review(first["ease"], first["interval_days"], first["repetitions"], 4, NOW)
+    assert (second["interval_days"], second["repetitions"]) == (6, 2)
+    third = scheduler.schedule_review(second["ease"], second["interval_days"], second["repetitions"], 4, NOW)
+    assert third["interval_days"] == round(6 * second["ease"])
+    assert third["repetitions"] == 3
+
+
+@pytest.mark.parametrize("quality, ease_change", [(5, 0.1), (4, 0.0), (3, -0.14)])
+def test_ease_changes_with_the_grade(quality, ease_change):
+    schedule = scheduler.schedule_review(2.5, 6, 2, quality, NOW)
+    assert schedule["ease"] == pytest.approx(2.5 + ease_change)
+
+
+def test_failed_grade_restarts_the_sequence():
+    schedule = scheduler.schedule_review(2.5, 40, 5, 2, NOW)
+    assert (schedule["interval_days"], schedule["repetitions"], schedule["due_at"]) == (1, 0, NOW + DAY)
+
+
+def test_ease_never_drops_below_the_floor():
+    ease = scheduler.DEFAULT_EASE
+    for _ in range(20):
+        ease = scheduler.schedule_review(ease, 1, 0, 0, NOW)["ease"]
+    assert ease == scheduler.MIN_EASE
+
+
+def test_interval_is_capped():
+    schedule = scheduler.schedule_review(2.5, scheduler.MAX_INTERVAL_DAYS, 10, 5, NOW)
+    assert schedule["interval_days"] == scheduler.MAX_INTERVAL_DAYS
+    assert schedule["due_at"] == NOW + scheduler.MAX_INTERVAL_DAYS * DAY
+
+
+@pytest.mark.parametrize("quality", [-1, 6])
+def test_quality_out_of_range_is_refused(quality):
+    with pytest.raises(ValueError):
+        scheduler.schedule_review(2.5, 0, 0, quality, NOW)
+
+
+def test_due_card_is_the_one_due_earliest(dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(4))
+    cards, _ = database.get_cards_window(dataset_id, 0, 4)
+    card_ids = [card["id"] for card in cards]
+
+    # Never studied cards are due now, in deck order
+    card, due_count = database.get_next_due_card(dataset_id, NOW)
+    assert (card["id"], due_count) == (card_ids[0], 4)
+
+    # Recalled cards move to the future; a card forgotten long ago is due before both
+    database.grade_card(card_ids[0], 5, NOW)
+    database.grade_card(card_ids[1], 5, NOW)
+    database.grade_card(card_ids[2], 0, NOW - 10 * DAY)
+    database.grade_card(card_ids[3], 0, NOW - 5 * DAY)
+    card, due_count = database.get_next_due_card(dataset_id, NOW)
+    assert (card["id"], due_count) == (card_ids[2], 2)
+
+    # Once the recalled cards are due, the earliest due card still comes first
+    card, due_count = database.get_next_due_card(dataset_id, NOW + 2 * DAY)
+    assert (card["id"], due_count) == (card_ids[2], 4)
+    database.grade_card(card_ids[2], 4, NOW)
+    database.grade_card(card_ids[3], 4, NOW)
+    assert database.get_next_due_card(dataset_id, NOW) == (None, 0)
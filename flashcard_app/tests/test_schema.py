@@ -0,0 +1,45 @@
+import os
+import importlib.util
+import pytest
+import database
+
+
+@pytest.fixture
+def failing_migration(monkeypatch, tmp_path):
+    """A fresh database whose only migration fails while moving a file, like _migrate_progress_file."""
+
+    def migration(cursor):
+        """Move a file that is not there."""
+        cursor.execute("CREATE TABLE moved (id INTEGER)")
+        os.replace(str(tmp_path / "missing.json"), str(tmp_path / "missing.json.migrated"))
+
+    monkeypatch.setattr(database, "MIGRATIONS", [migration])
+    monkeypatch.setattr(database, "SCHEMA_VERSION", 1)
+    return database._open_connection(str(tmp_path / "fresh.db"))
+
+
+def test_a_migration_failing_on_a_file_is_rolled_back(failing_migration, capsys):
+    conn = failing_migration
+
+    assert database._apply_migrations(conn) is False
+
+    assert "Database initialization error" in capsys.readouterr().out
+    assert database._get_schema_version(conn.cursor()) == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'moved'").fetchone()[0] == 0
+    conn.close()
+
+
+def test_server_does_not_start_without_the_schema(monkeypatch):
+    spec = importlib.util.spec_from_file_location(
+        "gunicorn_conf", os.path.join(os.path.dirname(database.__file__), "gunicorn.conf.py")
+    )
+    gunicorn_conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gunicorn_conf)
+    monkeypatch.setattr(database, "_schema_ready", False)
+    monkeypatch.setattr(database, "init_db", lambda: False)
+
+    with pytest.raises(RuntimeError):
+        gunicorn_conf.on_starting(server=None)
+    # Retried (and now found up to date) by the next caller
+    monkeypatch.setattr(database, "init_db", lambda: True)
+    assert database.ensure_schema()
@@ -0,0 +1,78 @@
+import uuid
+import pytest
+import app as flashcard_app
+import database
+
+
+def unique_word():
+    """A word no other card in the shared test database contains."""
+    return f"zq{uuid.uuid4().hex[:10]}"
+
+
+def indexed_rowids(word):
+    """Card IDs the main search index holds for word, read from the index itself."""
+    conn = database.get_db_connection()
+    rows = conn.execute("SELECT rowid FROM cards_fts WHERE cards_fts MATCH ?", (f'"{word}"',)).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def test_search_finds_an_imported_card(dataset_name, make_cards):
+    word = unique_word()
+    cards = make_cards(5)
+    cards[3]["question"] = f"What does {word} mean?"
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+
+    results, has_more = database.search_cards(word)
+    assert not has_more
+    assert [(row["dataset_id"], row["position"]) for row in results] == [(dataset_id, 3)]
+    assert results[0]["dataset_name"] == dataset_name
+    # The last word is matched as a prefix, and one dataset can be searched on its own
+    assert len(database.search_cards(word[:8], dataset_id=dataset_id)[0]) == 1
+    assert database.search_cards(word, dataset_id=dataset_id + 1000)[0] == []
+
+
+def test_index_follows_note_edits(dataset_name, make_cards):
+    old_word, new_word = unique_word(), unique_word()
+    cards = make_cards(3)
+    cards[1]["notes"] = f"Remember {old_word}"
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+    card, _ = database.get_card_by_position(dataset_id, 1)
+    assert indexed_rowids(old_word) == [card["id"]]
+
+    assert database.update_card_notes(card["id"], f"Remember {new_word}")
+    database.flush_writes()
+
+    assert indexed_rowids(old_word) == []
+    assert indexed_rowids(new_word) == [card["id"]]
+    assert [row["id"] for row in database.search_cards(new_word)[0]] == [card["id"]]
+
+
+def test_index_forgets_deleted_datasets(dataset_name, make_cards):
+    word = unique_word()
+    cards = make_cards(4)
+    for card in cards:
+        card["correct_answer"] = f"{word} {card['correct_answer']}"
+    dataset_id, _ = database.import_dataset(dataset_name, cards)
+    assert len(indexed_rowids(word)) == 4
+
+    assert database.delete_dataset(dataset_id)
+    database.flush_writes()
+
+    assert indexed_rowids(word) == []
+    assert database.search_cards(word) == ([], False)
+    conn = database.get_db_connection()
+    # The external-content index still matches the cards table as a whole. The
+    # check is written as an INSERT, so end the transaction it opens
+    try:
+        conn.execute("INSERT INTO cards_fts (cards_fts, rank) VALUES ('integrity-check', 1)")
+    finally:
+        conn.rollback()
+
+
+@pytest.mark.parametrize("query", ['"', '"unclosed', "AND", "OR NOT", "(", "NEAR(a b", "*", "^x", "question:", "a -b", "'"])
+def test_malformed_queries_do_not_fail(query):
+    results, _ = database.search_cards(query)
+    assert isinstance(results, list)
+
+    response = flashcard_app.app.test_client().get("/search", query_string={"q": query})
+    assert response.status_code == 200
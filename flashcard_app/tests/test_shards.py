@@ -0,0 +1,94 @@
+import os
+import pytest
+import database
+
+
+@pytest.fixture(autouse=True)
+def shards_on(monkeypatch):
+    """Keeps every dataset imported by these tests in a shard file of its own."""
+    monkeypatch.setattr(database, "DATASET_SHARDS", True)
+
+
+def dataset_counters(dataset_id):
+    conn = database.get_db_connection()
+    row = conn.execute(
+        "SELECT sharded, card_count, review_count FROM datasets WHERE id = ?", (dataset_id,)
+    ).fetchone()
+    return tuple(row)
+
+
+def attached_schemas():
+    conn = database.get_db_connection()
+    return {row["name"] for row in conn.execute("PRAGMA database_list")} - {"main", "temp"}
+
+
+def test_import_writes_a_shard(dataset_name, make_cards):
+    cards = make_cards(25)
+    dataset_id, card_count = database.import_dataset(dataset_name, cards)
+
+    assert card_count == 25
+    assert os.path.exists(database.shard_path(dataset_id))
+    # 3 of the 25 cards are marked for review
+    assert dataset_counters(dataset_id) == (1, 25, 3)
+    # No card rows end up in the main database
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM main.cards WHERE dataset_id = ?", (dataset_id,)).fetchone()[0] == 0
+    deck, total = database.get_cards_window(dataset_id, 0, 100)
+    assert total == 25
+    assert [card["question"] for card in deck] == [card["question"] for card in cards]
+
+
+def test_card_ids_encode_their_dataset(dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(5))
+    deck, _ = database.get_cards_window(dataset_id, 0, 5)
+
+    assert all(card["id"] >> database.SHARD_ID_BITS == dataset_id for card in deck)
+    # Writes by card ID alone find the card in its shard
+    assert database.update_card_notes(deck[2]["id"], "Shard note")
+    database.flush_writes()
+    card, _ = database.get_card_by_position(dataset_id, 2)
+    assert card["notes"] == "Shard note"
+    assert card["version"] > deck[2]["version"]
+    assert database.get_card_by_position(dataset_id, 1)[0]["notes"] == ""
+
+
+def test_counter_triggers_follow_shard_writes(dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(5))
+    deck, _ = database.get_cards_window(dataset_id, 0, 5)
+    assert dataset_counters(dataset_id) == (1, 5, 1)
+    version = database.get_dataset_by_id(dataset_id)["version"]
+
+    assert database.toggle_card_review_status(deck[1]["id"]) is True
+    assert database.toggle_card_review_status(deck[0]["id"]) is False
+    assert database.toggle_card_review_status(deck[2]["id"]) is True
+    assert dataset_counters(dataset_id) == (1, 5, 2)
+    assert database.add_card(dataset_id, "Added", "A", "A", "B", "C", "D")
+    assert dataset_counters(dataset_id) == (1, 6, 2)
+    assert database.get_dataset_by_id(dataset_id)["version"] > version
+
+
+def test_least_recently_used_shards_are_detached(monkeypatch, dataset_name, make_cards):
+    dataset_ids = [
+        database.import_dataset(f"{dataset_name}-{i}", make_cards(3))[0] for i in range(4)
+    ]
+    monkeypatch.setattr(database, "SHARD_CACHE_SIZE", 2)
+
+    for dataset_id in dataset_ids:
+        assert database.get_cards_window(dataset_id, 0, 3)[1] == 3
+        assert len(attached_schemas()) <= 2
+    assert attached_schemas() == {f"shard_{dataset_id}" for dataset_id in dataset_ids[-2:]}
+    # A detached shard is attached again when it is needed
+    assert database.get_cards_window(dataset_ids[0], 0, 3)[1] == 3
+    assert f"shard_{dataset_ids[0]}" in attached_schemas()
+
+
+def test_delete_removes_the_shard_file(dataset_name, make_cards):
+    dataset_id, _ = database.import_dataset(dataset_name, make_cards(5))
+    path = database.shard_path(dataset_id)
+    assert database.get_cards_window(dataset_id, 0, 5)[1] == 5
+
+    assert database.delete_dataset(dataset_id)
+
+    assert not os.path.exists(path)
+    assert database.get_dataset_by_id(dataset_id) is None
+    assert database.get_cards_window(dataset_id, 0, 5) == ([], 0)
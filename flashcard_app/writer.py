@@ -0,0 +1,228 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from concurrent.futures import Future
+import metrics
+
+# --- Configuration ---
+# Most operations committed together in one transaction
+WRITER_MAX_BATCH = int(os.environ.get("FLASHCARD_WRITER_MAX_BATCH", "500"))
+# How long the writer waits for more operations after the first one of a batch.
+# Operations queued while the previous batch commits are picked up regardless.
+WRITER_MAX_DELAY_MS = float(os.environ.get("FLASHCARD_WRITER_MAX_DELAY_MS", "2"))
+# Operations waiting to be written before submit() starts pushing back
+WRITER_QUEUE_SIZE = int(os.environ.get("FLASHCARD_WRITER_QUEUE_SIZE", "10000"))
+# How long submit() waits for room in a full queue before giving up
+WRITER_SUBMIT_TIMEOUT_MS = float(os.environ.get("FLASHCARD_WRITER_SUBMIT_TIMEOUT_MS", "500"))
+# Seconds to wait at interpreter exit for queued operations to be written
+WRITER_SHUTDOWN_TIMEOUT = 5
+
+_queues = []
+
+
+class WriterBusy(Exception):
+    """Raised by WriteQueue.submit() when the queue stays full for the whole submit timeout."""
+
+
+class TransactionFull(Exception):
+    """
+    Raised by an operation that cannot join the transaction in progress, e.g.
+    because its connection cannot attach another database until it ends. The
+    writer commits the operations before it and runs it again in a new transaction.
+    """
+
+
+class _Operation:
+    """A queued write: operation(cursor, *args), resolved through future."""
+
+    __slots__ = ("operation", "args", "future")
+
+    def __init__(self, operation, args):
+        self.operation = operation
+        self.args = args
+        self.future = Future()
+
+
+class WriteQueue:
+    """
+    Single background thread that runs queued write operations with group commit.
+
+    Callers submit() a function and its arguments and get a Future. The writer
+    blocks for the first operation, collects more for up to max_delay_ms (or
+    until it has max_batch of them) and runs them all in one BEGIN IMMEDIATE
+    transaction, so a burst of writes costs one lock acquisition and one fsync.
+    Each operation is called as operation(cursor, *args) inside its own
+    savepoint: one that raises is rolled back alone and its future gets the
+    exception, while the others are committed. Futures are resolved after the
+    commit, so a caller that waits on one reads its own write afterwards.
+
+    connect is called on the writer thread to open its database connection. The
+    thread is started on the first submit(), so every (forked) worker process
+    runs its own writer. prepare, if given, is called with the connection before
+    each transaction begins.
+    """
+
+    def __init__(self, name, connect, max_batch=WRITER_MAX_BATCH, max_delay_ms=WRITER_MAX_DELAY_MS,
+                 queue_size=WRITER_QUEUE_SIZE, submit_timeout_ms=WRITER_SUBMIT_TIMEOUT_MS, prepare=None):
+        self.name = name
+        self.connect = connect
+        self.prepare = prepare
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.submit_timeout = submit_timeout_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        _queues.append(self)
+
+    def submit(self, operation, *args):
+        """
+        Queues operation(cursor, *args) and returns a Future of its result.
+        Waits up to the submit timeout while the queue is full, then raises WriterBusy.
+        """
+        self._ensure_started()
+        item = _Operation(operation, args)
+        try:
+            self._queue.put(item, timeout=self.submit_timeout)
+        except queue.Full:
+            metrics.WRITER_ITEMS.inc(writer=self.name, status="rejected")
+            raise WriterBusy(f"The {self.name} writer has {self._queue.maxsize} operations waiting.")
+        return item.future
+
+    def call(self, operation, *args):
+        """Runs operation(cursor, *args) on the writer and returns its result once committed."""
+        return self.submit(operation, *args).result()
+
+    def flush(self, timeout=None):
+        """Waits until every operation queued so far has been written (or failed)."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        return done.wait(remaining)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        conn = None
+        while True:
+            batch, markers = self._next_batch()
+            if batch:
+                try:
+                    if conn is None:
+                        conn = self.connect()
+                    self._write(conn, batch)
+                except Exception as e:
+                    print(f"Unexpected error in the {self.name} writer: {e}")
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+            # Flush markers are set once everything queued before them is written
+            for marker in markers:
+                marker.set()
+
+    def _next_batch(self):
+        """Blocks for one operation, then gathers more until the batch is full or the delay expired."""
+        batch, markers = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.max_delay
+        while True:
+            if isinstance(item, threading.Event):
+                markers.append(item)
+            else:
+                batch.append(item)
+            if len(batch) >= self.max_batch:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+        metrics.WRITER_QUEUE_DEPTH.set(self._queue.qsize(), writer=self.name)
+        return batch, markers
+
+    def _write(self, conn, batch):
+        """Runs a batch in one transaction (more if an operation asks for it), then resolves its futures."""
+        start = time.perf_counter()
+        # Skip operations cancelled by their caller before they ran
+        pending = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        outcomes = []
+        while pending:
+            pending = self._transaction(conn, pending, outcomes)
+
+        metrics.WRITER_BATCH_SECONDS.observe(time.perf_counter() - start, writer=self.name)
+        metrics.WRITER_BATCH_SIZE.observe(len(batch), writer=self.name)
+        for future, result, error in outcomes:
+            if error is None:
+                metrics.WRITER_ITEMS.inc(writer=self.name, status="written")
+                future.set_result(result)
+            else:
+                metrics.WRITER_ITEMS.inc(writer=self.name, status="failed")
+                future.set_exception(error)
+
+    def _transaction(self, conn, items, outcomes):
+        """
+        Runs operations in one transaction and appends their outcomes once it is
+        committed. Returns the operations left for a new transaction, starting
+        with one that raised TransactionFull.
+        """
+        if self.prepare is not None:
+            self.prepare(conn)
+        results = []
+        left = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for index, item in enumerate(items):
+                cursor.execute("SAVEPOINT write_operation")
+                try:
+                    result = item.operation(cursor, *item.args)
+                except TransactionFull as e:
+                    cursor.execute("ROLLBACK TO write_operation")
+                    cursor.execute("RELEASE write_operation")
+                    if index > 0:
+                        left = items[index:]
+                        break
+                    # Not even a transaction of its own has room for it
+                    results.append((item.future, None, e))
+                    continue
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_operation")
+                    results.append((item.future, None, e))
+                else:
+                    results.append((item.future, result, None))
+                cursor.execute("RELEASE write_operation")
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed (e.g. another process held the lock for longer
+            # than the busy timeout): nothing of this transaction was stored
+            print(f"Error writing a batch of {len(items)} operations in the {self.name} writer: {e}")
+            conn.rollback()
+            results = [(item.future, None, e) for item in items]
+            left = []
+        finally:
+            cursor.close()
+        outcomes.extend(results)
+        return left
+
+
+@atexit.register
+def _flush_on_exit():
+    # Best effort: write what is still queued when the process shuts down
+    for write_queue in _queues:
+        write_queue.flush(WRITER_SHUTDOWN_TIMEOUT)